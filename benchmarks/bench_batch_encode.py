@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of PreTrainedTokenizer.batch_encode: BERT WordPiece encoding throughput (sentences/s) of a single process
+against pools of N processes. Sentences are random sequences of 5 to 30 words of the tokenizer's vocab, so no dataset
+is needed; the bert-base-uncased vocab is downloaded unless a local vocab_file is given.
+
+Usage: python benchmarks/bench_batch_encode.py --num_sentences 1000000 --num_workers 1 2 4 8
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+from nlptoolkit.classification.models.BERT.tokenization_bert import BertTokenizer
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_sentences", type=int, default=1000000, help="No. of sentences")
+    parser.add_argument("--num_workers", type=int, nargs="+", default=[1, 2, 4, 8], help="No. of processes")
+    parser.add_argument("--chunk_size", type=int, default=1000, help="No. of sentences per chunk")
+    parser.add_argument("--tokens_length", type=int, default=128, help="Max tokens length")
+    parser.add_argument("--vocab_file", type=str, default="", help="BERT vocab file (default: bert-base-uncased)")
+    args = parser.parse_args()
+
+    if args.vocab_file:
+        tokenizer = BertTokenizer(args.vocab_file, do_lower_case=True)
+    else:
+        tokenizer = BertTokenizer.from_pretrained("bert-base-uncased", do_lower_case=True)
+    words = [w for w in tokenizer.vocab if w.isalpha()]
+    rng = np.random.RandomState(0)
+    lengths = rng.randint(5, 31, args.num_sentences)
+    sentences = [" ".join(ws) + "." for ws in np.split(rng.choice(words, lengths.sum()), np.cumsum(lengths)[:-1])]
+
+    print("sentences: %d, vocab words: %d" % (len(sentences), len(words)))
+    print("%8s %14s %12s %10s %10s" % ("workers", "sentences/s", "time (s)", "speedup", "same ids"))
+    reference = None
+    for num_workers in args.num_workers:
+        start = time.time()
+        input_ids, attention_mask = tokenizer.batch_encode(sentences, max_length=args.tokens_length, \
+                                                           add_special_tokens=True, pad=True, \
+                                                           num_workers=num_workers, chunk_size=args.chunk_size)
+        t = time.time() - start
+        if reference is None:
+            reference = (t, input_ids)
+        print("%8d %14.0f %12.1f %10.2f %10s" % (num_workers, len(sentences)/t, t, reference[0]/t, \
+                                                 np.array_equal(input_ids, reference[1])))
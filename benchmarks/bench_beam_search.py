@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of translation decoding throughput and model score: the per-sentence greedy loop of
+Transformer.forward(infer=True) (decode_cached of one sentence at a time) against batched greedy decoding and batched
+beam search (Transformer.beam_search) of --batch_size sentences at a time. No dataset or checkpoint is needed: the model
+is first trained for --train_steps steps on a synthetic task (the target is the reversed source sentence), and quality
+is reported as the exact-match rate of the best outputs with the reversed sources and their mean length-normalized log
+probability under the model.
+
+Usage: python benchmarks/bench_beam_search.py --num_sents 256 --batch_size 32 --beam_widths 1 4 --train_steps 600
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from nlptoolkit.translation.models.Transformer.Transformer import Transformer, create_masks
+
+SOS, EOS = 2, 3
+
+
+def decode(net, sents, batch_size, beam_width, length_penalty, max_steps, per_sentence_greedy=False):
+    """ best output of each sentence in batches of batch_size (sorted by length), with the time taken """
+    order = sorted(range(len(sents)), key=lambda i: len(sents[i]))
+    best = [None]*len(sents)
+    start = time.time()
+    for b in range(0, len(order), batch_size):
+        batch = order[b:(b + batch_size)]
+        max_len = max(len(sents[i]) for i in batch)
+        src = torch.LongTensor([sents[i] + [1]*(max_len - len(sents[i])) for i in batch])
+        src_mask = (src != 1).unsqueeze(-2)
+        e_out = net.encoder(src, src_mask)
+        trg = torch.full((len(batch), 1), SOS, dtype=torch.long)
+        if per_sentence_greedy:
+            out = net.decode_cached(e_out, trg, src_mask, EOS, max_steps=max_steps)[0].tolist()
+            best[batch[0]] = (out[:out.index(EOS)] if EOS in out else out, None)
+            continue
+        for i, n_best in zip(batch, net.beam_search(e_out, trg, src_mask, EOS, beam_width=beam_width, \
+                                                    length_penalty=length_penalty, max_steps=max_steps)):
+            best[i] = n_best[0]
+    return best, time.time() - start
+
+
+def train(net, steps, batch_size, vocab, rng):
+    """ trains net to output the reversed source sentence """
+    optimizer = optim.Adam(net.parameters(), lr=0.0005, betas=(0.9, 0.98), eps=1e-9)
+    criterion = nn.CrossEntropyLoss(ignore_index=1)
+    net.train()
+    for step in range(steps):
+        sents = [list(rng.randint(4, vocab, rng.randint(5, 21))) for _ in range(batch_size)]
+        max_len = max(len(sent) for sent in sents)
+        src = torch.LongTensor([sent + [1]*(max_len - len(sent)) for sent in sents])
+        trg = torch.LongTensor([[SOS] + sent[::-1] + [EOS] + [1]*(max_len - len(sent)) for sent in sents])
+        src_mask, trg_mask = create_masks(src, trg[:, :-1])
+        outputs = net(src, trg[:, :-1], src_mask, trg_mask)
+        loss = criterion(outputs.reshape(-1, outputs.size(-1)), trg[:, 1:].reshape(-1))
+        optimizer.zero_grad(); loss.backward(); optimizer.step()
+        if (step + 1) % 100 == 0:
+            print("step %d, loss %.4f" % (step + 1, loss.item()))
+    net.eval()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_sents", type=int, default=256, help="No. of source sentences")
+    parser.add_argument("--batch_size", type=int, default=32, help="No. of sentences decoded together")
+    parser.add_argument("--beam_widths", type=int, nargs="+", default=[1, 4], help="Beam widths")
+    parser.add_argument("--length_penalty", type=float, default=0.6, help="Beam search length penalty")
+    parser.add_argument("--max_steps", type=int, default=40, help="Max. output length")
+    parser.add_argument("--vocab", type=int, default=100, help="Source and target vocab size")
+    parser.add_argument("--d_model", type=int, default=128, help="Transformer model dimension")
+    parser.add_argument("--ff_dim", type=int, default=512, help="Transformer feed-forward layer dimension")
+    parser.add_argument("--num", type=int, default=2, help="Number of layers")
+    parser.add_argument("--n_heads", type=int, default=8, help="Number of attention heads")
+    parser.add_argument("--train_steps", type=int, default=600, help="No. of training steps (batch size 32)")
+    parser.add_argument("--num_threads", type=int, default=0, help="torch CPU threads (0: torch default)")
+    args = parser.parse_args()
+
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    torch.manual_seed(0)
+    net = Transformer(src_vocab=args.vocab, trg_vocab=args.vocab, d_model=args.d_model, ff_dim=args.ff_dim, \
+                      num=args.num, n_heads=args.n_heads, max_encoder_len=60, max_decoder_len=args.max_steps + 2)
+    rng = np.random.RandomState(0)
+    train(net, args.train_steps, 32, args.vocab, rng)
+    sents = [list(rng.randint(4, args.vocab, rng.randint(5, 21))) for _ in range(args.num_sents)]
+
+    rows = []
+    with torch.no_grad():
+        greedy, t = decode(net, sents, 1, 1, args.length_penalty, args.max_steps, per_sentence_greedy=True)
+        # scores of the greedy outputs: beam search of width 1 is greedy decoding
+        scored, _ = decode(net, sents, args.batch_size, 1, args.length_penalty, args.max_steps)
+        assert all(g[0] == s[0] for g, s in zip(greedy, scored))
+        rows.append(("greedy, per sentence", 1, t, scored))
+        for beam_width in args.beam_widths:
+            best, t = decode(net, sents, args.batch_size, beam_width, args.length_penalty, args.max_steps)
+            rows.append(("batched", beam_width, t, best))
+
+    print("sentences: %d, batch size %d, d_model %d, %d layers, vocab %d" % (len(sents), args.batch_size, \
+                                                                           args.d_model, args.num, args.vocab))
+    print("%22s %6s %12s %10s %12s %12s %16s" % ("decoding", "beam", "sents/s", "speedup", "mean length", \
+                                                 "exact match", "mean norm. logp"))
+    for name, beam_width, t, best in rows:
+        print("%22s %6d %12.2f %9.2fx %12.1f %12.4f %16.4f" % (name, beam_width, len(sents)/t, rows[0][2]/t, \
+                                                               np.mean([len(b[0]) for b in best]), \
+                                                               np.mean([b[0] == s[::-1] for b, s in zip(best, sents)]), \
+                                                               np.mean([b[1] for b in best])))
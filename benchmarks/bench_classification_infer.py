@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of BERT classification inference throughput (documents/s) on CPU against batch size: one document per
+forward pass (as infer_sentence), batches in input order, and length-bucketed batches (as infer_from_file).
+Uses a randomly initialized BertForSequenceClassification and random token ids with review-like lengths, so no
+pretrained weights or tokenizer are needed.
+
+Usage: python benchmarks/bench_classification_infer.py --num_docs 1024 --batch_sizes 1 8 16 32 64 128
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+from nlptoolkit.classification.models.BERT.modeling import BertConfig
+from nlptoolkit.classification.models.BERT.BERT import BertForSequenceClassification
+from nlptoolkit.classification.models.batching import length_buckets, pad_batch
+
+
+def infer(net, token_ids, batches):
+    """ runs batches (lists of document indices), returns (seconds, fraction of padded tokens) """
+    padded, start = 0, time.time()
+    with torch.no_grad():
+        for batch in batches:
+            sentences = pad_batch([token_ids[i] for i in batch])
+            padded += sentences.numel()
+            net(sentences, token_type_ids=torch.zeros_like(sentences), attention_mask=(sentences != 0).long())
+    return time.time() - start, 1 - sum(len(ids) for ids in token_ids)/float(padded)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_docs", type=int, default=1024, help="No. of documents")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 8, 16, 32, 64, 128])
+    parser.add_argument("--tokens_length", type=int, default=300, help="Max tokens length")
+    parser.add_argument("--hidden_size", type=int, default=768)
+    parser.add_argument("--num_layers", type=int, default=12)
+    parser.add_argument("--num_threads", type=int, default=0, help="torch CPU threads (0: torch default)")
+    args = parser.parse_args()
+
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    torch.manual_seed(0)
+    config = BertConfig(30522, hidden_size=args.hidden_size, num_hidden_layers=args.num_layers, \
+                        num_attention_heads=args.hidden_size//64, intermediate_size=4*args.hidden_size)
+    net = BertForSequenceClassification(config, num_labels=5)
+    net.eval()
+    rng = np.random.RandomState(0)
+    lengths = np.clip(rng.lognormal(np.log(120), 0.7, args.num_docs).astype(np.int64), 8, args.tokens_length)
+    token_ids = [[101] + list(rng.randint(1000, 30000, l - 2)) + [102] for l in lengths]
+
+    print("%6s %14s %14s %14s %12s %12s" % ("batch", "in-order d/s", "bucketed d/s", "speedup", \
+                                           "in-order pad", "bucketed pad"))
+    for batch_size in args.batch_sizes:
+        in_order = [list(range(i, min(i + batch_size, args.num_docs))) for i in range(0, args.num_docs, batch_size)]
+        t_order, pad_order = infer(net, token_ids, in_order)
+        t_bucket, pad_bucket = infer(net, token_ids, length_buckets(lengths, batch_size))
+        print("%6d %14.1f %14.1f %14.2f %12.3f %12.3f" % (batch_size, args.num_docs/t_order, args.num_docs/t_bucket, \
+                                                          t_order/t_bucket, pad_order, pad_bucket))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of BERT classification training throughput on CPU: reviews padded to tokens_length (fixed length batches),
+length-bucketed batches padded to their longest review, and packed rows of short reviews.
+Reports real (non-padding) tokens/s and epoch time. Uses a randomly initialized BertForSequenceClassification and
+random token ids whose lengths follow IMDB reviews tokenized by the bert-base-uncased WordPiece tokenizer
+(log-normal, median ~230 tokens), truncated to tokens_length, so no pretrained weights or dataset are needed.
+
+Usage: python benchmarks/bench_classification_training.py --num_docs 2000 --tokens_length 200 --batch_size 32
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from nlptoolkit.classification.models.BERT.modeling import BertConfig
+from nlptoolkit.classification.models.BERT.BERT import BertForSequenceClassification
+from nlptoolkit.classification.models.batching import BucketBatchSampler, SequenceCollator
+
+
+class reviews(object):
+    def __init__(self, token_ids, labels):
+        self.X, self.y = token_ids, labels
+
+    def __len__(self):
+        return len(self.X)
+
+    def __getitem__(self, idx):
+        return self.X[idx], self.y[idx]
+
+
+def train_epoch(net, loader):
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(net.parameters(), lr=1e-4)
+    net.train()
+    start = time.time()
+    for inputs, token_type, mask, labels, extras in loader:
+        outputs = net(inputs, token_type_ids=token_type, attention_mask=mask, **extras)
+        loss = criterion(outputs, labels)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    return time.time() - start
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_docs", type=int, default=2000, help="No. of training reviews")
+    parser.add_argument("--tokens_length", type=int, default=200, help="Max tokens length")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--hidden_size", type=int, default=768)
+    parser.add_argument("--num_layers", type=int, default=12)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    rng = np.random.RandomState(0)
+    lengths = np.clip(rng.lognormal(np.log(230), 0.75, args.num_docs).astype(np.int64), 8, args.tokens_length)
+    token_ids = [np.array([101] + list(rng.randint(1000, 30000, l - 2)) + [102]) for l in lengths]
+    data = reviews(token_ids, list(rng.randint(0, 2, args.num_docs)))
+    config = BertConfig(30522, hidden_size=args.hidden_size, num_hidden_layers=args.num_layers, \
+                        num_attention_heads=args.hidden_size//64, intermediate_size=4*args.hidden_size)
+    # as padded by the old preprocess (its [PAD]s are attended to here, which does not change the compute)
+    fixed = [list(x) + [0]*(args.tokens_length - len(x)) for x in token_ids]
+
+    print("reviews: %d, mean length %.1f tokens (max %d)" % (args.num_docs, lengths.mean(), args.tokens_length))
+    print("%10s %10s %10s %14s %12s" % ("mode", "batches", "fill", "real tokens/s", "epoch (s)"))
+    results = {}
+    for mode in ["fixed", "bucketed", "packed"]:
+        pack_length = args.tokens_length if mode == "packed" else None
+        if mode == "fixed":
+            sampler = BucketBatchSampler(np.full(args.num_docs, args.tokens_length), args.batch_size, seed=0)
+            loader = DataLoader(reviews(fixed, data.y), batch_sampler=sampler, collate_fn=SequenceCollator())
+        else:
+            sampler = BucketBatchSampler(lengths, args.batch_size, pack_length=pack_length, seed=0)
+            loader = DataLoader(data, batch_sampler=sampler, collate_fn=SequenceCollator(pack_length=pack_length))
+        fill = lengths.sum()/float(sum(batch[0].numel() for batch in loader))
+        torch.manual_seed(0)
+        net = BertForSequenceClassification(config, num_labels=2)
+        t = train_epoch(net, loader)
+        results[mode] = t
+        print("%10s %10d %10.3f %14.0f %12.1f" % (mode, len(sampler), fill, lengths.sum()/t, t))
+    print("epoch speedup over fixed: bucketed %.2fx, packed %.2fx" % (results["fixed"]/results["bucketed"], \
+                                                                      results["fixed"]/results["packed"]))
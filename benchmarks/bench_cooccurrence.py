@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of text graph co-occurrence/PMI computation: previous per-window python loop + pandas PMI
+against the vectorized text_graph.cooccurrence engine, on synthetic Zipfian corpora.
+The vectorized engine runs on the full corpus (--num_docs). The previous implementation runs, up to
+--legacy_max_vocab, on the first --legacy_num_docs documents, and both are timed and compared there. Its pandas
+row loop takes seconds per row at V = 7k, so it only runs on the first --legacy_row_sample rows and its time is
+extrapolated to all rows (only those rows are compared).
+Its full corpus time is extrapolated: counting time per window x no. of windows + PMI time. Above --legacy_max_vocab,
+its dense V X V float matrices do not fit in memory, and a lower bound of its time is extrapolated from the largest
+measured vocab: counting time per window held constant, PMI time scaled by (V/V0)^2. Extrapolated times are marked ~.
+
+Usage: python benchmarks/bench_cooccurrence.py --vocab_sizes 7000 20000 50000 --num_docs 20000 --legacy_num_docs 200
+"""
+import time
+import math
+from collections import OrderedDict
+from itertools import combinations
+from argparse import ArgumentParser
+import numpy as np
+import pandas as pd
+from nlptoolkit.classification.models.text_graph.cooccurrence import encode_corpus, count_cooccurrences, \
+                                                                     ppmi_matrix
+
+
+def synthetic_corpus(vocab_size, num_docs, doc_len, seed=0):
+    rng = np.random.RandomState(seed)
+    vocab = np.array(["w%d" % i for i in range(vocab_size)])
+    p = 1.0/np.arange(1, vocab_size + 1); p /= p.sum()
+    lengths = rng.randint(doc_len//2, doc_len*3//2, size=num_docs)
+    return [list(vocab[rng.choice(vocab_size, size=l, p=p)]) for l in lengths], vocab
+
+
+def legacy_counts(docs, names, window):
+    """ co-occurrence counting loop as previously found in generate_text_graph """
+    n_i = OrderedDict((name, 0) for name in names)
+    word2index = OrderedDict((name, index) for index, name in enumerate(names))
+    occurrences = np.zeros((len(names), len(names)), dtype=np.int32)
+    no_windows = 0
+    for l in docs:
+        for i in range(len(l) - window):
+            no_windows += 1
+            d = set(l[i:(i + window)])
+            d = list(d)
+            d = [w for w in d if w in names]
+            for w in d:
+                n_i[w] += 1
+            for w1, w2 in combinations(d, 2):
+                i1 = word2index[w1]
+                i2 = word2index[w2]
+                occurrences[i1][i2] += 1
+                occurrences[i2][i1] += 1
+    return occurrences, n_i, no_windows
+
+
+def legacy_pmi(occurrences, n_i, no_windows, names, row_sample=0):
+    """ pandas PMI as previously found in generate_text_graph, with its row loop only run on the first row_sample
+    rows if row_sample > 0. Returns ---> (p_ij, seconds with the row loop extrapolated to all rows) """
+    start = time.time()
+    occurrences = occurrences / no_windows
+    p_ij = pd.DataFrame(occurrences, index=names, columns=names)
+    p_i = pd.Series(n_i, index=n_i.keys()) / no_windows
+    for col in p_ij.columns:
+        p_ij[col] = p_ij[col] / p_i[col]
+    rows = p_ij.index[:row_sample] if row_sample > 0 else p_ij.index
+    row_start = time.time()
+    for row in rows:
+        p_ij.loc[row, :] = p_ij.loc[row, :] / p_i[row]
+    t_rows = time.time() - row_start
+    p_ij = p_ij + 1E-9
+    for col in p_ij.columns:
+        p_ij[col] = p_ij[col].apply(lambda x: math.log(x))
+    return p_ij, time.time() - start + t_rows*(len(p_ij.index)/len(rows) - 1)
+
+
+def vectorized_ppmi(docs, vocab, window):
+    tokens, offsets = encode_corpus(docs, vocab)
+    occurrences, n_i, no_windows = count_cooccurrences(tokens, offsets, len(vocab), window=window)
+    return ppmi_matrix(occurrences, n_i, no_windows)
+
+
+def timed(f):
+    start = time.time()
+    out = f()
+    return time.time() - start, out
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--vocab_sizes", type=int, nargs="+", default=[7000, 20000, 50000], help="Vocab sizes to benchmark")
+    parser.add_argument("--num_docs", type=int, default=20000, help="Number of synthetic documents")
+    parser.add_argument("--doc_len", type=int, default=200, help="Mean document length (tokens)")
+    parser.add_argument("--window", type=int, default=10, help="Sliding window size")
+    parser.add_argument("--legacy_max_vocab", type=int, default=7000, help="Only run previous implementation up to this vocab size (dense V X V)")
+    parser.add_argument("--legacy_num_docs", type=int, default=200, help="No. of documents of the subsample the previous implementation is run on")
+    parser.add_argument("--legacy_row_sample", type=int, default=10, help="No. of rows the previous pandas row loop is run on (0: all)")
+    args = parser.parse_args()
+
+    rows, measured = [], None
+    for vocab_size in args.vocab_sizes:
+        docs, vocab = synthetic_corpus(vocab_size, args.num_docs, args.doc_len)
+        t_new, _ = timed(lambda: vectorized_ppmi(docs, vocab, args.window))
+        windows = sum(max(len(doc) - args.window, 0) for doc in docs)
+        sub = docs[:args.legacy_num_docs]
+        if vocab_size <= args.legacy_max_vocab:
+            t_count, (occurrences, n_i, no_windows) = timed(lambda: legacy_counts(sub, vocab, args.window))
+            p_ij, t_pmi = legacy_pmi(occurrences, n_i, no_windows, vocab, args.legacy_row_sample)
+            del occurrences
+            t_sub, ppmi = timed(lambda: vectorized_ppmi(sub, vocab, args.window))
+            n_rows = args.legacy_row_sample if args.legacy_row_sample > 0 else vocab_size
+            p_ij = p_ij.values[:n_rows]
+            p_ij = np.where(p_ij > 0, p_ij, 0); p_ij[np.arange(len(p_ij)), np.arange(len(p_ij))] = 0
+            diff = np.abs(ppmi[:n_rows].toarray() - p_ij).max()
+            measured = (vocab_size, t_count/no_windows, t_pmi)
+            mark = "~" if n_rows < vocab_size else ""
+            t_old, t_sub_old = t_count/no_windows*windows + t_pmi, mark + "%.2f" % (t_count + t_pmi)
+            t_sub, diff, mark = "%.2f" % t_sub, "%.2e" % diff, "~" # counting is always extrapolated
+        elif measured is not None:
+            v0, per_window, t_pmi = measured
+            t_old = per_window*windows + t_pmi*(vocab_size/v0)**2
+            t_sub_old, t_sub, diff, mark = "-", "-", "-", "~"
+        else:
+            t_old, t_sub_old, t_sub, diff, mark = float("nan"), "-", "-", "-", ""
+        rows.append((vocab_size, t_sub_old, t_sub, diff, mark + "%.0f" % t_old, t_new, t_old/t_new, mark, \
+                     12*vocab_size**2/1024**3))
+
+    print("full corpus: %d docs, subsample: %d docs" % (args.num_docs, args.legacy_num_docs))
+    print("%8s %14s %14s %10s %16s %12s %10s %16s" % ("vocab", "sub legacy (s)", "sub sparse (s)", "max |diff|", \
+                                                   "full legacy (s)", "full sparse (s)", "speedup", "legacy dense GB"))
+    for vocab_size, t_sub_old, t_sub, diff, t_old, t_new, speedup, mark, dense_gb in rows:
+        print("%8d %14s %14s %10s %16s %12.2f %10s %16.2f" % (vocab_size, t_sub_old, t_sub, diff, t_old, t_new, \
+                                                            mark + "%.0fx" % speedup, dense_gb))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the accuracy/latency tradeoff of early-exit BERT classification inference per exit threshold, using the
+trained checkpoint and labelled test split of a classify.py run with --early_exit 1 (./data/args.pkl,
+./data/test_checkpoint_1.pth.tar and the infer_processed token store of a run with --train_test_split 1). Reports test
+accuracy, mean exit layer, batch size 1 latency and batched throughput of each threshold, against the full depth
+forward pass of the same model.
+
+Usage: python benchmarks/bench_early_exit.py --thresholds 0.6 0.7 0.8 0.9 0.95 0.99 --num_docs 1000
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+from nlptoolkit.classification.models.infer import infer_from_trained, load_pickle
+from nlptoolkit.classification.models.batching import length_buckets
+from nlptoolkit.utils.token_store import TokenStore
+
+
+def predict(inferer, token_ids, batch_size):
+    """ predictions and exit layers of token_ids in length-bucketed batches, with the time taken """
+    predicted, exit_layers = [0]*len(token_ids), [0]*len(token_ids)
+    start = time.time()
+    for batch in length_buckets([len(ids) for ids in token_ids], batch_size):
+        p, layers = inferer.infer_batch([token_ids[i] for i in batch], return_exit_layers=True)
+        for j, idx in enumerate(batch):
+            predicted[idx] = p[j]
+            exit_layers[idx] = layers[j] if layers is not None else inferer.num_layers
+    return np.array(predicted), np.array(exit_layers), time.time() - start
+
+
+def latency(inferer, token_ids):
+    """ median ms per document, one document per forward pass """
+    times = []
+    for ids in token_ids:
+        start = time.time()
+        inferer.infer_batch([ids])
+        times.append(time.time() - start)
+    return 1000*np.median(times)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9, 0.95, 0.99], \
+                        help="Exit thresholds")
+    parser.add_argument("--num_docs", type=int, default=1000, help="No. of test documents (0: all)")
+    parser.add_argument("--latency_docs", type=int, default=100, help="No. of documents for batch size 1 latency")
+    parser.add_argument("--batch_size", type=int, default=32, help="Batch size for throughput")
+    parser.add_argument("--num_threads", type=int, default=0, help="torch CPU threads (0: torch default)")
+    bench_args = parser.parse_args()
+
+    if bench_args.num_threads > 0:
+        torch.set_num_threads(bench_args.num_threads)
+    args = load_pickle("args.pkl")
+    if (args.model_no != 1) or (getattr(args, "early_exit", 0) != 1):
+        raise ValueError("args.pkl is not of a BERT run with --early_exit 1")
+    store = TokenStore("infer_processed", max_len=args.tokens_length)
+    if not store.has_labels:
+        raise ValueError("infer_processed has no labels, run classify.py with --train_test_split 1")
+    n = len(store) if bench_args.num_docs == 0 else min(bench_args.num_docs, len(store))
+    token_ids = [list(store[i][0]) for i in range(n)]
+    labels = np.array([store[i][1] for i in range(n)])
+
+    args.quantize, args.traced = 0, 0
+    inferer = infer_from_trained(args)
+    inferer.num_layers = len(inferer.net.bert.encoder.layer)
+    rows = []
+    inferer.early_exit = False # full depth
+    predicted, exit_layers, t = predict(inferer, token_ids, bench_args.batch_size)
+    full = (predicted, latency(inferer, token_ids[:bench_args.latency_docs]), n/t)
+    rows.append(("full", (predicted == labels).mean(), exit_layers.mean(), 1.0, full[1], full[2]))
+    inferer.early_exit = True
+    for threshold in bench_args.thresholds:
+        inferer.args.exit_threshold = threshold
+        predicted, exit_layers, t = predict(inferer, token_ids, bench_args.batch_size)
+        rows.append(("%.3f" % threshold, (predicted == labels).mean(), exit_layers.mean(), \
+                     (predicted == full[0]).mean(), latency(inferer, token_ids[:bench_args.latency_docs]), n/t))
+
+    print("test documents: %d, encoder layers: %d, batch size %d" % (n, inferer.num_layers, bench_args.batch_size))
+    print("%9s %10s %11s %10s %17s %9s %10s %9s" % ("threshold", "accuracy", "mean exit", "agreement", \
+                                                    "latency (ms/doc)", "speedup", "docs/s", "speedup"))
+    for name, accuracy, mean_exit, agreement, ms, throughput in rows:
+        print("%9s %10.4f %11.2f %10.4f %17.1f %8.2fx %10.1f %8.2fx" % (name, accuracy, mean_exit, agreement, ms, \
+                                                                        full[1]/ms, throughput, throughput/full[2]))
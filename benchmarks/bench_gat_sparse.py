@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of GAT memory and throughput: dense GAT (N x N x 2F attention inputs, list of heads) against the
+edge-list SpGAT (segment softmax, batched heads), on random text-graph-like adjacencies.
+Each run is done in a separate process so that peak RSS is measured per model and graph size.
+
+Usage: python benchmarks/bench_gat_sparse.py --num_nodes 1000 2000 10000 50000 --dense_max_nodes 2000
+"""
+import time
+import resource
+import multiprocessing as mp
+from argparse import ArgumentParser
+import torch
+import torch.nn.functional as F
+from nlptoolkit.classification.models.GAT.GAT import GAT, SpGAT
+from nlptoolkit.classification.models.text_graph.graph_builder import normalize_adjacency, to_edge_index
+from bench_gcn_sparse import random_text_graph
+
+
+def run(model, num_nodes, args, queue):
+    A_hat = normalize_adjacency(random_text_graph(num_nodes, args.vocab_ratio, args.doc_degree))
+    targets = torch.randint(0, args.num_classes, (num_nodes,))
+    if model == "dense":
+        x, adj = torch.eye(num_nodes), torch.from_numpy(A_hat.toarray())
+        net = GAT(nfeat=num_nodes, nhid=args.hidden, nclass=args.num_classes, dropout=0.1, nheads=args.nb_heads, alpha=0.2)
+    else:
+        x, adj = None, to_edge_index(A_hat)
+        net = SpGAT(nfeat=num_nodes, nhid=args.hidden, nclass=args.num_classes, dropout=0.1, nheads=args.nb_heads, alpha=0.2)
+    optimizer = torch.optim.Adam(net.parameters(), lr=0.01)
+    start = time.time()
+    for _ in range(args.num_epochs):
+        optimizer.zero_grad()
+        loss = F.nll_loss(net(x, adj), targets)
+        loss.backward()
+        optimizer.step()
+    epoch_time = (time.time() - start)/args.num_epochs
+    queue.put((A_hat.nnz, epoch_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.))
+
+
+def measure(model, num_nodes, args):
+    queue = mp.Queue()
+    p = mp.Process(target=run, args=(model, num_nodes, args, queue))
+    p.start(); p.join()
+    return queue.get() if p.exitcode == 0 else (float("nan"), float("nan"), float("nan"))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_nodes", type=int, nargs="+", default=[1000, 2000, 10000, 50000], help="Graph sizes N")
+    parser.add_argument("--vocab_ratio", type=float, default=0.1, help="Fraction of word nodes")
+    parser.add_argument("--doc_degree", type=float, default=80, help="Mean number of words per document node")
+    parser.add_argument("--dense_max_nodes", type=int, default=2000, help="Only run dense GAT up to this N")
+    parser.add_argument("--num_epochs", type=int, default=3, help="Epochs to average over")
+    parser.add_argument('--hidden', type=int, default=8)
+    parser.add_argument('--nb_heads', type=int, default=8)
+    parser.add_argument("--num_classes", type=int, default=2)
+    args = parser.parse_args()
+
+    print("%9s %10s %15s %15s %14s %14s %14s" % ("N", "edges", "dense RSS (MB)", "sparse RSS (MB)", \
+                                                 "dense s/epoch", "sparse s/epoch", "sparse nodes/s"))
+    # nan = not run (above --dense_max_nodes) or out of memory
+    for num_nodes in args.num_nodes:
+        edges, sparse_t, sparse_mem = measure("sparse", num_nodes, args)
+        dense_t, dense_mem = float("nan"), float("nan")
+        if num_nodes <= args.dense_max_nodes:
+            _, dense_t, dense_mem = measure("dense", num_nodes, args)
+        print("%9d %10.0f %15.1f %15.1f %14.3f %14.3f %14.0f" % (num_nodes, edges, dense_mem, sparse_mem, \
+                                                               dense_t, sparse_t, num_nodes/sparse_t))
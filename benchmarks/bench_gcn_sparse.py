@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of GCN memory and epoch time: dense A_hat and identity features (previous implementation)
+against sparse A_hat with implicit identity features, on random text-graph-like adjacencies.
+
+Usage: python benchmarks/bench_gcn_sparse.py --num_nodes 10000 50000 250000 --dense_max_nodes 10000
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import scipy.sparse as sp
+import torch
+import torch.nn as nn
+from nlptoolkit.classification.models.GCN.GCN import gcn
+from nlptoolkit.classification.models.text_graph.graph_builder import normalize_adjacency
+
+
+def random_text_graph(num_nodes, vocab_ratio, doc_degree, seed=0):
+    """ bipartite document-word edges plus sparse word-word edges """
+    rng = np.random.RandomState(seed)
+    n_vocab = int(num_nodes*vocab_ratio); n_docs = num_nodes - n_vocab
+    def random_block(n_rows, n_cols):
+        nnz = int(n_rows*doc_degree)
+        block = sp.csr_matrix((rng.rand(nnz).astype(np.float32), (rng.randint(0, n_rows, nnz), \
+                               rng.randint(0, n_cols, nnz))), shape=(n_rows, n_cols))
+        block.sum_duplicates()
+        return block
+    doc_word = random_block(n_docs, n_vocab)
+    word_word = sp.triu(random_block(n_vocab, n_vocab), k=1); word_word = word_word + word_word.T
+    return sp.bmat([[None, doc_word], [doc_word.T, word_word]], format="csr")
+
+
+class dense_gcn(gcn):
+    """ previous GCN: dense A_hat (torch.mm), features passed as dense identity matrix """
+    def __init__(self, X_size, A_hat, cuda, args):
+        super(dense_gcn, self).__init__(X_size, sp.csr_matrix(A_hat.shape, dtype=np.float32), cuda, args)
+        self.A_hat = torch.tensor(A_hat.toarray(), requires_grad=False).float()
+
+    def forward(self, X):
+        X = torch.mm(X, self.weight) + self.bias
+        X = torch.relu(torch.mm(self.A_hat, X))
+        X = torch.mm(X, self.weight2) + self.bias2
+        X = torch.relu(torch.mm(self.A_hat, X))
+        return self.fc1(X)
+
+
+def epoch_time(net, inputs, targets, num_epochs):
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(net.parameters(), lr=0.01)
+    start = time.time()
+    for _ in range(num_epochs):
+        optimizer.zero_grad()
+        loss = criterion(net(*inputs), targets)
+        loss.backward()
+        optimizer.step()
+    return (time.time() - start)/num_epochs
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_nodes", type=int, nargs="+", default=[10000, 50000, 100000, 250000], help="Graph sizes N")
+    parser.add_argument("--vocab_ratio", type=float, default=0.1, help="Fraction of word nodes")
+    parser.add_argument("--doc_degree", type=float, default=80, help="Mean number of words per document node")
+    parser.add_argument("--dense_max_nodes", type=int, default=10000, help="Only run dense GCN up to this N")
+    parser.add_argument("--num_epochs", type=int, default=5, help="Epochs to average over")
+    parser.add_argument("--hidden_size_1", type=int, default=330)
+    parser.add_argument("--hidden_size_2", type=int, default=130)
+    parser.add_argument("--num_classes", type=int, default=2)
+    args = parser.parse_args()
+
+    print("%9s %10s %16s %16s %14s %14s" % ("N", "edges", "dense mem (MB)", "sparse mem (MB)", "dense s/epoch", "sparse s/epoch"))
+    for num_nodes in args.num_nodes:
+        A_hat = normalize_adjacency(random_text_graph(num_nodes, args.vocab_ratio, args.doc_degree))
+        targets = torch.randint(0, args.num_classes, (num_nodes,))
+        # A_hat values + int64 COO indices; identity features are implicit
+        sparse_mem = A_hat.nnz*(4 + 2*8)/1e6
+        net = gcn(num_nodes, A_hat, False, args)
+        sparse_t = epoch_time(net, (), targets, args.num_epochs)
+        dense_mem = 2*4*num_nodes**2/1e6 # dense A_hat + dense identity X, float32
+        dense_t = float("nan")
+        if num_nodes <= args.dense_max_nodes:
+            net = dense_gcn(num_nodes, A_hat, False, args)
+            X = torch.eye(num_nodes)
+            dense_t = epoch_time(net, (X,), targets, args.num_epochs)
+            del net, X
+        print("%9d %10d %16.1f %16.1f %14.3f %14.3f" % (num_nodes, A_hat.nnz, dense_mem, sparse_mem, dense_t, sparse_t))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of GCN/GAT training throughput (labelled nodes/s): full-batch against neighbour-sampled mini-batch,
+on random text-graph-like adjacencies. All document nodes are used as labelled nodes. Full-batch training uses Adam,
+mini-batch training DenseSparseAdam (sparse updates of the sampled nodes' first layer weights) without the full A_hat.
+
+Usage: python benchmarks/bench_graph_minibatch.py --model GCN --num_nodes 10000 50000 100000 --batch_size 256 --fanout 10
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+import torch.nn.functional as F
+from nlptoolkit.classification.models.GCN.GCN import gcn
+from nlptoolkit.classification.models.GAT.GAT import SpGAT
+from nlptoolkit.classification.models.text_graph.graph_builder import normalize_adjacency, to_torch_sparse, \
+                                                                     to_edge_index
+from nlptoolkit.classification.models.text_graph.sampler import NeighborSampler
+from nlptoolkit.classification.models.text_graph.optimizer import DenseSparseAdam
+from bench_gcn_sparse import random_text_graph
+
+
+def train_step(net, optimizer, model, A_hat, targets, nodes=None):
+    optimizer.zero_grad()
+    if model == "GCN":
+        output = net(A_hat=A_hat, nodes=nodes)
+    else:
+        output = net(None, A_hat, nodes=nodes)
+    loss = F.cross_entropy(output[:len(targets)], targets)
+    loss.backward()
+    optimizer.step()
+
+
+def full_batch_epoch(net, optimizer, model, A_hat, targets):
+    start = time.time()
+    A_hat = to_torch_sparse(A_hat) if model == "GCN" else to_edge_index(A_hat)
+    train_step(net, optimizer, model, A_hat, targets)
+    return time.time() - start
+
+
+def mini_batch_epoch(net, optimizer, model, sampler, targets):
+    start = time.time()
+    for batch, nodes, sub_adj in sampler:
+        sub_adj = to_torch_sparse(sub_adj) if model == "GCN" else to_edge_index(sub_adj)
+        train_step(net, optimizer, model, sub_adj, targets[torch.from_numpy(batch)], nodes=torch.from_numpy(nodes))
+    return time.time() - start
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--model", type=str, default="GCN", help="GCN or GAT (sparse)")
+    parser.add_argument("--num_nodes", type=int, nargs="+", default=[10000, 50000, 100000], help="Graph sizes N")
+    parser.add_argument("--vocab_ratio", type=float, default=0.1, help="Fraction of word nodes")
+    parser.add_argument("--doc_degree", type=float, default=80, help="Mean number of words per document node")
+    parser.add_argument("--batch_size", type=int, default=256, help="Labelled nodes per mini-batch")
+    parser.add_argument("--fanout", type=int, default=10, help="Neighbours sampled per node per hop")
+    parser.add_argument("--num_epochs", type=int, default=2, help="Epochs to average over")
+    parser.add_argument("--hidden_size_1", type=int, default=330)
+    parser.add_argument("--hidden_size_2", type=int, default=130)
+    parser.add_argument('--hidden', type=int, default=8)
+    parser.add_argument('--nb_heads', type=int, default=8)
+    parser.add_argument("--num_classes", type=int, default=2)
+    args = parser.parse_args()
+
+    print("%9s %10s %14s %14s %16s %16s" % ("N", "labelled", "full s/epoch", "mini s/epoch", "full nodes/s", "mini nodes/s"))
+    for num_nodes in args.num_nodes:
+        A_hat = normalize_adjacency(random_text_graph(num_nodes, args.vocab_ratio, args.doc_degree))
+        selected = np.arange(num_nodes - int(num_nodes*args.vocab_ratio))
+        targets = torch.randint(0, args.num_classes, (len(selected),))
+        times = []
+        for mode in ["full", "mini"]:
+            torch.manual_seed(0)
+            if args.model == "GCN":
+                net = gcn(num_nodes, A_hat if mode == "full" else None, False, args)
+            else:
+                net = SpGAT(nfeat=num_nodes, nhid=args.hidden, nclass=args.num_classes, dropout=0.1, \
+                            nheads=args.nb_heads, alpha=0.2)
+            optimizer = (torch.optim.Adam if mode == "full" else DenseSparseAdam)(net.parameters(), lr=0.01)
+            if mode == "full":
+                t = [full_batch_epoch(net, optimizer, args.model, A_hat, targets) for _ in range(args.num_epochs)]
+            else:
+                sampler = NeighborSampler(A_hat, [args.fanout]*2, selected, args.batch_size, shuffle=True, seed=0)
+                t = [mini_batch_epoch(net, optimizer, args.model, sampler, targets) for _ in range(args.num_epochs)]
+            times.append(np.mean(t))
+            del net, optimizer
+        print("%9d %10d %14.3f %14.3f %16.0f %16.0f" % (num_nodes, len(selected), times[0], times[1], \
+                                                        len(selected)/times[0], len(selected)/times[1]))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of greedy decoding of the translation Transformer: the decoding loop which re-runs the decoder over the
+whole target prefix at each step (Transformer.decode_full) against incremental decoding with cached keys/values
+(Transformer.decode_cached), for fixed output lengths (eos is ignored). The model has random weights of the given
+size, so no dataset or checkpoint is needed; the outputs of both are checked to be the same.
+
+Usage: python benchmarks/bench_kv_decoding.py --lengths 50 100 200 --d_model 512 --num 6
+"""
+import time
+from argparse import ArgumentParser
+import torch
+import torch.nn as nn
+from nlptoolkit.translation.models.Transformer.Transformer import Transformer
+
+
+def timed(decode, repeats):
+    """ median seconds of decode(), with its output """
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        out = decode()
+        times.append(time.time() - start)
+    return sorted(times)[len(times)//2], out
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--lengths", type=int, nargs="+", default=[50, 100, 200], help="Output lengths")
+    parser.add_argument("--src_len", type=int, default=30, help="Source sentence length")
+    parser.add_argument("--batch_size", type=int, default=1, help="No. of sentences decoded together")
+    parser.add_argument("--vocab", type=int, default=20000, help="Source and target vocab size")
+    parser.add_argument("--d_model", type=int, default=512, help="Transformer model dimension")
+    parser.add_argument("--ff_dim", type=int, default=2048, help="Transformer feed-forward layer dimension")
+    parser.add_argument("--num", type=int, default=6, help="Number of layers")
+    parser.add_argument("--n_heads", type=int, default=8, help="Number of attention heads")
+    parser.add_argument("--repeats", type=int, default=3, help="No. of timed runs of each")
+    parser.add_argument("--num_threads", type=int, default=0, help="torch CPU threads (0: torch default)")
+    args = parser.parse_args()
+
+    if args.num_threads > 0:
+        torch.set_num_threads(args.num_threads)
+    torch.manual_seed(0)
+    net = Transformer(src_vocab=args.vocab, trg_vocab=args.vocab, d_model=args.d_model, ff_dim=args.ff_dim, \
+                      num=args.num, n_heads=args.n_heads, max_encoder_len=args.src_len, \
+                      max_decoder_len=max(args.lengths) + 2)
+    for p in net.parameters():
+        if p.dim() > 1:
+            nn.init.xavier_uniform_(p)
+    net.eval()
+    cuda = torch.cuda.is_available()
+    src = torch.randint(4, args.vocab, (args.batch_size, args.src_len))
+    trg = torch.full((args.batch_size, 1), 2, dtype=torch.long) # <sos>
+    if cuda:
+        net.cuda(); src = src.cuda(); trg = trg.cuda()
+    src_mask = (src != 1).unsqueeze(-2)
+
+    print("d_model %d, %d layers, %d heads, vocab %d, batch size %d" % (args.d_model, args.num, args.n_heads, \
+                                                                         args.vocab, args.batch_size))
+    print("%8s %12s %12s %14s %14s %9s %6s" % ("length", "full (s)", "cached (s)", "full ms/token", \
+                                              "cached ms/token", "speedup", "same"))
+    with torch.no_grad():
+        e_out = net.encoder(src, src_mask)
+        for length in args.lengths:
+            t_full, (full, _) = timed(lambda: net.decode_full(e_out, trg, src_mask, None, max_steps=length), \
+                                      args.repeats)
+            t_cached, cached = timed(lambda: net.decode_cached(e_out, trg, src_mask, None, max_steps=length), \
+                                     args.repeats)
+            print("%8d %12.3f %12.3f %14.2f %14.2f %8.2fx %6s" % (length, t_full, t_cached, 1000*t_full/length, \
+                                                                 1000*t_cached/length, t_full/t_cached, \
+                                                                 torch.equal(full, cached)))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of int8 dynamically quantized against fp32 BERT/XLNet classification inference on CPU, using the trained
+checkpoint and labelled test split of a classify.py run (./data/args.pkl, ./data/test_checkpoint_<model_no>.pth.tar
+and the infer_processed token store of a run with --train_test_split 1). Reports test accuracy, agreement of the
+predictions, model load time, batch size 1 latency and batched throughput of both.
+
+Usage: python benchmarks/bench_quantized_infer.py --num_docs 1000 --batch_size 32
+"""
+import os
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+from nlptoolkit.classification.models.infer import infer_from_trained, load_pickle
+from nlptoolkit.classification.models.batching import length_buckets
+from nlptoolkit.classification.models.quantization import quantized_path
+from nlptoolkit.utils.token_store import TokenStore
+
+
+def predict(inferer, token_ids, batch_size):
+    """ predictions of token_ids in length-bucketed batches, with the time taken """
+    predicted = [0]*len(token_ids)
+    start = time.time()
+    for batch in length_buckets([len(ids) for ids in token_ids], batch_size):
+        for idx, p in zip(batch, inferer.infer_batch([token_ids[i] for i in batch])):
+            predicted[idx] = p
+    return np.array(predicted), time.time() - start
+
+
+def latency(inferer, token_ids):
+    """ median ms per document, one document per forward pass """
+    times = []
+    for ids in token_ids:
+        start = time.time()
+        inferer.infer_batch([ids])
+        times.append(time.time() - start)
+    return 1000*np.median(times)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_docs", type=int, default=1000, help="No. of test documents (0: all)")
+    parser.add_argument("--latency_docs", type=int, default=100, help="No. of documents for batch size 1 latency")
+    parser.add_argument("--batch_size", type=int, default=32, help="Batch size for throughput")
+    parser.add_argument("--num_threads", type=int, default=0, help="torch CPU threads (0: torch default)")
+    bench_args = parser.parse_args()
+
+    if bench_args.num_threads > 0:
+        torch.set_num_threads(bench_args.num_threads)
+    args = load_pickle("args.pkl")
+    store = TokenStore("infer_processed", max_len=args.tokens_length)
+    if not store.has_labels:
+        raise ValueError("infer_processed has no labels, run classify.py with --train_test_split 1")
+    n = len(store) if bench_args.num_docs == 0 else min(bench_args.num_docs, len(store))
+    token_ids = [list(store[i][0]) for i in range(n)]
+    labels = np.array([store[i][1] for i in range(n)])
+
+    results = {}
+    for quantize in [0, 1]:
+        args.quantize = quantize
+        start = time.time()
+        inferer = infer_from_trained(args)
+        load_time = time.time() - start
+        predicted, t = predict(inferer, token_ids, bench_args.batch_size)
+        results[quantize] = (predicted, load_time, (predicted == labels).mean(), \
+                             latency(inferer, token_ids[:bench_args.latency_docs]), n/t)
+        del inferer
+
+    checkpoint = os.path.join("./data/", "test_checkpoint_%d.pth.tar" % args.model_no)
+    print("test documents: %d, model_no %d, batch size %d" % (n, args.model_no, bench_args.batch_size))
+    print("%6s %10s %12s %16s %12s" % ("model", "accuracy", "load (s)", "latency (ms/doc)", "docs/s"))
+    for quantize, name in [(0, "fp32"), (1, "int8")]:
+        _, load_time, accuracy, ms, throughput = results[quantize]
+        print("%6s %10.4f %12.2f %16.1f %12.1f" % (name, accuracy, load_time, ms, throughput))
+    print("prediction agreement: %.4f, latency speedup: %.2fx, throughput speedup: %.2fx" % \
+          ((results[0][0] == results[1][0]).mean(), results[0][3]/results[1][3], results[1][4]/results[0][4]))
+    if os.path.isfile(checkpoint) and os.path.isfile(quantized_path(checkpoint)):
+        print("checkpoint size: fp32 (with optimizer state) %.1f MB, int8 %.1f MB" % \
+              (os.path.getsize(checkpoint)/1e6, os.path.getsize(quantized_path(checkpoint))/1e6))
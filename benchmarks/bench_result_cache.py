@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the classification result cache (--result_cache) on a simulated stream of single-sentence requests with
+repeated and near-duplicate texts, for the trained model of a classify.py run (./data/args.pkl). Requests are drawn
+from the texts of args.infer_data: with probability --p_exact a previous request is repeated (with case and whitespace
+changes), with probability --p_near a previous request is repeated with --edit_words of its words replaced, otherwise
+a new text is sent. Reports the hit rates and mean latency per request without the cache, with exact matches and with
+near-duplicate lookup, and the agreement of the cached predictions with those of the model.
+
+Usage: python benchmarks/bench_result_cache.py --num_requests 2000 --p_exact 0.3 --p_near 0.2
+"""
+import time
+from argparse import ArgumentParser
+import numpy as np
+import pandas as pd
+from nlptoolkit.classification.models.infer import infer_from_trained, load_pickle
+
+
+def make_requests(texts, n, p_exact, p_near, edit_words, rng):
+    requests = []
+    for _ in range(n):
+        r = rng.rand()
+        if (len(requests) > 0) and (r < p_exact):
+            text = requests[rng.randint(len(requests))]
+            text = "  " + (text.upper() if rng.rand() < 0.5 else text) + " "
+        elif (len(requests) > 0) and (r < p_exact + p_near):
+            words = requests[rng.randint(len(requests))].split()
+            for i in rng.randint(len(words), size=edit_words):
+                words[i] = texts[rng.randint(len(texts))].split()[0]
+            text = " ".join(words)
+        else:
+            text = texts[rng.randint(len(texts))]
+        requests.append(text.strip() if rng.rand() < 0.5 else text)
+    return requests
+
+
+def serve(inferer, requests):
+    """ predictions of requests sent one at a time, with the mean latency (ms) per request """
+    predicted = []
+    start = time.time()
+    for text in requests:
+        predicted.append(inferer.infer_sentences([text], batch_size=1)[0])
+    return np.array(predicted), 1000*(time.time() - start)/len(requests)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--num_requests", type=int, default=2000, help="No. of requests")
+    parser.add_argument("--p_exact", type=float, default=0.3, help="Probability of an exact repeat")
+    parser.add_argument("--p_near", type=float, default=0.2, help="Probability of a near-duplicate")
+    parser.add_argument("--edit_words", type=int, default=1, help="No. of words replaced in a near-duplicate")
+    parser.add_argument("--cache_size", type=int, default=10000, help="Result cache size")
+    parser.add_argument("--similarity_threshold", type=float, default=0.98, help="Near-duplicate similarity")
+    bench_args = parser.parse_args()
+
+    args = load_pickle("args.pkl")
+    args.quantize, args.traced = 0, 0
+    texts = [str(t) for t in pd.read_csv(args.infer_data)["text"] if len(str(t).split()) > 0]
+    requests = make_requests(texts, bench_args.num_requests, bench_args.p_exact, bench_args.p_near, \
+                             bench_args.edit_words, np.random.RandomState(0))
+
+    args.result_cache = 0
+    inferer = infer_from_trained(args)
+    reference, ms = serve(inferer, requests)
+    rows = [("no cache", 0.0, 0.0, ms, 1.0, None)]
+    for name, near_duplicate in [("exact", 0), ("near-dup", 1)]:
+        args.result_cache, args.near_duplicate = bench_args.cache_size, near_duplicate
+        args.similarity_threshold = bench_args.similarity_threshold
+        inferer.result_cache = inferer.load_result_cache()
+        predicted, ms = serve(inferer, requests)
+        info = inferer.result_cache.cache_info()
+        rows.append((name, info["exact_hits"]/len(requests), info["near_hits"]/len(requests), ms, \
+                     (predicted == reference).mean(), info))
+
+    print("requests: %d (p_exact %.2f, p_near %.2f, %d word edits), model_no %d" % \
+          (len(requests), bench_args.p_exact, bench_args.p_near, bench_args.edit_words, args.model_no))
+    print("%9s %11s %10s %13s %9s %10s" % ("cache", "exact hits", "near hits", "ms/request", "speedup", "agreement"))
+    for name, exact, near, ms, agreement, _ in rows:
+        print("%9s %11.3f %10.3f %13.2f %8.2fx %10.4f" % (name, exact, near, ms, rows[0][3]/ms, agreement))
+    for name, _, _, _, _, info in rows[1:]:
+        print("%s: ms per request of exact hits %.3f, near hits %.3f, misses %.3f" % \
+              (name, info["exact_ms"], info["near_ms"], info["miss_ms"]))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the shared text normalizer/tokenizer (nlptoolkit.utils.text_normalizer) against the previous
+tokeners of the translation, ASR, summarization and punctuation restoration tasks (their re.sub chains and the
+tokenizer of a loaded spaCy model), in sentences/s for normalization only and for normalization + tokenization, on
+the lines of --text_path. Also reports the tokenizer load time and checks that the outputs are the same. If the spaCy
+model of a previous tokener is not installed, its throughput is measured with the blank pipeline tokenizer of the
+language (the same rules) and its load time is not reported.
+
+Usage: python benchmarks/bench_text_normalizer.py --text_path ./data/src.txt --num_sents 100000
+"""
+import re
+import time
+import itertools
+from argparse import ArgumentParser
+import spacy
+from nlptoolkit.utils.text_normalizer import TextTokenizer
+
+MODELS = {"translation": "en_core_web_lg", "ASR": "en_core_web_sm", "summarization": "en_core_web_sm", \
+          "punctuation_restoration": "en_core_web_lg"}
+
+
+def previous_normalize(sent):
+    """ normalization of the previous translation, ASR and summarization tokeners """
+    sent = re.sub(r"[\*\"“”\n\\…\+\-\/\=\(\)‘•:\[\]\|’\!;]", " ", str(sent))
+    sent = re.sub(r"\!+", "!", sent)
+    sent = re.sub(r"\,+", ",", sent)
+    sent = re.sub(r"\?+", "?", sent)
+    sent = re.sub(r"[ ]+", " ", sent)
+    return sent.lower()
+
+
+def previous_normalize_punctuation(sent):
+    """ normalization of the previous punctuation restoration tokener """
+    sent = re.sub(r"[\*\"\n\\…\+\-\/\=\(\)‘•€\[\]\|♫:;]", " ", str(sent))
+    sent = re.sub(r"[ ]+", " ", sent)
+    return sent.lower()
+
+
+def sents_per_second(f, sents):
+    start = time.time()
+    out = [f(sent) for sent in sents]
+    return len(sents)/(time.time() - start), out
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--text_path", type=str, required=True, help="Path to txt file of sentences, one per line")
+    parser.add_argument("--num_sents", type=int, default=100000, help="No. of sentences")
+    args = parser.parse_args()
+
+    with open(args.text_path, "r", encoding="utf8") as f:
+        sents = [line.rstrip("\n") for line in itertools.islice(f, args.num_sents)]
+
+    rows = []
+    for task, model in MODELS.items():
+        normalize = previous_normalize_punctuation if task == "punctuation_restoration" else previous_normalize
+        start = time.time()
+        try:
+            previous_tokenizer = spacy.load(model).tokenizer
+            previous_load = "%.2f" % (time.time() - start)
+        except OSError:
+            previous_tokenizer = spacy.blank("en").tokenizer
+            previous_load = "n/a"
+        start = time.time()
+        tokenizer = TextTokenizer(task, "en")
+        load = "%.2f" % (time.time() - start)
+
+        norm_prev, normalized_prev = sents_per_second(normalize, sents)
+        norm_new, normalized_new = sents_per_second(tokenizer.normalize, sents)
+        tok_prev, tokens_prev = sents_per_second(lambda sent: [token.text for token in \
+                                                               previous_tokenizer(normalize(sent)) \
+                                                               if token.text != " "], sents)
+        tok_new, tokens_new = sents_per_second(tokenizer.tokenize, sents)
+        start = time.time()
+        tokens_batch = tokenizer.tokenize_batch(sents)
+        tok_batch = len(sents)/(time.time() - start)
+        rows.append((task, previous_load, load, norm_prev, norm_new, tok_prev, tok_new, tok_batch, \
+                     (normalized_prev == normalized_new) and (tokens_prev == tokens_new == tokens_batch)))
+
+    print("sentences: %d" % len(sents))
+    print("%24s %10s %10s %14s %14s %14s %14s %14s %6s" % ("task", "load prev", "load new", "norm prev/s", \
+                                                        "norm new/s", "tokenize prev/s", "tokenize new/s", \
+                                                        "batched new/s", "same"))
+    for task, previous_load, load, norm_prev, norm_new, tok_prev, tok_new, tok_batch, same in rows:
+        print("%24s %10s %10s %14.0f %14.0f %14.0f %14.0f %14.0f %6s" % (task, previous_load, load, norm_prev, \
+                                                                       norm_new, tok_prev, tok_new, tok_batch, same))
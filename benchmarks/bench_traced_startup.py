@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of cold start and per-call latency of classification inference with the TorchScript artifact
+(--traced 1) against the eager model (infer_from_trained constructing the model with from_pretrained and loading its
+checkpoint), for the trained model of a classify.py run (./data/args.pkl). Each start is timed in a fresh Python
+process: imports, model loading and the first prediction, then the median latency of single-sentence predictions.
+
+Usage: python benchmarks/bench_traced_startup.py --repeats 5 --num_calls 200
+"""
+import time
+START = time.time()
+import os
+import sys
+import json
+import subprocess
+from argparse import ArgumentParser
+import numpy as np
+
+SENTENCE = "This movie was a lot of fun to watch, the actors were great and the story kept me interested."
+
+
+def child(mode, num_calls):
+    """ times one start of infer_from_trained in this process, prints the timings as json """
+    import_start = time.time()
+    from nlptoolkit.classification.models.infer import infer_from_trained, load_pickle
+    from nlptoolkit.classification.models.traced import export_traced
+    load_start = time.time()
+    args = load_pickle("args.pkl")
+    args.quantize = 0
+    if mode == "export":
+        export_traced(args)
+        return
+    args.traced = 1 if mode == "traced" else 0
+    inferer = infer_from_trained(args)
+    first_start = time.time()
+    inferer.infer_sentences([SENTENCE], batch_size=1)
+    end = time.time()
+    times = []
+    for _ in range(num_calls):
+        start = time.time()
+        inferer.infer_sentences([SENTENCE], batch_size=1)
+        times.append(time.time() - start)
+    print("TIMINGS " + json.dumps({"startup": import_start - START, "imports": load_start - import_start, \
+                                   "load": first_start - load_start, "first": end - first_start, \
+                                   "total": end - START, "latency": 1000*float(np.median(times))}))
+
+
+def run(mode, num_calls):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, "--num_calls", str(num_calls)], \
+                         stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    lines = [l for l in out.splitlines() if l.startswith("TIMINGS ")]
+    return json.loads(lines[-1][len("TIMINGS "):]) if lines else None
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5, help="No. of cold starts of each mode")
+    parser.add_argument("--num_calls", type=int, default=200, help="No. of single-sentence predictions for latency")
+    parser.add_argument("--child", type=str, default="", help="(internal) times one start in this process: eager, traced or export")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.num_calls)
+        sys.exit(0)
+    run("export", 0)
+    results = {}
+    for mode in ["eager", "traced"]:
+        runs = [run(mode, args.num_calls) for _ in range(args.repeats)]
+        results[mode] = {k: float(np.median([r[k] for r in runs])) for k in runs[0]}
+    print("median of %d cold starts (s), latency: median ms per single-sentence prediction" % args.repeats)
+    print("%8s %10s %10s %10s %12s %12s" % ("mode", "imports", "load", "first", "total start", "latency"))
+    for mode in ["eager", "traced"]:
+        r = results[mode]
+        print("%8s %10.2f %10.2f %10.3f %12.2f %12.2f" % (mode, r["startup"] + r["imports"], r["load"], r["first"], \
+                                                          r["total"], r["latency"]))
+    print("speedup: model load %.2fx, total start %.2fx, latency %.2fx" % \
+          (results["eager"]["load"]/results["traced"]["load"], results["eager"]["total"]/results["traced"]["total"], \
+           results["eager"]["latency"]/results["traced"]["latency"]))
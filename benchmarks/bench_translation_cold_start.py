@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the cold start of translation inference, for the trained model of a translate.py run (./data/args.pkl):
+the previous setup, which rebuilds the vocabs from the training data (load_dataloaders) and loads the model with its
+optimizer (load_model_and_optimizer), against loading the saved vocabs (load_vocabs) and the model weights only
+(load_trained_model). Reports the seconds taken by each step and checks that both give the same vocabs and model.
+
+Usage: python benchmarks/bench_translation_cold_start.py
+"""
+import time
+import torch
+from nlptoolkit.translation.infer import load_pickle
+from nlptoolkit.translation.preprocessing_funcs import load_dataloaders, load_vocabs, save_vocabs
+from nlptoolkit.translation.train_funcs import load_model_and_optimizer, load_trained_model
+
+
+def timed(f):
+    start = time.time()
+    out = f()
+    return time.time() - start, out
+
+
+if __name__ == "__main__":
+    args = load_pickle("args.pkl")
+    args.batch_size, args.fp16 = 1, 0
+    cuda = torch.cuda.is_available()
+
+    t_data, (_, FR, EN, _) = timed(lambda: load_dataloaders(args))
+    t_model, (net, _, _, _, _, _) = timed(lambda: load_model_and_optimizer(args, len(EN.vocab), len(FR.vocab), cuda))
+    save_vocabs(args, FR, EN)
+    t_vocabs, (FR_saved, EN_saved) = timed(lambda: load_vocabs(args))
+    t_weights, net_saved = timed(lambda: load_trained_model(args, len(EN_saved.vocab), len(FR_saved.vocab), cuda))
+
+    same_vocabs = (FR.vocab.itos == FR_saved.vocab.itos) and (EN.vocab.itos == EN_saved.vocab.itos) and \
+                  all(FR.vocab.stoi[tok] == FR_saved.vocab.stoi[tok] for tok in FR.vocab.itos + ["#unseen#"]) and \
+                  all(EN.vocab.stoi[tok] == EN_saved.vocab.stoi[tok] for tok in EN.vocab.itos + ["#unseen#"])
+    state, state_saved = net.state_dict(), net_saved.state_dict()
+    same_model = all(torch.equal(state[k].float(), state_saved[k]) for k in state)
+
+    print("src vocab %d, trg vocab %d" % (len(EN.vocab), len(FR.vocab)))
+    print("%10s %12s %12s %12s" % ("startup", "vocabs (s)", "model (s)", "total (s)"))
+    print("%10s %12.3f %12.3f %12.3f" % ("before", t_data, t_model, t_data + t_model))
+    print("%10s %12.3f %12.3f %12.3f" % ("after", t_vocabs, t_weights, t_vocabs + t_weights))
+    print("speedup %.1fx, same vocabs: %s, same model: %s" % ((t_data + t_model)/(t_vocabs + t_weights), \
+                                                              same_vocabs, same_model))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of translation corpus preprocessing: the previous tokenize_data, which reads both corpora into memory and
+tokenizes a DataFrame row by row with progress_apply, against the streaming tokenize_data (lazily read chunks
+tokenized with spaCy's tokenizer pipe, in a pool of --num_workers processes). Each run is done in a fresh process, and
+its time, sentence pairs/s and peak memory (max RSS of the main process) are reported. The df.csv written by each is
+checked to be the same as that of the previous implementation.
+
+Usage: python benchmarks/bench_translation_tokenize.py --src_path ./data/src.txt --trg_path ./data/trg.txt --num_workers 1 4
+"""
+import os
+import re
+import time
+import resource
+import filecmp
+from argparse import ArgumentParser, Namespace
+from multiprocessing import Process, Queue
+import pandas as pd
+from tqdm import tqdm
+from nlptoolkit.translation.preprocessing_funcs import tokener, tokenize_data
+
+tqdm.pandas(desc="Progress_bar")
+
+
+def tokenize_data_in_memory(args):
+    """ the previous tokenize_data """
+    with open(args.src_path, "r", encoding="utf8") as f:
+        eng_text = f.read()
+    with open(args.trg_path, "r", encoding="utf8") as f:
+        ch_text = f.read()
+    eng = re.split("[\n]+", eng_text)
+    ch = re.split("[\n]+", ch_text)
+    eng_list, ch_list = [], []
+    assert len(eng) == len(ch)
+    for e, c in tqdm(zip(eng, ch), total=len(eng)):
+        if (len(e) != 0) and (len(c) != 0):
+            eng_list.append(e); ch_list.append(c)
+    df = pd.DataFrame(data={"English":eng_list, "French":ch_list})
+    tokenizer_fr = tokener(args.trg_lang)
+    tokenizer_en = tokener(args.src_lang)
+    df["English"] = df.progress_apply(lambda x: tokenizer_en.tokenize(x["English"]), axis=1)
+    df["French"] = df.progress_apply(lambda x: tokenizer_fr.tokenize(x["French"]), axis=1)
+    df['eng_len'] = df.progress_apply(lambda x: len(x['English']), axis=1)
+    df['fr_len'] = df.progress_apply(lambda x: len(x['French']), axis=1)
+    max_len = max(args.max_encoder_len, args.max_decoder_len)
+    df = df[(df['fr_len'] <= max_len) & (df['eng_len'] <= max_len)]
+    df.to_csv(os.path.join("./data/", "df.csv"), index=False)
+
+
+def run(func, args, out_path, queue):
+    start = time.time()
+    func(args)
+    seconds = time.time() - start
+    os.replace(os.path.join("./data/", "df.csv"), out_path)
+    queue.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024))
+
+
+def timed_run(func, args, out_path):
+    """ (seconds, peak MB) of func(args) in a fresh process, its df.csv moved to out_path """
+    queue = Queue()
+    p = Process(target=run, args=(func, args, out_path, queue))
+    p.start(); result = queue.get(); p.join()
+    return result
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--src_path", type=str, required=True, help="Path to source data txt file")
+    parser.add_argument("--trg_path", type=str, required=True, help="Path to target data txt file")
+    parser.add_argument("--src_lang", type=str, default="en", help="src language: en, fr, zh")
+    parser.add_argument("--trg_lang", type=str, default="zh", help="trg language: en, fr, zh")
+    parser.add_argument("--max_len", type=int, default=200, help="Max src & trg length")
+    parser.add_argument("--num_workers", type=int, nargs="+", default=[1, 4], help="No. of processes")
+    parser.add_argument("--chunk_size", type=int, default=10000, help="No. of sentence pairs per chunk")
+    bench_args = parser.parse_args()
+
+    args = Namespace(src_path=bench_args.src_path, trg_path=bench_args.trg_path, src_lang=bench_args.src_lang, \
+                     trg_lang=bench_args.trg_lang, max_encoder_len=bench_args.max_len, \
+                     max_decoder_len=bench_args.max_len, chunk_size=bench_args.chunk_size, num_workers=1)
+    with open(args.src_path, "r", encoding="utf8") as f:
+        n_lines = sum(1 for _ in f)
+
+    reference = os.path.join("./data/", "df_in_memory.csv")
+    rows = [("in memory", "-") + timed_run(tokenize_data_in_memory, args, reference) + (True,)]
+    for num_workers in bench_args.num_workers:
+        args.num_workers = num_workers
+        out_path = os.path.join("./data/", "df_streaming_%d.csv" % num_workers)
+        rows.append(("streaming", num_workers) + timed_run(tokenize_data, args, out_path) + \
+                    (filecmp.cmp(reference, out_path, shallow=False),))
+
+    print("sentence pairs: %d, chunk size %d" % (n_lines, bench_args.chunk_size))
+    print("%10s %8s %10s %12s %9s %13s %6s" % ("tokenize", "workers", "time (s)", "pairs/s", "speedup", \
+                                             "peak RSS (MB)", "same"))
+    for name, num_workers, seconds, peak, same in rows:
+        print("%10s %8s %10.2f %12.0f %8.2fx %13.0f %6s" % (name, num_workers, seconds, n_lines/seconds, \
+                                                          rows[0][2]/seconds, peak, same))
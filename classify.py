@@ -6,11 +6,6 @@ Created on Wed Jul 31 14:04:38 2019
 """
 
 from nlptoolkit.utils.misc import save_as_pickle
-from nlptoolkit.classification.models.GCN.trainer import train_and_fit as GCN
-from nlptoolkit.classification.models.BERT.trainer import train_and_fit as BERT
-from nlptoolkit.classification.models.XLNet.trainer import train_and_fit as XLNet
-from nlptoolkit.classification.models.GAT.trainer import train_and_fit as GAT
-from nlptoolkit.classification.models.infer import infer_from_trained
 import logging
 from argparse import ArgumentParser
 
@@ -33,15 +28,25 @@ if __name__ == "__main__":
     parser.add_argument("--train_data", type=str, default="./data/train.csv", help="training data csv file path")
     parser.add_argument("--infer_data", type=str, default="./data/infer.csv", help="infer data csv file path")
     parser.add_argument("--max_vocab_len", type=int, default=7000, help="GCN: Max vocab size to consider based on top frequency tokens")
+    parser.add_argument("--pmi_threshold", type=float, default=0.0, help="GCN/GAT: Only keep word-word edges with PMI above this threshold")
+    parser.add_argument("--pmi_top_k", type=int, default=0, help="GCN/GAT: Only keep the top k PMI word-word edges of each word (0: keep all)")
+    parser.add_argument("--min_cooccurrence", type=int, default=1, help="GCN/GAT: Min. no. of co-occurrences of word-word edges")
+    parser.add_argument("--num_workers", type=int, default=1, help="GCN/GAT: No. of processes for text graph preprocessing, BERT/XLNet: for tokenization")
     parser.add_argument("--hidden_size_1", type=int, default=330, help="Size of first GCN hidden weights")
     parser.add_argument("--hidden_size_2", type=int, default=130, help="Size of second GCN hidden weights")
     parser.add_argument('--hidden', type=int, default=8, help='Number of hidden units for GAT')
     parser.add_argument('--nb_heads', type=int, default=8, help='Number of head attentions for GAT')
+    parser.add_argument("--gat_sparse", type=int, default=1, help="GAT: 1: Sparse (edge-list) attention, 0: Dense attention")
+    parser.add_argument("--graph_batch", type=int, default=0, help="GCN/GAT: 1: Mini-batch training over sampled neighbourhoods of batch_size labelled nodes, 0: Full-batch")
+    parser.add_argument("--fanout", type=int, default=10, help="GCN/GAT: No. of neighbours sampled per node per hop for mini-batch training")
+    parser.add_argument("--append_data", type=str, default="", help="GCN/GAT: csv file (text, label) of labelled documents to append to the existing text graph before training")
     parser.add_argument("--tokens_length", type=int, default=200, help="Max tokens length for BERT")
+    parser.add_argument("--token_cache", type=int, default=1, help="BERT/XLNet: 1: Reuse token ids of texts tokenized in previous preprocessing runs (./data/token_cache/), 0: Tokenize all texts")
     parser.add_argument("--num_classes", type=int, default=66, help="Number of prediction classes (starts from integer 0)")
     parser.add_argument("--train_test_split", type=int, default=0, help="0: No, 1: Yes (Only activate if infer.csv contains labelled data)")
     parser.add_argument("--test_ratio", type=float, default=0.1, help="GCN: Ratio of test to training nodes")
     parser.add_argument("--batch_size", type=int, default=32, help="Training batch size")
+    parser.add_argument("--pack_sequences", type=int, default=0, help="BERT/XLNet: 1: Pack short reviews together into rows of tokens_length tokens, 0: Pad each batch to its longest review")
     parser.add_argument("--gradient_acc_steps", type=int, default=1, help="No. of steps of gradient accumulation")
     parser.add_argument("--max_norm", type=float, default=1.0, help="Clipped gradient norm")
     parser.add_argument("--num_epochs", type=int, default=700, help="No of epochs")
@@ -51,34 +56,58 @@ if __name__ == "__main__":
     
     parser.add_argument("--train", type=int, default=1, help="Train model on dataset")
     parser.add_argument("--infer", type=int, default=0, help="Infer input sentence labels from trained model")
+    parser.add_argument("--infer_batch_size", type=int, default=32, help="BERT/XLNet: Inference batch size (documents are batched by length)")
+    parser.add_argument("--quantize", type=int, default=0, help="BERT/XLNet: 1: Infer on CPU with int8 dynamically quantized Linear layers (cached next to the checkpoint), 0: fp32")
+    parser.add_argument("--result_cache", type=int, default=0, help="Inference: Max. no. of texts in the cache of predicted classes of repeated inputs (0: no cache)")
+    parser.add_argument("--near_duplicate", type=int, default=0, help="BERT/XLNet result cache: 1: Reuse the class of cached near-duplicate texts (by pooled token embeddings), 0: Exact matches only")
+    parser.add_argument("--similarity_threshold", type=float, default=0.98, help="BERT/XLNet result cache: Min. cosine similarity of a near-duplicate")
+    parser.add_argument("--early_exit", type=int, default=0, help="BERT: 1: Train exit classifiers on the intermediate encoder layers and infer with early exit, 0: Full depth")
+    parser.add_argument("--exit_threshold", type=float, default=0.9, help="BERT early exit: Min. confidence (softmax probability) to exit at an intermediate layer")
+    parser.add_argument("--distill", type=int, default=0, help="BERT early exit: 1: Train exit classifiers to distill the final classifier, 0: Train them on the labels")
+    parser.add_argument("--distill_temperature", type=float, default=2.0, help="BERT early exit: Distillation softmax temperature")
+    parser.add_argument("--export_traced", type=int, default=0, help="GCN/BERT/XLNet: 1: Export trained model as TorchScript artifact ./data/traced_model_<model_no>.pt")
+    parser.add_argument("--traced", type=int, default=0, help="GCN/BERT/XLNet: 1: Infer on CPU with the TorchScript artifact of the trained model (exported if missing)")
     args = parser.parse_args()
     save_as_pickle("args.pkl", args)
     
+    # models are imported only when used, so that inference with a traced model (--train 0 --infer 1 --traced 1) does
+    # not import the model and training code
+    if (args.append_data != "") and (args.model_no in [0, 3]):
+        from nlptoolkit.classification.models.GCN.preprocessing_funcs import update_text_graph
+        update_text_graph(args.append_data, pmi_threshold=args.pmi_threshold, pmi_top_k=args.pmi_top_k, \
+                          min_cooccurrence=args.min_cooccurrence, num_workers=args.num_workers)
+    
     if args.train:
         if args.model_no == 0:
+            from nlptoolkit.classification.models.GCN.trainer import train_and_fit as GCN
             GCN(args)
         elif args.model_no == 1:
+            from nlptoolkit.classification.models.BERT.trainer import train_and_fit as BERT
             BERT(args)
         elif args.model_no == 2:
+            from nlptoolkit.classification.models.XLNet.trainer import train_and_fit as XLNet
             XLNet(args)
         elif args.model_no == 3:
+            from nlptoolkit.classification.models.GAT.trainer import train_and_fit as GAT
             net = GAT(args)
         else:
             print("Model selection not found.")
     
+    if args.export_traced:
+        from nlptoolkit.classification.models.traced import export_traced
+        export_traced(args)
+    
     if args.infer:
-        if args.model_no == 0:
-            logger.info("Infer function not compatible with GCN!")
-        else:
-            inferer = infer_from_trained(args)
-            while True:
-                opt = input("Choose an option:\n0: Infer from stdin user input\n1: Infer from file (Input file: \'.\data\input.txt\'\
-                                                                                                 Output file: '.\data\output.txt\'\n")
-                if opt == '0':
-                    inferer.infer_from_input()
-                    break
-                elif opt == '1':
-                    inferer.infer_from_file()
-                    break
-                else:
-                    print("Invalid option, please try again.")
+        from nlptoolkit.classification.models.infer import infer_from_trained
+        inferer = infer_from_trained(args)
+        while True:
+            opt = input("Choose an option:\n0: Infer from stdin user input\n1: Infer from file (Input file: \'.\data\input.txt\'\
+                                                                                             Output file: '.\data\output.txt\'\n")
+            if opt == '0':
+                inferer.infer_from_input()
+                break
+            elif opt == '1':
+                inferer.infer_from_file()
+                break
+            else:
+                print("Invalid option, please try again.")
@@ -6,8 +6,7 @@ Created on Mon Jul  1 14:21:57 2019
 """
 import os
 import pickle
-import spacy
-import re
+from ..utils.text_normalizer import TextTokenizer
 from string import ascii_lowercase
 import torch
 from torch.autograd import Variable
@@ -27,20 +26,11 @@ def save_as_pickle(filename, data):
     with open(completeName, 'wb') as output:
         pickle.dump(data, output)
         
-class tokener(object):
-    def __init__(self, lang="en"):
+class tokener(TextTokenizer):
+    def __init__(self, lang="en", light=True):
         d = {"en":"en_core_web_sm", "fr":"fr_core_news_sm"}
-        self.ob = spacy.load(d[lang])
-    
-    def tokenize(self, sent):
-        sent = re.sub(r"[\*\"“”\n\\…\+\-\/\=\(\)‘•:\[\]\|’\!;]", " ", str(sent))
-        sent = re.sub(r"\!+", "!", sent)
-        sent = re.sub(r"\,+", ",", sent)
-        sent = re.sub(r"\?+", "?", sent)
-        sent = re.sub(r"[ ]+", " ", sent)
-        sent = sent.lower()
-        sent = [token.text for token in self.ob.tokenizer(sent) if token.text != " "]
-        return sent
+        # light: spaCy's rule-based tokenizer of lang only, else that of the model (same rules, slower to load)
+        super(tokener, self).__init__("ASR", lang, model=None if light else d[lang])
 
 class vocab(object):
     def __init__(self, level="word"):
@@ -1,9 +1,10 @@
-from . import ASR
-from . import classification
-from . import generation
-from . import ner
-from . import pos
-from . import punctuation_restoration
-from . import summarization
-from . import translation
-from . import utils
+import importlib
+
+_submodules = ["ASR", "classification", "generation", "ner", "pos", "punctuation_restoration", "summarization", "translation", "utils"]
+
+
+def __getattr__(name):
+    """ submodules are imported on first access, so that importing one of them does not import all the others """
+    if name in _submodules:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -1 +1,10 @@
-from . import models
+import importlib
+
+_submodules = ["models"]
+
+
+def __getattr__(name):
+    """ submodules are imported on first access, so that importing one of them does not import all the others """
+    if name in _submodules:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -5,7 +5,9 @@ Created on Fri Jun 28 10:31:32 2019
 @author: WT
 """
 from .modeling import BertModel, BertPreTrainedModel
+import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 class BertForSequenceClassification(BertPreTrainedModel):
     """BERT model for classification.
@@ -61,8 +63,10 @@ class BertForSequenceClassification(BertPreTrainedModel):
         nn.init.xavier_normal_(self.classifier.weight)
         self.apply(self.init_bert_weights)
 
-    def forward(self, input_ids, token_type_ids=None, attention_mask=None, labels=None):
-        _, pooled_output = self.bert(input_ids, token_type_ids, attention_mask, output_all_encoded_layers=False)
+    def forward(self, input_ids, token_type_ids=None, attention_mask=None, labels=None, position_ids=None, \
+                cls_index=None):
+        _, pooled_output = self.bert(input_ids, token_type_ids, attention_mask, output_all_encoded_layers=False, \
+                                     position_ids=position_ids, cls_index=cls_index)
         pooled_output = self.dropout(pooled_output)
         logits = self.classifier(pooled_output)
 
@@ -71,4 +75,92 @@ class BertForSequenceClassification(BertPreTrainedModel):
             loss = loss_fct(logits.view(-1, self.num_labels), labels.view(-1))
             return loss
         else:
-            return logits
\ No newline at end of file
+            return logits
+
+
+class BertExitHead(nn.Module):
+    """ lightweight classifier of an intermediate encoder layer: pooled [CLS] hidden state (dense + tanh, as the BERT
+    pooler) ---> logits """
+    def __init__(self, config, num_labels):
+        super(BertExitHead, self).__init__()
+        self.dense = nn.Linear(config.hidden_size, config.hidden_size)
+        self.dropout = nn.Dropout(config.hidden_dropout_prob)
+        self.classifier = nn.Linear(config.hidden_size, num_labels)
+
+    def forward(self, hidden_states, cls_index=None):
+        if cls_index is None:
+            cls_states = hidden_states[:, 0]
+        else:
+            cls_states = hidden_states[cls_index[:, 0], cls_index[:, 1]] # packed sequences, see BertModel
+        return self.classifier(self.dropout(torch.tanh(self.dense(cls_states))))
+
+
+class BertForEarlyExitClassification(BertForSequenceClassification):
+    """BertForSequenceClassification with an exit classifier (BertExitHead) after each encoder layer but the last,
+    for early-exit inference.
+
+    forward(..., all_exits=False) outputs the logits of the final classifier (as BertForSequenceClassification), with
+    all_exits=True the list of logits of every exit, from the first layer to the final classifier (see early_exit_loss).
+    early_exit(...) runs the encoder layer by layer, and returns the prediction of a sequence at the first exit whose
+    confidence (max softmax probability) reaches exit_threshold, dropping it from the rest of the forward pass.
+    """
+    def __init__(self, config, num_labels):
+        super(BertForEarlyExitClassification, self).__init__(config, num_labels)
+        self.exits = nn.ModuleList([BertExitHead(config, num_labels) for _ in range(config.num_hidden_layers - 1)])
+        self.exits.apply(self.init_bert_weights)
+
+    def forward(self, input_ids, token_type_ids=None, attention_mask=None, labels=None, position_ids=None, \
+                cls_index=None, all_exits=False):
+        if not all_exits:
+            return super(BertForEarlyExitClassification, self).forward(input_ids, token_type_ids, attention_mask, \
+                                                                      labels, position_ids, cls_index)
+        encoded_layers, pooled_output = self.bert(input_ids, token_type_ids, attention_mask, \
+                                                  output_all_encoded_layers=True, position_ids=position_ids, \
+                                                  cls_index=cls_index)
+        logits = [head(hidden, cls_index) for head, hidden in zip(self.exits, encoded_layers[:-1])]
+        logits.append(self.classifier(self.dropout(pooled_output)))
+        return logits
+
+    def early_exit(self, input_ids, token_type_ids=None, attention_mask=None, exit_threshold=0.9):
+        """ Returns ---> (logits, exit layer (1 to num_hidden_layers) of each sequence) """
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        if token_type_ids is None:
+            token_type_ids = torch.zeros_like(input_ids)
+        extended_attention_mask = self.bert.get_extended_attention_mask(attention_mask)
+        hidden_states = self.bert.embeddings(input_ids, token_type_ids)
+        logits = hidden_states.new_zeros((input_ids.size(0), self.num_labels))
+        exit_layers = torch.zeros(input_ids.size(0), dtype=torch.long, device=input_ids.device)
+        active = torch.arange(input_ids.size(0), device=input_ids.device) # sequences not exited yet
+        for i, layer_module in enumerate(self.bert.encoder.layer):
+            hidden_states = layer_module(hidden_states, extended_attention_mask)
+            if i == len(self.exits):
+                logits[active] = self.classifier(self.dropout(self.bert.pooler(hidden_states)))
+                exit_layers[active] = i + 1
+                break
+            exit_logits = self.exits[i](hidden_states)
+            done = F.softmax(exit_logits, dim=1).max(1)[0] >= exit_threshold
+            logits[active[done]] = exit_logits[done]
+            exit_layers[active[done]] = i + 1
+            if done.all():
+                break
+            if done.any():
+                keep = ~done
+                hidden_states, extended_attention_mask = hidden_states[keep], extended_attention_mask[keep]
+                active = active[keep]
+        return logits, exit_layers
+
+
+def early_exit_loss(all_logits, labels, distill=False, temperature=2.0):
+    """ cross-entropy loss of the final classifier + sum of the losses of the exit heads: cross-entropy with the labels,
+    or if distill, KL divergence from the final classifier's (detached) predictions softened by temperature """
+    loss = F.cross_entropy(all_logits[-1], labels)
+    if distill:
+        teacher = F.softmax(all_logits[-1].detach()/temperature, dim=1)
+        for logits in all_logits[:-1]:
+            loss = loss + F.kl_div(F.log_softmax(logits/temperature, dim=1), teacher, \
+                                   reduction="batchmean")*(temperature**2)
+    else:
+        for logits in all_logits[:-1]:
+            loss = loss + F.cross_entropy(logits, labels)
+    return loss
@@ -8,6 +8,8 @@ import os
 import pickle
 import pandas as pd
 from .tokenization_bert import BertTokenizer
+from ....utils.token_store import TokenStoreWriter
+from ....utils.token_cache import TokenizationCache
 import logging
 
 logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
@@ -40,36 +42,31 @@ def filter_tokens(tokens, stopwords):
 def dummy_fun(doc):
     return doc
 
-def preprocess(args):
+def preprocess(args, chunk_size=10000):
+    """ tokenizes train & infer data into token stores train_processed & infer_processed (unpadded token ids, with
+    labels if the data has them), reading the csv files chunk_size rows at a time """
     logger.info("Preprocessing data...")
-    df_train = pd.read_csv(args.train_data)
-    df_test = pd.read_csv(args.infer_data)
-    
     tokenizer = BertTokenizer.from_pretrained('bert-base-uncased', do_lower_case=True)
     tokens_length = args.tokens_length # max tokens length
     
-    logger.info("Tokenizing data...")
-    ### tokenize data for BERT
-    df_train.loc[:, "text"] = df_train["text"].apply(lambda x: tokenizer.tokenize("[CLS] " + x))
-    df_train.loc[:, "text"] = df_train["text"].apply(lambda x: tokenizer.convert_tokens_to_ids(x[:(tokens_length-1)] + ["[SEP]"]))
-    df_test.loc[:, "text"] = df_test["text"].apply(lambda x: tokenizer.tokenize("[CLS] " + x))
-    df_test.loc[:, "text"] = df_test["text"].apply(lambda x: tokenizer.convert_tokens_to_ids(x[:(tokens_length-1)] + ["[SEP]"]))
-    
-    ### fill up reviews with [PAD] if word length less than tokens_length
-    def filler(x, pad=0, length=tokens_length):
-        dum = x
-        while (len(dum) < length):
-            dum.append(pad)
-        return dum
-    
-    logger.info("Padding sequences...")
-    df_train.loc[:, "text"] = df_train["text"].apply(lambda x: filler(x))
-    df_test.loc[:, "text"] = df_test["text"].apply(lambda x: filler(x))
-    df_train.loc[:, "fills"] = df_train["text"].apply(lambda x: x.count(0))
-    df_test.loc[:, "fills"] = df_test["text"].apply(lambda x: x.count(0))
+    ### tokenize data for BERT, batches are padded (or packed) by train_funcs.load_dataloaders
+    ### texts are tokenized in args.num_workers processes, as [CLS] + tokens[:(tokens_length-2)] + [SEP]
+    def encode(texts):
+        return tokenizer.batch_encode(texts, max_length=tokens_length, add_special_tokens=True, \
+                                      num_workers=getattr(args, "num_workers", 1))[0]
     
-    logger.info("Saving..")
-    df_train.to_pickle(os.path.join("./data/", "train_processed.pkl"))
-    df_test.to_pickle(os.path.join("./data/", "infer_processed.pkl"))
+    ### texts tokenized in previous runs are fetched from the tokenization cache
+    cache = TokenizationCache("bert-base-uncased-v%d" % len(tokenizer), tokens_length) if getattr(args, "token_cache", 1) else None
+    for data_path, name in [(args.train_data, "train_processed"), (args.infer_data, "infer_processed")]:
+        logger.info("Tokenizing %s into token store %s..." % (data_path, name))
+        with TokenStoreWriter(name) as writer:
+            for df in pd.read_csv(data_path, chunksize=chunk_size):
+                labels = df["label"] if "label" in df.columns else [None]*len(df)
+                texts = list(df["text"])
+                token_ids = encode(texts) if cache is None else cache.encode_batch(texts, encode)
+                for ids, label in zip(token_ids, labels):
+                    writer.add(ids, label)
+    if cache is not None:
+        cache.close()
     logger.info("Done!")
     
@@ -122,7 +122,7 @@ class BertTokenizer(PreTrainedTokenizer):
 
     def __init__(self, vocab_file, do_lower_case=True, do_basic_tokenize=True, never_split=None,
                  unk_token="[UNK]", sep_token="[SEP]", pad_token="[PAD]", cls_token="[CLS]",
-                 mask_token="[MASK]", tokenize_chinese_chars=True, **kwargs):
+                 mask_token="[MASK]", tokenize_chinese_chars=True, wordpiece_cache_size=100000, **kwargs):
         """Constructs a BertTokenizer.
 
         Args:
@@ -139,6 +139,9 @@ class BertTokenizer(PreTrainedTokenizer):
                 Whether to tokenize Chinese characters.
                 This should likely be deactivated for Japanese:
                 see: https://github.com/huggingface/pytorch-pretrained-BERT/issues/328
+            **wordpiece_cache_size**: (`optional`) int (default 100000)
+                Maximum number of words whose wordpieces are memoized (least recently used words are evicted).
+                None: unbounded, 0: no memoization
         """
         super(BertTokenizer, self).__init__(unk_token=unk_token, sep_token=sep_token,
                                             pad_token=pad_token, cls_token=cls_token,
@@ -158,7 +161,8 @@ class BertTokenizer(PreTrainedTokenizer):
             self.basic_tokenizer = BasicTokenizer(do_lower_case=do_lower_case,
                                                   never_split=never_split,
                                                   tokenize_chinese_chars=tokenize_chinese_chars)
-        self.wordpiece_tokenizer = WordpieceTokenizer(vocab=self.vocab, unk_token=self.unk_token)
+        self.wordpiece_tokenizer = WordpieceTokenizer(vocab=self.vocab, unk_token=self.unk_token,
+                                                      cache_size=wordpiece_cache_size)
 
     @property
     def vocab_size(self):
@@ -358,12 +362,29 @@ class BasicTokenizer(object):
 
 
 class WordpieceTokenizer(object):
-    """Runs WordPiece tokenization."""
+    """Runs WordPiece tokenization.
 
-    def __init__(self, vocab, unk_token, max_input_chars_per_word=100):
+    The wordpieces of each word are memoized in an LRU cache of up to cache_size words (None: unbounded, 0: no
+    memoization), with hit/miss counters (see cache_info). The cache is pickled with the tokenizer, so that
+    worker processes start with the words already seen."""
+
+    def __init__(self, vocab, unk_token, max_input_chars_per_word=100, cache_size=100000):
         self.vocab = vocab
         self.unk_token = unk_token
         self.max_input_chars_per_word = max_input_chars_per_word
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def cache_info(self):
+        """Returns a dict of the word cache hits, misses, hit_rate, size and max_size."""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits/total if total > 0 else 0.0,
+                "size": len(self.cache), "max_size": self.cache_size}
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.hits, self.misses = 0, 0
 
     def tokenize(self, text):
         """Tokenizes a piece of text into its word pieces.
@@ -385,37 +406,52 @@ class WordpieceTokenizer(object):
 
         output_tokens = []
         for token in whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
-                output_tokens.append(self.unk_token)
+            if self.cache_size == 0:
+                output_tokens.extend(self.tokenize_word(token))
                 continue
-
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = "".join(chars[start:end])
-                    if start > 0:
-                        substr = "##" + substr
-                    if substr in self.vocab:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
-                    break
-                sub_tokens.append(cur_substr)
-                start = end
-
-            if is_bad:
-                output_tokens.append(self.unk_token)
+            sub_tokens = self.cache.get(token)
+            if sub_tokens is None:
+                self.misses += 1
+                sub_tokens = self.tokenize_word(token)
+                self.cache[token] = sub_tokens
+                if (self.cache_size is not None) and (len(self.cache) > self.cache_size):
+                    self.cache.popitem(last=False)
             else:
-                output_tokens.extend(sub_tokens)
+                self.hits += 1
+                self.cache.move_to_end(token)
+            output_tokens.extend(sub_tokens)
         return output_tokens
 
+    def tokenize_word(self, token):
+        """Greedy longest-match-first wordpieces of a single token, as a tuple."""
+        chars = list(token)
+        if len(chars) > self.max_input_chars_per_word:
+            return (self.unk_token,)
+
+        is_bad = False
+        start = 0
+        sub_tokens = []
+        while start < len(chars):
+            end = len(chars)
+            cur_substr = None
+            while start < end:
+                substr = "".join(chars[start:end])
+                if start > 0:
+                    substr = "##" + substr
+                if substr in self.vocab:
+                    cur_substr = substr
+                    break
+                end -= 1
+            if cur_substr is None:
+                is_bad = True
+                break
+            sub_tokens.append(cur_substr)
+            start = end
+
+        if is_bad:
+            return (self.unk_token,)
+        return tuple(sub_tokens)
+
 
 def _is_whitespace(char):
     """Checks whether `chars` is a whitespace character."""
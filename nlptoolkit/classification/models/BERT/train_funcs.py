@@ -5,10 +5,13 @@ Created on Thu Aug  1 17:44:38 2019
 @author: WT
 """
 import os
+import numpy as np
 import pandas as pd
 import torch
 from torch.utils.data import Dataset, DataLoader
 from .preprocessing_funcs import preprocess, load_pickle
+from ..batching import BucketBatchSampler, SequenceCollator
+from ....utils.token_store import TokenStore, token_store_exists
 import logging
 from tqdm import tqdm
 
@@ -17,49 +20,46 @@ logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
 logger = logging.getLogger(__file__)
 
 def load_dataloaders(args):
-    train_path = "./data/train_processed.pkl"
-    test_path = "./data/infer_processed.pkl"
-    if os.path.isfile(train_path) and os.path.isfile(test_path):
-        df_train = pd.read_pickle(train_path)
-        df_test = pd.read_pickle(test_path)
-        logger.info("Loaded preprocessed data.")
+    if token_store_exists("train_processed") and token_store_exists("infer_processed"):
+        logger.info("Loading preprocessed data...")
     else:
         logger.info("Preprocessing...")
         preprocess(args)
-        df_train = pd.read_pickle(train_path)
-        df_test = pd.read_pickle(test_path)
-        
-    train_set = sentiments(df_train, tokens_length=args.tokens_length, labels=True)
-    train_loader = DataLoader(train_set, batch_size=args.batch_size, shuffle=True, num_workers=0, pin_memory=False)
+    train_store = TokenStore("train_processed", max_len=args.tokens_length)
+    test_store = TokenStore("infer_processed", max_len=args.tokens_length)
+    
+    train_set = sentiments(train_store, labels=True)
+    # length-bucketed batches, padded to their longest review (or with short reviews packed together)
+    pack_length = args.tokens_length if getattr(args, "pack_sequences", 0) == 1 else None
+    collate_fn = SequenceCollator(pad_left=False, cls_last=False, position_ids=True, pack_length=pack_length)
+    train_sampler = BucketBatchSampler(train_set.lengths, args.batch_size, shuffle=True, pack_length=pack_length)
+    train_loader = DataLoader(train_set, batch_sampler=train_sampler, num_workers=0, pin_memory=False, \
+                              collate_fn=collate_fn)
     if args.train_test_split == 1:
-        test_set = sentiments(df_test, tokens_length=args.tokens_length, labels=True)
+        test_set = sentiments(test_store, labels=True)
     else:
-        test_set = sentiments(df_test, tokens_length=args.tokens_length, labels=False)
-    test_loader = DataLoader(test_set, batch_size=args.batch_size, shuffle=False, num_workers=0, pin_memory=False)
-    del df_train, df_test
+        test_set = sentiments(test_store, labels=False)
+    test_sampler = BucketBatchSampler(test_set.lengths, args.batch_size, shuffle=False)
+    test_loader = DataLoader(test_set, batch_sampler=test_sampler, num_workers=0, pin_memory=False, \
+                             collate_fn=SequenceCollator(pad_left=False, cls_last=False, position_ids=True))
     return train_loader, test_loader, len(train_set)
 
 class sentiments(Dataset):
-    def __init__(self, df, tokens_length=300, labels=True):
-        self.X = torch.tensor(df["text"],requires_grad=False)
+    """ reviews of a TokenStore (unpadded token ids & labels), batches are padded by SequenceCollator """
+    def __init__(self, store, labels=True):
+        self.store = store
+        self.lengths = store.lengths
         self.labels = labels
-        if self.labels == True:
-            self.y = torch.tensor(df["label"],requires_grad=False)
-        self.type = torch.zeros([len(df["text"]), tokens_length], requires_grad=False).long()
-        s = torch.ones([len(df["text"]), tokens_length],requires_grad=False).long()
-        for i in range(len(s)):
-            if df["fills"].loc[i] != 0:
-                s[i, -df["fills"].loc[i]:] = 0
-        self.mask = s
         
     def __len__(self):
-        return len(self.X)
+        return len(self.store)
     
     def __getitem__(self, idx):
+        X, y = self.store[idx]
         if self.labels == True:
-            return self.X[idx], self.type[idx], self.mask[idx], self.y[idx]
+            return X, y
         else:
-            return self.X[idx], self.type[idx], self.mask[idx], 0
+            return X, 0
 
 def load_state(net, optimizer, scheduler, args, load_best=False):
     """ Loads saved model and optimizer states if exists """
@@ -103,11 +103,12 @@ def model_eval(net, test_loader, cuda=None):
     with torch.no_grad():
         net.eval()
         for data in tqdm(test_loader):
-            images, token_type, mask, labels = data
+            images, token_type, mask, labels, extras = data
             if cuda:
                 images, token_type, mask, labels = images.cuda(), token_type.cuda(), mask.cuda(), labels.cuda()
+                extras = {k: v.cuda() for k, v in extras.items()}
             images = images.long(); labels = labels.long()
-            outputs = net(images, token_type_ids=token_type, attention_mask=mask)
+            outputs = net(images, token_type_ids=token_type, attention_mask=mask, **extras)
             _, predicted = torch.max(outputs.data, 1)
             total += labels.size(0)
             correct += (predicted == labels).sum().item()
@@ -122,15 +123,19 @@ def infer(infer_loader, net):
     preds = []
     with torch.no_grad():
         for i, data in tqdm(enumerate(infer_loader, 0), total = len(infer_loader)):
-            inputs, token_type, mask, _ = data
+            inputs, token_type, mask, _, extras = data
             if cuda:
                 inputs, token_type, mask = inputs.cuda(), token_type.cuda(), mask.cuda()
+                extras = {k: v.cuda() for k, v in extras.items()}
             inputs = inputs.long()
-            outputs = net(inputs, token_type_ids=token_type, attention_mask=mask)
+            outputs = net(inputs, token_type_ids=token_type, attention_mask=mask, **extras)
             _, predicted = torch.max(outputs.data, 1)
             predicted = list(predicted.cpu().numpy()) if cuda else list(predicted.numpy())
             preds.extend(predicted)
             
+    # batches are in length order, restore the order of the inference data
+    order = np.concatenate([np.asarray(batch, dtype=np.int64) for batch in infer_loader.batch_sampler])
+    preds = [p for _, p in sorted(zip(order, preds))]
     df_results = pd.DataFrame(columns=["index", "predicted_label"])
     df_results.loc[:, "index"] = [i for i in range(len(preds))]
     df_results.loc[:, "predicted_label"] = preds
@@ -11,7 +11,7 @@ import torch.optim as optim
 from torch.nn.utils import clip_grad_norm_
 from .preprocessing_funcs import save_as_pickle, load_pickle
 from .train_funcs import load_dataloaders, load_state, load_results, model_eval, infer
-from .BERT import BertForSequenceClassification
+from .BERT import BertForSequenceClassification, BertForEarlyExitClassification, early_exit_loss
 import matplotlib.pyplot as plt
 import logging
 
@@ -24,7 +24,11 @@ def train_and_fit(args):
     
     train_loader, test_loader, train_len = load_dataloaders(args)
     
-    net = BertForSequenceClassification.from_pretrained('bert-base-uncased', num_labels=args.num_classes)
+    early_exit = (getattr(args, "early_exit", 0) == 1)
+    if early_exit:
+        net = BertForEarlyExitClassification.from_pretrained('bert-base-uncased', num_labels=args.num_classes)
+    else:
+        net = BertForSequenceClassification.from_pretrained('bert-base-uncased', num_labels=args.num_classes)
     if cuda:
         net.cuda()
     
@@ -38,6 +42,8 @@ def train_and_fit(args):
     
     logger.info("FREEZING MOST HIDDEN LAYERS...")
     unfrozen_layers = ["classifier", "bert.pooler", "bert.encoder.layer.11"]
+    if early_exit:
+        unfrozen_layers.append("exits")
     for name, param in net.named_parameters():
         if not any([layer in name for layer in unfrozen_layers]):
             print("[FROZE]: %s" % name)
@@ -47,8 +53,11 @@ def train_and_fit(args):
             param.requires_grad = True
        
     criterion = nn.CrossEntropyLoss()
+    classifier_params = list(net.classifier.parameters())
+    if early_exit:
+        classifier_params += list(net.exits.parameters())
     optimizer = optim.Adam([{"params":net.bert.parameters(),"lr": 0.0003},\
-                             {"params":net.classifier.parameters(), "lr": args.lr}])
+                             {"params":classifier_params, "lr": args.lr}])
     scheduler = optim.lr_scheduler.MultiStepLR(optimizer, milestones=[2,4,8,12,15,18,20], gamma=0.8)
     
     start_epoch, best_pred = load_state(net, optimizer, scheduler, args, load_best=False)    
@@ -59,12 +68,19 @@ def train_and_fit(args):
     for epoch in range(start_epoch, args.num_epochs):
         net.train(); total_loss = 0.0; losses_per_batch = []
         for i, data in enumerate(train_loader, 0):
-            inputs, token_type, mask, labels = data
+            inputs, token_type, mask, labels, extras = data
             if cuda:
                 inputs, token_type, mask, labels = inputs.cuda(), token_type.cuda(), mask.cuda(), labels.cuda()
+                extras = {k: v.cuda() for k, v in extras.items()}
             inputs = inputs.long(); labels = labels.long()
-            outputs = net(inputs, token_type_ids=token_type, attention_mask=mask)
-            loss = criterion(outputs, labels)
+            if early_exit:
+                # final classifier and exit heads, exits learn from the labels or distill the final classifier
+                outputs = net(inputs, token_type_ids=token_type, attention_mask=mask, all_exits=True, **extras)
+                loss = early_exit_loss(outputs, labels, distill=(getattr(args, "distill", 0) == 1), \
+                                       temperature=getattr(args, "distill_temperature", 2.0))
+            else:
+                outputs = net(inputs, token_type_ids=token_type, attention_mask=mask, **extras)
+                loss = criterion(outputs, labels)
             loss = loss/args.gradient_acc_steps
             loss.backward()
             clip_grad_norm_(net.parameters(), args.max_norm)
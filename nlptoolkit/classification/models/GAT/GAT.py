@@ -1,7 +1,7 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from .layers import GraphAttentionLayer, SpGraphAttentionLayer
+from .layers import GraphAttentionLayer, SpGraphAttentionLayer, SpMultiHeadGraphAttentionLayer
 
 
 class GAT(nn.Module):
@@ -26,28 +26,46 @@ class GAT(nn.Module):
 
 class SpGAT(nn.Module):
     def __init__(self, nfeat, nhid, nclass, dropout, alpha, nheads):
-        """Sparse version of GAT."""
+        """Sparse (edge-list) version of GAT, with all attention heads computed in one layer."""
         super(SpGAT, self).__init__()
         self.dropout = dropout
 
-        self.attentions = [SpGraphAttentionLayer(nfeat, 
-                                                 nhid, 
-                                                 dropout=dropout, 
-                                                 alpha=alpha, 
-                                                 concat=True) for _ in range(nheads)]
-        for i, attention in enumerate(self.attentions):
-            self.add_module('attention_{}'.format(i), attention)
+        self.attentions = SpMultiHeadGraphAttentionLayer(nfeat, 
+                                                         nhid, 
+                                                         nheads, 
+                                                         dropout=dropout, 
+                                                         alpha=alpha, 
+                                                         concat=True)
 
-        self.out_att = SpGraphAttentionLayer(nhid * nheads, 
-                                             nclass, 
-                                             dropout=dropout, 
-                                             alpha=alpha, 
-                                             concat=False)
+        self.out_att = SpMultiHeadGraphAttentionLayer(nhid * nheads, 
+                                                      nclass, 
+                                                      1, 
+                                                      dropout=dropout, 
+                                                      alpha=alpha, 
+                                                      concat=False)
 
-    def forward(self, x, adj):
-        x = F.dropout(x, self.dropout, training=self.training)
-        x = torch.cat([att(x, adj) for att in self.attentions], dim=1)
+    def hidden(self, x, edge_index, nodes=None):
+        # nodes = global ids of sampled subgraph nodes (mini-batch training), whose edges are given by edge_index
+        if (x is None) and (nodes is not None):
+            # identity matrix features of nodes (dropout scales only), their weights are looked up
+            x = F.dropout(torch.ones((len(nodes), 1), device=edge_index.device), self.dropout, training=self.training)
+            return self.attentions(x, edge_index, nodes=nodes)
+        if x is None:
+            # identity matrix features, kept sparse (nfeat = number of nodes)
+            N = self.attentions.in_features
+            idxs = torch.arange(N, device=edge_index.device)
+            x = torch.sparse_coo_tensor(torch.stack((idxs, idxs)), \
+                                        F.dropout(torch.ones(N, device=edge_index.device), self.dropout, training=self.training), \
+                                        torch.Size([N, N]))
+        else:
+            x = F.dropout(x, self.dropout, training=self.training)
+        return self.attentions(x, edge_index)
+
+    def output(self, x, edge_index):
+        # x = outputs of the attention heads layer
         x = F.dropout(x, self.dropout, training=self.training)
-        x = F.elu(self.out_att(x, adj))
+        x = F.elu(self.out_att(x, edge_index))
         return F.log_softmax(x, dim=1)
 
+    def forward(self, x, edge_index, nodes=None):
+        return self.output(self.hidden(x, edge_index, nodes), edge_index)
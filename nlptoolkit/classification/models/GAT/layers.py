@@ -146,3 +146,79 @@ class SpGraphAttentionLayer(nn.Module):
 
     def __repr__(self):
         return self.__class__.__name__ + ' (' + str(self.in_features) + ' -> ' + str(self.out_features) + ')'
+
+
+def segment_softmax(e, index, num_nodes):
+    """ softmax of edge scores e (E x heads) over the edges sharing the same index (destination node) """
+    if hasattr(e, "scatter_reduce"):
+        e_max = e.new_full((num_nodes, e.size(1)), float("-inf"))
+        e_max = e_max.scatter_reduce(0, index.unsqueeze(1).expand_as(e), e, reduce="amax", include_self=True)
+        e = e - e_max[index]
+    else:
+        e = e - e.max(dim=0)[0]
+    e = torch.exp(e)
+    e_sum = e.new_zeros((num_nodes, e.size(1))).index_add_(0, index, e)
+    return e/(e_sum[index] + 1e-16)
+
+
+class SpMultiHeadGraphAttentionLayer(nn.Module):
+    """
+    Edge-list GAT layer computing all attention heads at once, similar to https://arxiv.org/abs/1710.10903
+    Attention scores are computed only for edges (edge_index: 2 x E, rows = destination, cols = source nodes)
+    and normalized with a segment softmax over each destination node's neighbours.
+    """
+
+    def __init__(self, in_features, out_features, nheads, dropout, alpha, concat=True):
+        super(SpMultiHeadGraphAttentionLayer, self).__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.nheads = nheads
+        self.alpha = alpha
+        self.concat = concat
+
+        self.W = nn.Parameter(torch.zeros(size=(in_features, nheads*out_features)))
+        var = 2./(out_features + in_features)
+        self.W.data.normal_(0, var)
+
+        self.a_dst = nn.Parameter(torch.zeros(size=(nheads, out_features)))
+        self.a_src = nn.Parameter(torch.zeros(size=(nheads, out_features)))
+        var2 = 2./(1 + 2*out_features)
+        self.a_dst.data.normal_(0, var2)
+        self.a_src.data.normal_(0, var2)
+
+        self.dropout = nn.Dropout(dropout)
+        self.leakyrelu = nn.LeakyReLU(self.alpha)
+
+    def forward(self, input, edge_index, nodes=None):
+        # input: N x in, dense or sparse; or, if nodes is given, N x 1 scales of the identity (one-hot) features of
+        # nodes, whose rows of W are looked up with sparse gradients
+        if nodes is not None:
+            h = input*F.embedding(nodes, self.W, sparse=True)
+        else:
+            h = torch.sparse.mm(input, self.W) if input.is_sparse else torch.mm(input, self.W)
+        N = h.size(0)
+        h = h.view(N, self.nheads, self.out_features)
+        # h: N x heads x out
+
+        # a^T [h_i || h_j] = a_dst^T h_i + a_src^T h_j
+        e_dst = (h*self.a_dst).sum(dim=-1)
+        e_src = (h*self.a_src).sum(dim=-1)
+        dst, src = edge_index[0], edge_index[1]
+        attention = segment_softmax(self.leakyrelu(e_dst[dst] + e_src[src]), dst, N)
+        attention = self.dropout(attention)
+        # attention: E x heads
+
+        h_prime = h.new_zeros((N, self.nheads, self.out_features))
+        h_prime = h_prime.index_add_(0, dst, attention.unsqueeze(-1)*h[src])
+        # h_prime: N x heads x out
+
+        if self.concat:
+            # if this layer is not last layer,
+            return F.elu(h_prime.view(N, self.nheads*self.out_features))
+        else:
+            # if this layer is last layer,
+            return h_prime.mean(dim=1)
+
+    def __repr__(self):
+        return self.__class__.__name__ + ' (' + str(self.in_features) + ' -> ' + str(self.nheads) + ' x ' + \
+                str(self.out_features) + ')'
@@ -6,14 +6,15 @@ Created on Wed Jul 31 10:44:05 2019
 import os
 import pickle
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
 import nltk
 import numpy as np
-import networkx as nx
-from collections import OrderedDict
-from itertools import combinations
-import math
 from tqdm import tqdm
+import scipy.sparse as sp
+from ..text_graph.graph_builder import build_adjacency, save_text_graph, to_networkx, load_text_graph, \
+                                      save_graph_delta, remove_graph_deltas, save_graph_stats, load_graph_stats
+from ..text_graph.cooccurrence import ppmi_matrix, ppmi_edge_matrix
+from ..text_graph.inductive import tfidf_from_tokens, filter_tokens
+from ..text_graph.parallel import tokenize_corpus, select_vocab, count_corpus
 import logging
 
 logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
@@ -35,44 +36,9 @@ def save_as_pickle(filename, data):
         pickle.dump(data, output)
 
 
-def nCr(n, r):
-    f = math.factorial
-    return int(f(n) / (f(r) * f(n - r)))
-
-
-### remove stopwords and non-words from tokens list
-def filter_tokens(tokens):
-    tokens1 = []
-    for token in tokens:
-        if token not in [".", ",", ";", "&", "'s", ":", "?", "!", "(", ")", "@", \
-                        "'", "'m", "'no", "***", "--", "...", "[", "]", "''"]:
-            tokens1.append(token)
-    return tokens1
-
-
-def dummy_fun(doc):
-    return doc
-
-
-def word_word_edges(p_ij):
-    word_word = []
-    cols = list(p_ij.columns);
-    cols = [str(w) for w in cols]
-    '''
-    # old, inefficient but maybe more instructive code
-    dum = []; counter = 0
-    for w1 in tqdm(cols, total=len(cols)):
-        for w2 in cols:
-            #if (counter % 300000) == 0:
-            #    print("Current Count: %d; %s %s" % (counter, w1, w2))
-            if (w1 != w2) and ((w1,w2) not in dum) and (p_ij.loc[w1,w2] > 0):
-                word_word.append((w1,w2,{"weight":p_ij.loc[w1,w2]})); dum.append((w2,w1))
-            counter += 1
-    '''
-    for w1, w2 in tqdm(combinations(cols, 2), total=nCr(len(cols), 2)):
-        if (p_ij.loc[w1, w2] > 0):
-            word_word.append((w1, w2, {"weight": p_ij.loc[w1, w2]}))
-    return word_word
+def tokenize_text(text):
+    return filter_tokens(text.split())
+
 
 def get_vocab(df):
     vocab = set()
@@ -83,8 +49,15 @@ def get_vocab(df):
     return list(vocab)
 
 
-def generate_text_graph(train_data, infer_data, max_vocab_len, window=10):
-    """ generates graph based on text corpus (columns = (text, label)); window = sliding window size to calculate point-wise mutual information between words """
+def generate_text_graph(train_data, infer_data, max_vocab_len, window=10, use_networkx=False, pmi_threshold=0., \
+                        pmi_top_k=0, min_cooccurrence=1, num_workers=1):
+    """ generates graph based on text corpus (columns = (text, label)); window = sliding window size to calculate point-wise mutual information between words
+    Word-word edges are pruned to PMI > pmi_threshold, co-occurrence count >= min_cooccurrence and each word's top pmi_top_k
+    edges (0: all), and assembled chunk by chunk; a copy is written to text_graph_edges.bin as flat (src, dst, weight)
+    records.
+    Graph is saved as sparse CSR adjacency (text_graph.npz), with its corpus statistics (text_graph_stats.npz) for
+    incremental updates. use_networkx = also pickle it as networkx graph (text_graph.pkl)
+    Tokenizing and counting are sharded across num_workers processes; the graph is identical for any num_workers. """
     logger.info("Preparing data...")
     df = pd.read_csv(train_data)
     infer_idx_start = len(df)
@@ -93,19 +66,11 @@ def generate_text_graph(train_data, infer_data, max_vocab_len, window=10):
 
     ### tokenize & remove funny characters
     # df["text"] = df["text"].apply(lambda x: nltk.word_tokenize(x)).apply(lambda x: filter_tokens(x, stopwords))
-    df["text"] = df["text"].apply(lambda text: text.split()).apply(lambda x: filter_tokens(x))
+    docs, term_counts = tokenize_corpus(df["text"], tokenize_text, num_workers=num_workers)
+    df["text"] = docs
     save_as_pickle("df_data.pkl", df)
-
-    ### Tfidf
-    logger.info("Calculating Tf-idf...")
-    vectorizer = TfidfVectorizer(input="content", max_features=max_vocab_len, tokenizer=dummy_fun,
-                                 preprocessor=dummy_fun)
-    vectorizer.fit(df["text"])
-    df_tfidf = vectorizer.transform(df["text"])
-    df_tfidf = df_tfidf.toarray()
-    vocab = vectorizer.get_feature_names()
-    vocab = np.array(vocab)
-    df_tfidf = pd.DataFrame(df_tfidf, columns=vocab)
+    vocab = select_vocab(term_counts, max_vocab_len) # top max_vocab_len frequency terms, as TfidfVectorizer
+    del term_counts
 
     ### random initialization
     # logger.info("Random initialization...")
@@ -113,65 +78,81 @@ def generate_text_graph(train_data, infer_data, max_vocab_len, window=10):
     # word_vectors = np.random.uniform(0.01, 3.01, (len(df), len(vocab)))
     # df_tfidf = pd.DataFrame(word_vectors, columns=vocab)
 
-    ### Build graph
-    logger.info("Building graph (No. of document, word nodes: %d, %d)..." % (len(df_tfidf.index), len(vocab)))
-    G = nx.Graph()
-    logger.info("Adding document nodes to graph...")
-    G.add_nodes_from(df_tfidf.index)  ## document nodes
-    logger.info("Adding word nodes to graph...")
-    G.add_nodes_from(vocab)  ## word nodes
-    ### build edges between document-word pairs
-    logger.info("Building document-word edges...")
-    document_word = [(doc, w, {"weight": round(df_tfidf.loc[doc, w],  3)}) for doc in
-                     tqdm(df_tfidf.index, total=len(df_tfidf.index)) \
-                     for w in df_tfidf.columns]
-    G.add_edges_from(document_word)
-    del df_tfidf, document_word
-
     ### PMI between words
-    names = vocab
-    n_i = OrderedDict((name, 0) for name in names)
-    word2index = OrderedDict((name, index) for index, name in enumerate(names))
-
-    occurrences = np.zeros((len(names), len(names)), dtype=np.int32)
-    # Find the co-occurrences:
-    no_windows = 0;
     logger.info("Calculating co-occurences...")
-    for l in tqdm(df["text"], total=len(df["text"])):
-        for i in range(len(l) - window):
-            no_windows += 1
-            d = set(l[i:(i + window)])
-            d = list(d)
-            d = [w for w in d if w in names]
-
-            for w in d:
-                n_i[w] += 1
-            for w1, w2 in combinations(d, 2):
-                i1 = word2index[w1]
-                i2 = word2index[w2]
-
-                occurrences[i1][i2] += 1
-                occurrences[i2][i1] += 1
+    tokens, offsets, occurrences, n_i, no_windows, doc_freq = count_corpus(docs, vocab, window=window, \
+                                                                           num_workers=num_workers)
+    del docs
+    save_graph_stats("text_graph_stats.npz", occurrences, n_i, no_windows, doc_freq, len(df), window)
+
+    ### Tfidf
+    logger.info("Calculating Tf-idf...")
+    idf = np.log((1 + len(df))/(1 + doc_freq.astype(np.float64))) + 1 # smooth idf, as TfidfVectorizer
+    df_tfidf = tfidf_from_tokens(tokens, offsets, idf) # sparse (n_docs X n_vocab), zero weights are not stored
+    del tokens, offsets
 
     logger.info("Calculating PMI*...")
-    ### convert to PMI
-    occurrences = occurrences / no_windows
-    p_ij = pd.DataFrame(occurrences, index=names, columns=names)
-    p_i = pd.Series(n_i, index=n_i.keys()) / no_windows
-
-    del occurrences
-    del n_i
-    for col in p_ij.columns:
-        p_ij[col] = p_ij[col] / p_i[col]
-    for row in p_ij.index:
-        p_ij.loc[row, :] = p_ij.loc[row, :] / p_i[row]
-    p_ij = p_ij + 1E-9
-    for col in p_ij.columns:
-        p_ij[col] = p_ij[col].apply(lambda x: math.log(x))
-
-    logger.info("Building word-word edges...")
-    word_word = word_word_edges(p_ij)
-    save_as_pickle("word_word_edges.pkl", word_word)
-    G.add_edges_from(word_word)
-    save_as_pickle("text_graph.pkl", {"graph": G, "infer_idx_start": infer_idx_start})
-    logger.info("Done and saved!")
\ No newline at end of file
+    word_word, no_edges = ppmi_edge_matrix(occurrences, n_i, no_windows, threshold=pmi_threshold, \
+                                           min_count=min_cooccurrence, top_k=pmi_top_k, \
+                                           filename="text_graph_edges.bin")
+    del occurrences, n_i
+    logger.info("Kept %d word-word PMI edges." % no_edges)
+
+    ### Build graph
+    logger.info("Building graph (No. of document, word nodes: %d, %d)..." % (df_tfidf.shape[0], len(vocab)))
+    A = build_adjacency(df_tfidf, word_word)
+    save_text_graph("text_graph.npz", A, infer_idx_start, vocab, idf=idf)
+    remove_graph_deltas("text_graph.npz")
+    if use_networkx:
+        logger.info("Converting to networkx graph...")
+        G = to_networkx(A, vocab)
+        save_as_pickle("text_graph.pkl", {"graph": G, "infer_idx_start": infer_idx_start})
+    logger.info("Done and saved!")
+
+
+def update_text_graph(new_data, pmi_threshold=0., pmi_top_k=0, min_cooccurrence=1, num_workers=1):
+    """ appends labelled documents (csv columns = (text, label)) to the existing text graph, without rebuilding it
+    Saved co-occurrence counts, window totals & document frequencies are updated, then only the PMI edges of words
+    occurring in the new documents and the Tf-idf rows of the new documents are computed. These are saved as a delta
+    graph (text_graph_delta_<k>.npz, df_data_delta_<k>.pkl), which is merged into the graph by load_text_graph.
+    New document nodes come after all existing nodes, so previous node ids are unchanged and a saved checkpoint is
+    extended with rows for the new nodes when training resumes (load_state).
+    Vocab is kept fixed; edges between words not in the new documents and Tf-idf rows of previous documents keep
+    their previous weights until the graph is rebuilt with generate_text_graph. PMI edges are pruned as in
+    generate_text_graph, with top-k ranks of words not in the new documents taken over their edges to affected words only. """
+    logger.info("Preparing appended data...")
+    df = pd.read_csv(new_data)
+    df.dropna(inplace=True)
+    docs, _ = tokenize_corpus(df["text"], tokenize_text, num_workers=num_workers)
+    df["text"] = docs
+    vocab = load_text_graph("text_graph.npz", merge_deltas=False)["vocab"]
+    stats = load_graph_stats("text_graph_stats.npz")
+
+    logger.info("Updating co-occurences...")
+    tokens, offsets, occurrences, n_i, no_windows, doc_freq = count_corpus(docs, vocab, window=stats["window"], \
+                                                                           num_workers=num_workers)
+    occurrences = stats["occurrences"] + occurrences
+    stats["n_i"] = stats["n_i"] + n_i; stats["no_windows"] += no_windows
+    stats["doc_freq"] = stats["doc_freq"] + doc_freq
+    stats["n_docs"] += len(df)
+
+    logger.info("Updating Tf-idf...")
+    idf = np.log((1 + stats["n_docs"])/(1 + stats["doc_freq"].astype(np.float64))) + 1 # smooth idf, as TfidfVectorizer
+    doc_word = tfidf_from_tokens(tokens, offsets, idf)
+    del tokens, offsets
+
+    affected = np.flatnonzero(n_i > 0)
+    logger.info("Updating PMI* of %d affected words..." % len(affected))
+    is_affected = np.zeros(len(vocab), dtype=bool); is_affected[affected] = True
+    occ = occurrences.tocoo()
+    keep = is_affected[occ.row] | is_affected[occ.col]
+    word_word = ppmi_matrix(sp.csr_matrix((occ.data[keep], (occ.row[keep], occ.col[keep])), shape=occ.shape), \
+                            stats["n_i"], stats["no_windows"], threshold=pmi_threshold, min_count=min_cooccurrence, \
+                            top_k=pmi_top_k)
+    del occ
+
+    idx = save_graph_delta("text_graph.npz", doc_word, word_word, affected, idf)
+    save_as_pickle("df_data_delta_%d.pkl" % idx, df)
+    save_graph_stats("text_graph_stats.npz", occurrences, stats["n_i"], stats["no_windows"], stats["doc_freq"], \
+                     stats["n_docs"], stats["window"])
+    logger.info("Appended %d documents as delta graph %d, done and saved!" % (len(df), idx))
@@ -5,9 +5,12 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
-from .train_funcs import load_datasets, load_state, load_results, evaluate, infer
+from .train_funcs import load_datasets, load_state, load_results, evaluate, infer, batched_forward
 from .GAT import GAT, SpGAT
 from .preprocessing_funcs import load_pickle, save_as_pickle
+from ..text_graph.graph_builder import to_edge_index
+from ..text_graph.sampler import NeighborSampler
+from ..text_graph.optimizer import DenseSparseAdam
 import matplotlib.pyplot as plt
 import logging
 from sklearn.metrics import *
@@ -29,60 +32,100 @@ def metrics(output, labels_e):
         return (recall, precision, f1)
 
 
-def train_and_fit(args, sparse=True):
+def train_and_fit(args, sparse=None):
+    """ sparse: edge-list (sparse) GAT if True, dense GAT if False, defaults to args.gat_sparse """
     cuda = torch.cuda.is_available() and args.use_cuda
+    if sparse is None:
+        sparse = (args.gat_sparse == 1)
+    if (args.graph_batch == 1) and not sparse:
+        logger.info("Mini-batch training is only supported by sparse GAT, using sparse GAT.")
+        sparse = True
     
-    f, X, A_hat, selected, labels_selected, labels_not_selected, test_idxs = load_datasets(args, train_test_split=args.train_test_split)
+    A_hat, selected, labels_selected, labels_not_selected, test_idxs = load_datasets(args, train_test_split=args.train_test_split)
     targets = torch.tensor(labels_selected).long()
-    A_hat = torch.tensor(A_hat)
+    N = A_hat.shape[0]
+    A_hat_sp = A_hat
     
     if sparse:
-        net = SpGAT(nfeat=X.shape[1], 
+        f = None # identity matrix features, built sparsely inside SpGAT
+        # 2 x E edges, including self-loops; mini-batches only need the sampled subgraphs
+        A_hat = to_edge_index(A_hat) if args.graph_batch != 1 else None
+        net = SpGAT(nfeat=N, 
                     nhid=args.hidden, 
                     nclass=args.num_classes, 
                     dropout=0.1, 
                     nheads=args.nb_heads, 
                     alpha=0.2)
     else:
-        net = GAT(nfeat=X.shape[1], 
+        f = torch.eye(N)
+        A_hat = torch.from_numpy(A_hat.toarray())
+        net = GAT(nfeat=N, 
                     nhid=args.hidden, 
                     nclass=args.num_classes, 
                     dropout=0.1, 
                     nheads=args.nb_heads, 
                     alpha=0.2)
-    del X
     
     criterion = F.nll_loss #nn.CrossEntropyLoss()
-    optimizer = optim.Adam(net.parameters(), lr=args.lr)
+    # mini-batches only update the first layer weights of their sampled nodes
+    Optimizer = DenseSparseAdam if args.graph_batch == 1 else optim.Adam
+    optimizer = Optimizer(net.parameters(), lr=args.lr)
     scheduler = optim.lr_scheduler.MultiStepLR(optimizer, milestones=[1000,2000,3000,4000,5000,6000], gamma=0.77)
     
-    start_epoch, best_pred = load_state(net, optimizer, scheduler, model_no=args.model_no, load_best=False)
+    start_epoch, best_pred = load_state(net, optimizer, scheduler, model_no=args.model_no, load_best=False, \
+                                        n_nodes=N)
     losses_per_epoch, evaluation_trained, evaluation_untrained = load_results(model_no=args.model_no)
     
     if cuda:
         net.cuda()
-        optimizer = optim.Adam(net.parameters(), lr=args.lr)
-        f = f.cuda(); A_hat = A_hat.cuda()
+        optimizer = Optimizer(net.parameters(), lr=args.lr)
+        if A_hat is not None:
+            A_hat = A_hat.cuda()
+        if f is not None:
+            f = f.cuda()
         targets = targets.cuda()
         
+    if args.graph_batch == 1:
+        logger.info("Mini-batch training over sampled %d-neighbour neighbourhoods..." % args.fanout)
+        sampler = NeighborSampler(A_hat_sp, [args.fanout]*2, selected, args.batch_size, shuffle=True)
+        
     logger.info("Starting training process...")
     net.train()
     save_step = 5
     for e in range(start_epoch, args.num_epochs):
-        optimizer.zero_grad()
-        output = net(f, A_hat)
-        loss = criterion(output[selected], targets)
-        losses_per_epoch.append(loss.item())
-        loss.backward()
-        optimizer.step()
+        if args.graph_batch == 1:
+            total_loss = 0.0
+            for batch, nodes, sub_adj in sampler:
+                batch, nodes, edge_index = torch.from_numpy(batch), torch.from_numpy(nodes), to_edge_index(sub_adj)
+                if cuda:
+                    batch, nodes, edge_index = batch.cuda(), nodes.cuda(), edge_index.cuda()
+                optimizer.zero_grad()
+                output = net(None, edge_index, nodes=nodes)
+                loss = criterion(output[:len(batch)], targets[batch])
+                loss.backward()
+                optimizer.step()
+                total_loss += loss.item()*len(batch)
+            losses_per_epoch.append(total_loss/len(selected))
+        else:
+            optimizer.zero_grad()
+            output = net(f, A_hat)
+            loss = criterion(output[selected], targets)
+            losses_per_epoch.append(loss.item())
+            loss.backward()
+            optimizer.step()
         
         if e % save_step == 0:
             ### Evaluate other untrained nodes and check accuracy of labelling
             net.eval()
             with torch.no_grad():
-                pred_labels = net(f, A_hat)
-                train_metrics = metrics(pred_labels[selected], labels_selected); untrained_metrics = metrics(pred_labels[test_idxs], labels_not_selected)
-                trained_accuracy = evaluate(pred_labels[selected], labels_selected); untrained_accuracy = evaluate(pred_labels[test_idxs], labels_not_selected)
+                if args.graph_batch == 1:
+                    pred_selected = batched_forward(net, A_hat_sp, selected, args, cuda=cuda)
+                    pred_not_selected = batched_forward(net, A_hat_sp, test_idxs, args, cuda=cuda)
+                else:
+                    pred_labels = net(f, A_hat)
+                    pred_selected, pred_not_selected = pred_labels[selected], pred_labels[test_idxs]
+                train_metrics = metrics(pred_selected, labels_selected); untrained_metrics = metrics(pred_not_selected, labels_not_selected)
+                trained_accuracy = evaluate(pred_selected, labels_selected); untrained_accuracy = evaluate(pred_not_selected, labels_not_selected)
             evaluation_trained.append((e, trained_accuracy)); evaluation_untrained.append((e, untrained_accuracy))
             print("[Epoch %d]: Loss: %.7f" % (e, losses_per_epoch[-1]))
             print("Evaluation accuracy of trained nodes: %.7f" % (trained_accuracy))
@@ -90,7 +133,7 @@ def train_and_fit(args, sparse=True):
             print("Evaluation accuracy of test nodes: %.7f" % (
                 untrained_accuracy))
             print("Evaluation recall, precision, f1-score of test nodes: {:.3f}, {:.3f}, {:.3f}".format(untrained_metrics[0], untrained_metrics[1], untrained_metrics[2]))
-            print("Labels of trained nodes: \n", output[selected].max(1)[1])
+            print("Labels of trained nodes: \n", pred_selected.max(1)[1])
             net.train()
             if trained_accuracy > best_pred:
                 best_pred = trained_accuracy
@@ -160,6 +203,9 @@ def train_and_fit(args, sparse=True):
         ax.legend(fontsize=20)
         plt.savefig(os.path.join("./data/", "combined_plot_accuracy_vs_epoch_%d.png" % args.model_no))
     
-    infer(f, test_idxs, net, A_hat)
+    if args.graph_batch == 1:
+        infer(f, test_idxs, net, A_hat, A_hat=A_hat_sp, args=args)
+    else:
+        infer(f, test_idxs, net, A_hat)
     
     return net
\ No newline at end of file
@@ -7,14 +7,17 @@ Created on Wed Jul  3 10:58:01 2019
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from ..text_graph.graph_builder import to_torch_sparse
 
 class gcn(nn.Module):
-    def __init__(self, X_size, A_hat, cuda, args, bias=True): # X_size = num features
+    def __init__(self, X_size, A_hat, cuda, args, bias=True): # X_size = num features, A_hat = scipy sparse
+        # A_hat = None if the graph is only given per forward pass (mini-batch training, inductive inference)
         super(gcn, self).__init__()
-        self.A_hat = torch.tensor(A_hat, requires_grad=False).float()
-        if cuda:
+        self.A_hat = to_torch_sparse(A_hat) if A_hat is not None else None
+        if cuda and (self.A_hat is not None):
             self.A_hat = self.A_hat.cuda()
-        self.weight = nn.parameter.Parameter(torch.zeros(size=(X_size, args.hidden_size_1)))
+        # first layer weights of identity features = node embeddings, looked up by node id with sparse gradients
+        self.embedding = nn.Embedding(X_size, args.hidden_size_1, sparse=True)
         var = 2./(self.weight.size(1) + self.weight.size(0))
         self.weight.data.normal_(0, var)
         self.weight2 = nn.parameter.Parameter(torch.zeros(size=(args.hidden_size_1, args.hidden_size_2)))
@@ -28,14 +31,38 @@ class gcn(nn.Module):
         else:
             self.register_parameter("bias", None)
         self.fc1 = nn.Linear(args.hidden_size_2, args.num_classes)
+    
+    @property
+    def weight(self):
+        return self.embedding.weight
+    
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        if (prefix + "weight") in state_dict: # saved before the first layer weights were an embedding
+            state_dict[prefix + "embedding.weight"] = state_dict.pop(prefix + "weight")
+        super(gcn, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
         
-    def forward(self, X): ### 2-layer GCN architecture
-        X = torch.mm(X, self.weight)
+    def hidden(self, X=None, A_hat=None, nodes=None): ### first GCN layer; X = None for identity matrix features
+        # A_hat, nodes = sampled subgraph adjacency (torch sparse) and its global node ids, for mini-batch training
+        if A_hat is None:
+            A_hat = self.A_hat
+        if X is None:
+            X = self.weight if nodes is None else self.embedding(nodes) # I@W = W, identity features are never materialized
+        elif X.is_sparse:
+            X = torch.sparse.mm(X, self.weight)
+        else:
+            X = torch.mm(X, self.weight)
         if self.bias is not None:
             X = (X + self.bias)
-        X = F.relu(torch.mm(self.A_hat, X))
+        return F.relu(torch.sparse.mm(A_hat, X))
+    
+    def output(self, X, A_hat=None): ### second GCN layer and classifier, from first layer outputs X
+        if A_hat is None:
+            A_hat = self.A_hat
         X = torch.mm(X, self.weight2)
         if self.bias2 is not None:
             X = (X + self.bias2)
-        X = F.relu(torch.mm(self.A_hat, X))
-        return self.fc1(X)
\ No newline at end of file
+        X = F.relu(torch.sparse.mm(A_hat, X))
+        return self.fc1(X)
+        
+    def forward(self, X=None, A_hat=None, nodes=None): ### 2-layer GCN architecture
+        return self.output(self.hidden(X, A_hat, nodes), A_hat)
\ No newline at end of file
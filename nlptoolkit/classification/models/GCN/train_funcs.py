@@ -5,11 +5,13 @@ Created on Wed Jul 31 10:44:05 2019
 @author: WT
 """
 import os
-import networkx as nx
 import numpy as np
 import pandas as pd
 import torch
 from .preprocessing_funcs import load_pickle, save_as_pickle, generate_text_graph
+from ..text_graph.graph_builder import load_text_graph, normalize_adjacency, save_node_split, load_node_split, to_torch_sparse, \
+                                     document_nodes, extend_node_rows
+from ..text_graph.sampler import NeighborSampler
 import logging
 
 logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
@@ -20,77 +22,73 @@ logger = logging.getLogger(__file__)
 def load_datasets(args, train_test_split=0):
     """Loads dataset and graph if exists, else create and process them from raw data
     Returns --->
-    f: torch tensor input of GCN (Identity matrix)
-    X: input of GCN (Identity matrix)
-    A_hat: transformed adjacency matrix A
+    A_hat: transformed adjacency matrix A (scipy sparse); node features are implicitly the identity matrix
     selected: indexes of selected labelled nodes for training
     test_idxs: indexes of not-selected nodes for inference/testing
     labels_selected: labels of selected labelled nodes for training
     labels_not_selected: labels of not-selected labelled nodes for inference/testing
+    (split arrays are int64 arrays memory-mapped from ./data/*.npy, cached across restarts)
     """
     logger.info("Loading data...")
     df_data_path = "./data/df_data.pkl"
-    graph_path = "./data/text_graph.pkl"
+    graph_path = "./data/text_graph.npz"
     if not os.path.isfile(df_data_path) or not os.path.isfile(graph_path):
         logger.info("Building datasets and graph from raw data... Note this will take quite a while...")
-        generate_text_graph(args.train_data, args.infer_data, args.max_vocab_len)
+        generate_text_graph(args.train_data, args.infer_data, args.max_vocab_len, pmi_threshold=args.pmi_threshold, \
+                            pmi_top_k=args.pmi_top_k, min_cooccurrence=args.min_cooccurrence, \
+                            num_workers=args.num_workers)
     df_data = load_pickle("df_data.pkl")
-    G_dict = load_pickle("text_graph.pkl")
-    G = G_dict["graph"]
-    infer_idx_start = G_dict["infer_idx_start"]
+    G_dict = load_text_graph("text_graph.npz")
+    A = G_dict["adj"]
+    infer_idx_start, n_docs = G_dict["infer_idx_start"], G_dict["n_docs"]
+    if G_dict["n_deltas"] > 0:
+        logger.info("Merging %d appended document batches..." % G_dict["n_deltas"])
+        df_deltas = [load_pickle("df_data_delta_%d.pkl" % idx) for idx in range(G_dict["n_deltas"])]
+        df_data = pd.concat([df_data] + df_deltas, ignore_index=True) # appended labelled documents, after all nodes
+    doc_nodes = document_nodes(n_docs, len(G_dict["vocab"]), A.shape[0]) # row of df_data ---> graph node id
     del G_dict
     
-    logger.info("Building adjacency and degree matrices...")
-    A = nx.to_numpy_matrix(G, weight="weight"); A = A + np.eye(G.number_of_nodes())
-    degrees = []
-    for d in G.degree(weight=None):
-        if d == 0:
-            degrees.append(0)
-        else:
-            degrees.append(d[1]**(-0.5))
-    degrees = np.diag(degrees)
-    X = np.eye(G.number_of_nodes()) # Features are just identity matrix
-    A_hat = degrees@A@degrees
-    f = X # (n X n) X (n X n) x (n X n) X (n X n) input of net
-    
-    if train_test_split == 1:
-        logger.info("Splitting labels for training and inferring...")
-        ### stratified test samples
-        test_idxs = []
-        for b_id in df_data["label"].unique():
-            dum = df_data[df_data["label"] == b_id]
-            if len(dum) >= 4:
-                test_idxs.extend(list(np.random.choice(dum.index, size=round(args.test_ratio*len(dum)), replace=False)))
-        save_as_pickle("test_idxs.pkl", test_idxs)
-        # select only certain labelled nodes for semi-supervised GCN
-        selected = []
-        for i in range(len(df_data)):
-            if i not in test_idxs:
-                selected.append(i)
-        save_as_pickle("selected.pkl", selected)
-    else:
-        logger.info("Preparing training labels...")
-        test_idxs = [i for i in range(infer_idx_start, len(df_data))]
-        selected = [i for i in range(infer_idx_start)]
-        save_as_pickle("selected.pkl", selected)
-        save_as_pickle("test_idxs.pkl", test_idxs)
+    logger.info("Building normalized adjacency matrix...")
+    A_hat = normalize_adjacency(A) # (n X n) sparse
+    del A
     
-    f_selected = f[selected]; f_selected = torch.from_numpy(f_selected).float()
-    f_not_selected = f[test_idxs]; f_not_selected = torch.from_numpy(f_not_selected).float()
-    labels_selected = list(df_data.loc[selected]['label'])
-    if train_test_split == 1:    
-        labels_not_selected = list(df_data.loc[test_idxs]['label'])
+    # cached split is reused as long as graph and split settings are unchanged
+    key = [A_hat.shape[0], A_hat.nnz, infer_idx_start, train_test_split, args.test_ratio if train_test_split == 1 else 0]
+    split = load_node_split(key)
+    if split is not None:
+        logger.info("Loaded cached labels split.")
     else:
-        labels_not_selected = []
-        
-    f = torch.from_numpy(f).float()
-    save_as_pickle("labels_selected.pkl", labels_selected)
-    save_as_pickle("labels_not_selected.pkl", labels_not_selected)
+        if train_test_split == 1:
+            logger.info("Splitting labels for training and inferring...")
+            labels = df_data["label"].values
+            ### stratified test samples
+            test_idxs = []
+            for b_id in np.unique(labels):
+                dum = np.flatnonzero(labels == b_id)
+                if len(dum) >= 4:
+                    test_idxs.append(np.random.choice(dum, size=round(args.test_ratio*len(dum)), replace=False))
+            test_idxs = np.sort(np.concatenate(test_idxs)) if len(test_idxs) > 0 else np.zeros(0, dtype=np.int64)
+            # select only certain labelled nodes for semi-supervised GCN
+            is_test = np.zeros(len(df_data), dtype=bool); is_test[test_idxs] = True
+            selected = np.flatnonzero(~is_test)
+            split = {"selected": doc_nodes[selected], "test_idxs": doc_nodes[test_idxs], \
+                     "labels_selected": labels[selected], "labels_not_selected": labels[test_idxs]}
+        else:
+            logger.info("Preparing training labels...")
+            # training documents, then appended ones (labelled); infer documents are the rest of the base documents
+            selected = np.concatenate((np.arange(infer_idx_start), np.arange(n_docs, len(df_data))))
+            split = {"selected": doc_nodes[selected], "test_idxs": np.arange(infer_idx_start, n_docs), \
+                     "labels_selected": df_data["label"].values[selected], "labels_not_selected": []}
+        save_node_split(split, key)
+        split = load_node_split(key)
+    selected, test_idxs = split["selected"], split["test_idxs"]
+    labels_selected, labels_not_selected = split["labels_selected"], split["labels_not_selected"]
     logger.info("Split into %d train and %d test lebels." % (len(labels_selected), len(labels_not_selected)))
-    return f, X, A_hat, selected, labels_selected, labels_not_selected, test_idxs
+    return A_hat, selected, labels_selected, labels_not_selected, test_idxs
     
-def load_state(net, optimizer, scheduler, model_no=0, load_best=False):
-    """ Loads saved model and optimizer states if exists """
+def load_state(net, optimizer, scheduler, model_no=0, load_best=False, n_nodes=None):
+    """ Loads saved model and optimizer states if exists. With n_nodes (text graph nodes), a checkpoint saved before
+    documents were appended to the graph is extended to the new nodes (see extend_node_rows) """
     logger.info("Initializing model and optimizer states...")
     base_path = "./data/"
     checkpoint_path = os.path.join(base_path,"test_checkpoint_%d.pth.tar" % model_no)
@@ -105,9 +103,16 @@ def load_state(net, optimizer, scheduler, model_no=0, load_best=False):
     if checkpoint != None:
         start_epoch = checkpoint['epoch']
         best_pred = checkpoint['best_acc']
+        if n_nodes is not None:
+            extended = extend_node_rows(checkpoint, net, n_nodes)
+            if len(extended) > 0:
+                logger.info("Extended %s of checkpoint to the %d nodes of appended text graph." % \
+                            (", ".join(extended), n_nodes))
         net.load_state_dict(checkpoint['state_dict'])
-        optimizer.load_state_dict(checkpoint['optimizer'])
-        scheduler.load_state_dict(checkpoint['scheduler'])
+        if optimizer is not None:
+            optimizer.load_state_dict(checkpoint['optimizer'])
+        if scheduler is not None:
+            scheduler.load_state_dict(checkpoint['scheduler'])
         logger.info("Loaded model and optimizer.")    
     return start_epoch, best_pred
 
@@ -132,15 +137,30 @@ def evaluate(output, labels_e):
         _, labels = output.max(1); labels = labels.cpu().numpy() if labels.is_cuda else labels.numpy()
         return sum([(e) for e in labels_e] == labels)/len(labels)
 
-def infer(f, test_idxs, net):
+def batched_forward(net, A_hat, nodes, args, cuda=False):
+    """ net outputs of nodes, computed over sampled neighbourhoods (args.fanout per hop) in batches of args.batch_size """
+    sampler = NeighborSampler(A_hat, [args.fanout]*2, nodes, args.batch_size, shuffle=False)
+    outputs = [torch.zeros((0, args.num_classes), device="cuda" if cuda else "cpu")]
+    for batch, sub_nodes, sub_adj in sampler:
+        sub_adj, sub_nodes = to_torch_sparse(sub_adj), torch.from_numpy(sub_nodes)
+        if cuda:
+            sub_adj, sub_nodes = sub_adj.cuda(), sub_nodes.cuda()
+        outputs.append(net(A_hat=sub_adj, nodes=sub_nodes)[:len(batch)])
+    return torch.cat(outputs, dim=0)
+
+def infer(test_idxs, net, A_hat=None, args=None):
+    """ A_hat, args given: infer over sampled neighbourhoods in mini-batches, else full-batch over whole graph """
     logger.info("Evaluating on inference data...")
     net.eval()
     with torch.no_grad():
-        pred_labels = net(f)
+        if A_hat is not None:
+            pred_labels = batched_forward(net, A_hat, test_idxs, args, cuda=next(net.parameters()).is_cuda)
+        else:
+            pred_labels = net()[test_idxs]
     if pred_labels.is_cuda:
-        pred_labels = list(pred_labels[test_idxs].max(1)[1].cpu().numpy())
+        pred_labels = list(pred_labels.max(1)[1].cpu().numpy())
     else:
-        pred_labels = list(pred_labels[test_idxs].max(1)[1].numpy())
+        pred_labels = list(pred_labels.max(1)[1].numpy())
     pred_labels = [i for i in pred_labels]
     test_idxs = [i - test_idxs[0] for i in test_idxs]
     df_results = pd.DataFrame(columns=["index", "predicted_label"])
@@ -4,7 +4,10 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from .train_funcs import load_datasets, load_state, load_results, evaluate, infer
+from .train_funcs import load_datasets, load_state, load_results, evaluate, infer, batched_forward
+from ..text_graph.graph_builder import to_torch_sparse
+from ..text_graph.sampler import NeighborSampler
+from ..text_graph.optimizer import DenseSparseAdam
 from .GCN import gcn
 from .preprocessing_funcs import load_pickle, save_as_pickle
 import matplotlib.pyplot as plt
@@ -31,43 +34,68 @@ def metrics(output, labels_e):
 def train_and_fit(args):
     cuda = torch.cuda.is_available()
 
-    f, X, A_hat, selected, labels_selected, labels_not_selected, test_idxs = load_datasets(args,
-                                                                                           train_test_split=args.train_test_split)
+    A_hat, selected, labels_selected, labels_not_selected, test_idxs = load_datasets(args,
+                                                                                     train_test_split=args.train_test_split)
     targets = torch.tensor(labels_selected).long()
     # print(labels_selected, labels_not_selected)
-    net = gcn(X.shape[1], A_hat, cuda, args)
+    # mini-batches only need the sampled subgraphs, and only update the embeddings of their sampled nodes
+    net = gcn(A_hat.shape[0], None if args.graph_batch == 1 else A_hat, cuda, args)
+    Optimizer = DenseSparseAdam if args.graph_batch == 1 else optim.Adam
     criterion = nn.CrossEntropyLoss()
-    optimizer = optim.Adam(net.parameters(), lr=args.lr)
+    optimizer = Optimizer(net.parameters(), lr=args.lr)
     scheduler = optim.lr_scheduler.MultiStepLR(optimizer, milestones=[1000, 2000, 3000, 4000, 5000, 6000], gamma=0.77)
 
-    start_epoch, best_pred = load_state(net, optimizer, scheduler, model_no=args.model_no, load_best=False)
+    start_epoch, best_pred = load_state(net, optimizer, scheduler, model_no=args.model_no, load_best=False, \
+                                        n_nodes=A_hat.shape[0])
     losses_per_epoch, evaluation_trained, evaluation_untrained = load_results(model_no=args.model_no)
 
     if cuda:
         net.cuda()
-        optimizer = optim.Adam(net.parameters(), lr=args.lr)
-        f = f.cuda()
+        optimizer = Optimizer(net.parameters(), lr=args.lr)
         targets = targets.cuda()
 
+    if args.graph_batch == 1:
+        logger.info("Mini-batch training over sampled %d-neighbour neighbourhoods..." % args.fanout)
+        sampler = NeighborSampler(A_hat, [args.fanout]*2, selected, args.batch_size, shuffle=True)
+
     logger.info("Starting training process...")
     net.train()
     for e in range(start_epoch, args.num_epochs):
-        optimizer.zero_grad()
-        output = net(f)
-        loss = criterion(output[selected], targets)
-        losses_per_epoch.append(loss.item())
-        loss.backward()
-        optimizer.step()
+        if args.graph_batch == 1:
+            total_loss = 0.0
+            for batch, nodes, sub_adj in sampler:
+                batch, nodes, sub_adj = torch.from_numpy(batch), torch.from_numpy(nodes), to_torch_sparse(sub_adj)
+                if cuda:
+                    batch, nodes, sub_adj = batch.cuda(), nodes.cuda(), sub_adj.cuda()
+                optimizer.zero_grad()
+                output = net(A_hat=sub_adj, nodes=nodes)
+                loss = criterion(output[:len(batch)], targets[batch])
+                loss.backward()
+                optimizer.step()
+                total_loss += loss.item()*len(batch)
+            losses_per_epoch.append(total_loss/len(selected))
+        else:
+            optimizer.zero_grad()
+            output = net()
+            loss = criterion(output[selected], targets)
+            losses_per_epoch.append(loss.item())
+            loss.backward()
+            optimizer.step()
         if e % 50 == 0:
             # print(output[selected]); print(targets)
             ### Evaluate other untrained nodes and check accuracy of labelling
             net.eval()
             with torch.no_grad():
-                pred_labels = net(f)
-                train_metrics = metrics(pred_labels[selected], labels_selected);
-                untrained_metrics = metrics(pred_labels[test_idxs], labels_not_selected)
-                trained_accuracy = evaluate(pred_labels[selected], labels_selected);
-                untrained_accuracy = evaluate(pred_labels[test_idxs], labels_not_selected)
+                if args.graph_batch == 1:
+                    pred_selected = batched_forward(net, A_hat, selected, args, cuda=cuda)
+                    pred_not_selected = batched_forward(net, A_hat, test_idxs, args, cuda=cuda)
+                else:
+                    pred_labels = net()
+                    pred_selected, pred_not_selected = pred_labels[selected], pred_labels[test_idxs]
+                train_metrics = metrics(pred_selected, labels_selected);
+                untrained_metrics = metrics(pred_not_selected, labels_not_selected)
+                trained_accuracy = evaluate(pred_selected, labels_selected);
+                untrained_accuracy = evaluate(pred_not_selected, labels_not_selected)
             evaluation_trained.append((e, trained_accuracy));
             evaluation_untrained.append((e, untrained_accuracy))
             print("[Epoch %d]: Loss: %.7f" % (e, losses_per_epoch[-1]))
@@ -78,7 +106,7 @@ def train_and_fit(args):
                 untrained_accuracy))
             print("Evaluation recall, precision, f1-score of test nodes: {:.3f}, {:.3f}, {:.3f}".format(
                 untrained_metrics[0], untrained_metrics[1], untrained_metrics[2]))
-            print("Labels of trained nodes: \n", output[selected].max(1)[1])
+            print("Labels of trained nodes: \n", pred_selected.max(1)[1])
             net.train()
             if trained_accuracy > best_pred:
                 best_pred = trained_accuracy
@@ -148,4 +176,7 @@ def train_and_fit(args):
         ax.legend(fontsize=20)
         plt.savefig(os.path.join("./data/", "combined_plot_accuracy_vs_epoch_%d.png" % args.model_no))
 
-    infer(f, test_idxs, net)
\ No newline at end of file
+    if args.graph_batch == 1:
+        infer(test_idxs, net, A_hat=A_hat, args=args)
+    else:
+        infer(test_idxs, net)
\ No newline at end of file
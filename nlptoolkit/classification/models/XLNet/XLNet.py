@@ -119,12 +119,19 @@ class XLNetForSequenceClassification(XLNetPreTrainedModel):
 
     def forward(self, input_ids, token_type_ids=None, input_mask=None, attention_mask=None,
                 mems=None, perm_mask=None, target_mapping=None,
-                labels=None, head_mask=None):
+                labels=None, head_mask=None, cls_index=None):
+        if (attention_mask is not None) and (attention_mask.dim() == 3):
+            # [bsz, qlen, klen] mask (eg. of packed sequences): 0 where query cannot attend to key
+            perm_mask = 1.0 - attention_mask.float()
+            attention_mask = None
         transformer_outputs = self.transformer(input_ids, token_type_ids=token_type_ids,
                                                input_mask=input_mask, attention_mask=attention_mask,
                                                mems=mems, perm_mask=perm_mask, target_mapping=target_mapping,
                                                head_mask=head_mask)
         output = transformer_outputs[0]
+        if cls_index is not None:
+            # summarize each packed sequence from its own last token, at cls_index [num_sequences, (row, position)]
+            output = output[cls_index[:, 0], cls_index[:, 1]].unsqueeze(1)
 
         output = self.sequence_summary(output)
         logits = self.logits_proj(output)
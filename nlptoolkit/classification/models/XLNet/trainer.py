@@ -59,11 +59,12 @@ def train_and_fit(args):
     for epoch in range(start_epoch, args.num_epochs):
         net.train(); total_loss = 0.0; losses_per_batch = []
         for i, data in enumerate(train_loader, 0):
-            inputs, token_type, mask, labels = data
+            inputs, token_type, mask, labels, extras = data
             if cuda:
                 inputs, token_type, mask, labels = inputs.cuda(), token_type.cuda(), mask.cuda(), labels.cuda()
+                extras = {k: v.cuda() for k, v in extras.items()}
             inputs = inputs.long(); labels = labels.long()
-            outputs, _ = net(inputs, token_type_ids=token_type, attention_mask=mask); #print(len(outputs))
+            outputs, _ = net(inputs, token_type_ids=token_type, attention_mask=mask, **extras); #print(len(outputs))
             loss = criterion(outputs, labels)
             loss = loss/args.gradient_acc_steps
             loss.backward()
@@ -1,5 +1,10 @@
-from . import BERT
-from . import GCN
-from . import XLNet
-from . import GAT
-from . import infer
+import importlib
+
+_submodules = ["BERT", "GCN", "XLNet", "GAT", "infer"]
+
+
+def __getattr__(name):
+    """ submodules are imported on first access, so that importing one of them does not import all the others """
+    if name in _submodules:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Length-aware batching of token id sequences for BERT/XLNet classification: length-bucketed batch sampling, padding
+of each batch to its longest sequence, and packing of short sequences into shared rows
+"""
+import numpy as np
+import torch
+
+
+def length_buckets(lengths, batch_size):
+    """ groups documents into batches of batch_size documents of similar lengths, to minimize padding
+    Returns ---> list of arrays of document indices, one per batch """
+    order = np.argsort(np.asarray(lengths), kind="mergesort")
+    return [order[i:(i + batch_size)] for i in range(0, len(order), batch_size)]
+
+
+def pad_batch(token_ids, pad_left=False):
+    """ pads list of token ids to the longest one in the batch with 0 ([PAD])
+    Returns ---> (batch_size X max_len) LongTensor of token ids """
+    max_len = max(len(ids) for ids in token_ids)
+    sentences = torch.zeros([len(token_ids), max_len], requires_grad=False).long()
+    for i, ids in enumerate(token_ids):
+        if pad_left:
+            sentences[i, (max_len - len(ids)):] = torch.as_tensor(ids)
+        else:
+            sentences[i, :len(ids)] = torch.as_tensor(ids)
+    return sentences
+
+
+def pack_rows(lengths, pack_length):
+    """ packs sequences into rows of up to pack_length tokens: each row is started with the longest remaining sequence
+    and filled up with the shortest ones
+    Returns ---> list of rows, each a list of sequence positions in lengths """
+    order = np.argsort(-np.asarray(lengths), kind="mergesort")
+    rows, lo, hi = [], 0, len(order) - 1
+    while lo <= hi:
+        row, fill = [order[lo]], lengths[order[lo]]
+        lo += 1
+        while (lo <= hi) and (fill + lengths[order[hi]] <= pack_length):
+            row.append(order[hi]); fill += lengths[order[hi]]
+            hi -= 1
+        rows.append(row)
+    return rows
+
+
+class BucketBatchSampler(object):
+    """ Batch sampler (DataLoader(batch_sampler=...)) over sequences of given lengths
+    Sequences are shuffled, then sorted by length within buckets of bucket_size batches, and the resulting batches are
+    shuffled, so that each batch holds sequences of similar lengths. With shuffle=False, batches follow length order.
+    pack_length: if given, sequences of each bucket are packed (pack_rows) into rows of up to pack_length tokens, and each
+    batch holds batch_size rows, its sequences listed row by row (as expected by SequenceCollator) """
+    def __init__(self, lengths, batch_size, shuffle=True, bucket_size=100, pack_length=None, seed=None):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+        self.pack_length = pack_length
+        self.rng = np.random.RandomState(seed)
+        self.batches = self.make_batches()
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __iter__(self):
+        batches = self.batches
+        for batch in batches:
+            yield batch
+        self.batches = self.make_batches() # next epoch
+
+    def make_batches(self):
+        if not self.shuffle:
+            order = np.argsort(self.lengths, kind="mergesort")
+            return [list(b) for b in self.group(order)]
+        order = self.rng.permutation(len(self.lengths))
+        bucket = self.batch_size*self.bucket_size
+        batches = []
+        for i in range(0, len(order), bucket):
+            idxs = order[i:(i + bucket)]
+            batches.extend(self.group(idxs[np.argsort(self.lengths[idxs], kind="mergesort")]))
+        return [list(batches[i]) for i in self.rng.permutation(len(batches))]
+
+    def group(self, idxs):
+        """ splits length-sorted sequences idxs into batches """
+        if self.pack_length is None:
+            return [idxs[i:(i + self.batch_size)] for i in range(0, len(idxs), self.batch_size)]
+        rows = [idxs[row] for row in pack_rows(self.lengths[idxs], self.pack_length)]
+        return [np.concatenate(rows[i:(i + self.batch_size)]) for i in range(0, len(rows), self.batch_size)]
+
+
+class SequenceCollator(object):
+    """ collate_fn of (token ids, label) items into (inputs, token_type, mask, labels, extras), where extras holds any
+    further model inputs
+    Without packing, each batch is padded to its longest sequence (on the left if pad_left, for models that classify
+    from the last token) and mask is the (batch_size X max_len) attention mask.
+    With pack_length, consecutive items are packed into rows of up to pack_length tokens, in the order given (as listed
+    by BucketBatchSampler). mask is then the (rows X max_len X max_len) attention mask which keeps each sequence to
+    itself, and extras has
+    cls_index: (no. of sequences X 2) (row, position) of the token each sequence is classified from (its first token,
+               or its last one if cls_last)
+    position_ids: (rows X max_len) positions within each sequence (for absolute position embeddings, if position_ids) """
+    def __init__(self, pad_left=False, pack_length=None, cls_last=False, position_ids=True):
+        self.pad_left = pad_left
+        self.pack_length = pack_length
+        self.cls_last = cls_last
+        self.position_ids = position_ids
+
+    def __call__(self, items):
+        token_ids = [ids for ids, _ in items]
+        labels = torch.tensor([label for _, label in items]).long()
+        if self.pack_length is None:
+            inputs = pad_batch(token_ids, pad_left=self.pad_left)
+            lengths = torch.tensor([len(ids) for ids in token_ids])
+            positions = torch.arange(inputs.shape[1])[None, :]
+            if self.pad_left:
+                mask = (positions >= (inputs.shape[1] - lengths)[:, None]).long()
+            else:
+                mask = (positions < lengths[:, None]).long()
+            return inputs, torch.zeros_like(inputs), mask, labels, {}
+        inputs, mask, extras = self.pack(token_ids)
+        return inputs, torch.zeros_like(inputs), mask, labels, extras
+
+    def pack(self, token_ids):
+        """ packs token_ids, in order, into rows. Returns ---> (inputs, mask, extras) """
+        rows, fill = [[]], 0
+        for i, ids in enumerate(token_ids):
+            if (fill + len(ids) > self.pack_length) and (fill > 0):
+                rows.append([]); fill = 0
+            rows[-1].append(i); fill += len(ids)
+        max_len = max(sum(len(token_ids[i]) for i in row) for row in rows)
+        inputs = torch.zeros([len(rows), max_len]).long()
+        segments = torch.full([len(rows), max_len], -1).long()
+        position_ids = torch.zeros([len(rows), max_len]).long()
+        cls_index = []
+        for r, row in enumerate(rows):
+            start = 0
+            for i in row:
+                end = start + len(token_ids[i])
+                inputs[r, start:end] = torch.as_tensor(token_ids[i])
+                segments[r, start:end] = i
+                position_ids[r, start:end] = torch.arange(end - start)
+                cls_index.append([r, (end - 1) if self.cls_last else start])
+                start = end
+        mask = ((segments[:, :, None] == segments[:, None, :]) & (segments[:, :, None] >= 0)).long()
+        extras = {"cls_index": torch.tensor(cls_index).long()}
+        if self.position_ids:
+            extras["position_ids"] = position_ids
+        return inputs, mask, extras
@@ -6,9 +6,14 @@ Created on Tue Sep 24 17:33:49 2019
 """
 import pickle
 import os
+import time
+import numpy as np
 import pandas as pd
 import torch
 from tqdm import tqdm
+from .batching import length_buckets, pad_batch
+from .quantization import load_quantized
+from .result_cache import ResultCache
 import logging
 
 tqdm.pandas(desc="prog-bar")
@@ -30,52 +35,234 @@ class infer_from_trained(object):
         else:
             self.args = args
         self.cuda = torch.cuda.is_available()
+        self.traced = (getattr(self.args, "traced", 0) == 1)
+        # the traced model always runs all encoder layers
+        self.early_exit = (getattr(self.args, "early_exit", 0) == 1) and (self.args.model_no == 1) and not self.traced
         logger.info("Loading tokenizer and model...")
-        if self.args.model_no == 1:
-            from .BERT.tokenization_bert import BertTokenizer as model_tokenizer
-            from .BERT.BERT import BertForSequenceClassification as net
-            from .BERT.train_funcs import load_state
-            model_type = 'bert-base-uncased'
-            lower_case = True
+        if self.traced:
+            self.load_traced_model()
+        elif self.args.model_no in [0, 3]:
+            self.graph = self.load_graph_model()
+        else:
+            if (self.args.model_no == 1) and self.early_exit:
+                from .BERT.BERT import BertForEarlyExitClassification as net
+                from .BERT.train_funcs import load_state
+                self.model_type = 'bert-base-uncased'
+                self.lower_case = True
             
-        elif self.args.model_no == 2:
-            from .XLNet.tokenization_xlnet import XLNetTokenizer as model_tokenizer
-            from .XLNet.XLNet import XLNetForSequenceClassification as net
-            from .XLNet.train_funcs import load_state
-            model_type = 'xlnet-base-cased'
-            lower_case = False
+            elif self.args.model_no == 1:
+                from .BERT.BERT import BertForSequenceClassification as net
+                from .BERT.train_funcs import load_state
+                self.model_type = 'bert-base-uncased'
+                self.lower_case = True
+            
+            elif self.args.model_no == 2:
+                from .XLNet.XLNet import XLNetForSequenceClassification as net
+                from .XLNet.train_funcs import load_state
+                self.model_type = 'xlnet-base-cased'
+                self.lower_case = False
             
-        self.tokenizer = model_tokenizer.from_pretrained(model_type, do_lower_case=lower_case)
-        self.tokens_length = args.tokens_length # max tokens length
+            self.tokenizer = self.load_tokenizer()
+            self.tokens_length = self.args.tokens_length # max tokens length
+            # XLNet classifies from the last token, so its batches are padded on the left
+            self.pad_left = (self.args.model_no == 2)
         
-        self.net = net.from_pretrained(model_type, num_labels=args.num_classes)
+            self.net = net.from_pretrained(self.model_type, num_labels=self.args.num_classes)
+            if getattr(self.args, "quantize", 0) == 1:
+                # int8 CPU inference, converted once per checkpoint
+                self.cuda = False
+                checkpoint_path = os.path.join("./data/", "test_checkpoint_%d.pth.tar" % self.args.model_no)
+                self.net = load_quantized(self.net, checkpoint_path, \
+                                          lambda net: load_state(net, None, None, self.args, load_best=False))
+            else:
+                if self.cuda:
+                    self.net.cuda()
+                _, _ = load_state(self.net, None, None, self.args, load_best=False) 
+        self.result_cache = self.load_result_cache()
+        logger.info("Done!")
+    
+    def load_tokenizer(self):
+        if self.args.model_no == 1:
+            from .BERT.tokenization_bert import BertTokenizer as model_tokenizer
+        else:
+            from .XLNet.tokenization_xlnet import XLNetTokenizer as model_tokenizer
+        return model_tokenizer.from_pretrained(self.model_type, do_lower_case=self.lower_case)
+    
+    def load_traced_model(self):
+        """ loads the TorchScript artifact of the trained model (exported first if there is none), on CPU """
+        from .traced import traced_path, export_traced, load_traced, TracedGraphClassifier
+        if not os.path.isfile(traced_path(self.args.model_no)):
+            export_traced(self.args)
+        module, config, vocab = load_traced(self.args.model_no)
+        self.cuda = False
+        if self.args.model_no == 0:
+            self.graph = TracedGraphClassifier(module, vocab, config.get("n_docs"))
+        else:
+            self.net = module
+            self.model_type, self.lower_case = config["model_type"], config["lower_case"]
+            self.tokenizer = self.load_tokenizer()
+            self.tokens_length = config["tokens_length"]
+            self.pad_left = config["pad_left"]
+    
+    def load_result_cache(self):
+        """ cache of predicted classes of repeated (and near-duplicate) inputs, if args.result_cache > 0 """
+        if getattr(self.args, "result_cache", 0) <= 0:
+            return None
+        graph = self.args.model_no in [0, 3]
+        near_duplicate = (getattr(self.args, "near_duplicate", 0) == 1)
+        if near_duplicate and graph:
+            logger.info("Near-duplicate lookup is only supported for BERT/XLNet, using exact matches only.")
+            near_duplicate = False
+        if near_duplicate:
+            self.word_embeddings = self.load_word_embeddings()
+        return ResultCache(self.args.result_cache, lower_case=(not graph) and self.lower_case, \
+                           near_duplicate=near_duplicate, \
+                           similarity_threshold=getattr(self.args, "similarity_threshold", 0.98))
+    
+    def load_word_embeddings(self):
+        """ input token embedding table of the (eager, quantized or traced) model, as numpy array """
+        state_dict = self.net.state_dict()
+        key = [k for k in state_dict if ("word_embedding" in k) and k.endswith("weight")][0]
+        return state_dict[key].detach().cpu().float().numpy()
+    
+    def pooled_embeddings(self, token_ids):
+        """ mean input token embedding of each encoded sentence, for near-duplicate lookup """
+        return np.stack([self.word_embeddings[ids].mean(0) for ids in token_ids])
+    
+    def load_graph_model(self):
+        """ loads trained GCN/GAT with its text graph, for inductive inference of unseen documents """
+        from .text_graph.graph_builder import load_text_graph, to_torch_sparse, to_edge_index
+        from .text_graph.inductive import InductiveClassifier
+        G_dict = load_text_graph("text_graph.npz")
+        N = G_dict["adj"].shape[0]
+        if self.args.model_no == 0:
+            from .GCN.GCN import gcn
+            from .GCN.train_funcs import load_state
+            self.net = gcn(N, None, self.cuda, self.args) # local graphs are given per batch of documents
+            to_adj = to_torch_sparse
+        else:
+            from .GAT.GAT import SpGAT
+            from .GAT.train_funcs import load_state
+            if (getattr(self.args, "gat_sparse", 0) != 1) and (getattr(self.args, "graph_batch", 0) != 1):
+                raise ValueError("Inference of unseen documents is only supported for sparse GAT (--gat_sparse 1).")
+            self.net = SpGAT(nfeat=N, nhid=self.args.hidden, nclass=self.args.num_classes, dropout=0.1, \
+                             nheads=self.args.nb_heads, alpha=0.2)
+            to_adj = to_edge_index
         if self.cuda:
             self.net.cuda()
-        _, _ = load_state(self.net, None, None, args, load_best=False) 
-        logger.info("Done!")
+        _, _ = load_state(self.net, None, None, model_no=self.args.model_no, load_best=True, n_nodes=N)
+        return InductiveClassifier(self.net, G_dict["adj"], G_dict["vocab"], G_dict["idf"], to_adj, n_docs=G_dict["n_docs"])
     
-    def infer_sentence(self, sentence):
-        self.net.eval()
+    def tokenize_doc(self, sentence):
+        """ tokenizes document as done in text graph preprocessing """
+        from .text_graph.inductive import filter_tokens
+        return filter_tokens(sentence.split())
+    
+    def encode_sentence(self, sentence):
+        """ token ids of sentence, truncated to tokens_length """
         sentence = self.tokenizer.tokenize("[CLS] " + sentence)
-        sentence = self.tokenizer.convert_tokens_to_ids(sentence[:(self.args.tokens_length-1)] + ["[SEP]"])
-        sentence = torch.tensor(sentence).unsqueeze(0)
-        type_ids = torch.zeros([sentence.shape[0], sentence.shape[1]], requires_grad=False).long()
-        src_mask = (sentence != 0).long()
+        return self.tokenizer.convert_tokens_to_ids(sentence[:(self.args.tokens_length-1)] + ["[SEP]"])
+    
+    def infer_batch(self, token_ids, return_exit_layers=False):
+        """ predicted classes of a batch of encoded sentences, padded to the longest one in the batch
+        (, with the encoder layer each sentence exited at, if return_exit_layers) """
+        sentences = pad_batch(token_ids, pad_left=self.pad_left)
+        type_ids = torch.zeros([sentences.shape[0], sentences.shape[1]], requires_grad=False).long()
+        src_mask = (sentences != 0).long()
         if self.cuda:
-            sentence = sentence.cuda()
+            sentences = sentences.cuda()
             type_ids = type_ids.cuda()
             src_mask = src_mask.cuda()
-        if self.args.model_no == 1:
-            outputs = self.net(sentence, token_type_ids=type_ids, attention_mask=src_mask)
+        self.net.eval()
+        with torch.no_grad():
+            exit_layers = None
+            if self.traced:
+                outputs = self.net(sentences, type_ids, src_mask)
+            elif self.early_exit:
+                outputs, exit_layers = self.net.early_exit(sentences, token_type_ids=type_ids, attention_mask=src_mask, \
+                                                           exit_threshold=getattr(self.args, "exit_threshold", 0.9))
+            elif self.args.model_no == 1:
+                outputs = self.net(sentences, token_type_ids=type_ids, attention_mask=src_mask)
+            else:
+                outputs, _ = self.net(sentences, token_type_ids=type_ids, attention_mask=src_mask)
+        if return_exit_layers:
+            return outputs.max(1)[1].cpu().tolist(), (exit_layers.cpu().tolist() if exit_layers is not None else None)
+        return outputs.max(1)[1].cpu().tolist()
+    
+    def infer_sentences(self, sentences, batch_size=32):
+        """ predicted classes of list of sentences, tokenized together and inferred in length-bucketed batches """
+        if self.result_cache is not None:
+            return self.infer_cached(sentences, batch_size=batch_size)
+        if self.args.model_no in [0, 3]:
+            return [int(p) for p in self.graph.predict([self.tokenize_doc(sent) for sent in sentences])]
+        return self.infer_token_ids([self.encode_sentence(sent) for sent in sentences], batch_size=batch_size)
+    
+    def infer_cached(self, sentences, batch_size=32):
+        """ infer_sentences with the result cache: sentences seen before, then near-duplicates of cached sentences (if
+        enabled) take their cached classes, the others are inferred (once per distinct sentence) and cached """
+        cache = self.result_cache
+        start = time.time()
+        predicted = cache.lookup(sentences)
+        distinct = {} # normalized sentence ---> its first index among the misses
+        misses = []
+        for i, p in enumerate(predicted):
+            if p is None:
+                misses.append(i)
+                distinct.setdefault(cache.key(sentences[i]), i)
+        lookup_time = (time.time() - start)/len(sentences) if len(sentences) > 0 else 0.0
+        cache.record("exact", len(sentences) - len(misses), lookup_time*(len(sentences) - len(misses)))
+        if len(misses) == 0:
+            return predicted
+        
+        start = time.time()
+        to_infer = list(distinct.values())
+        graph = self.args.model_no in [0, 3]
+        token_ids, embeddings = None, None
+        if not graph:
+            token_ids = [self.encode_sentence(sentences[i]) for i in to_infer]
+        n_near = 0
+        if cache.near_duplicate:
+            embeddings = self.pooled_embeddings(token_ids)
+            near = cache.nearest(embeddings)
+            keep = [j for j, label in enumerate(near) if label is None]
+            for j, label in enumerate(near):
+                if label is not None:
+                    predicted[to_infer[j]] = label
+                    n_near += 1
+            to_infer, token_ids, embeddings = [to_infer[j] for j in keep], [token_ids[j] for j in keep], \
+                                              embeddings[keep]
+        near_time = (time.time() - start)/len(distinct)
+        cache.record("near", n_near, (lookup_time + near_time)*n_near)
+        
+        start = time.time()
+        if graph:
+            labels = [int(p) for p in self.graph.predict([self.tokenize_doc(sentences[i]) for i in to_infer])]
         else:
-            outputs, _ = self.net(sentence, token_type_ids=type_ids, attention_mask=src_mask)
-        _, predicted = torch.max(outputs.data, 1)
-        predicted = predicted.cpu().item() if self.cuda else predicted.item()
+            labels = self.infer_token_ids(token_ids, batch_size=batch_size)
+        for i, label in zip(to_infer, labels):
+            predicted[i] = label
+        cache.add([sentences[i] for i in to_infer], labels, embeddings)
+        for i in misses: # repeats of a distinct sentence within sentences
+            predicted[i] = predicted[distinct[cache.key(sentences[i])]]
+        n_inferred = len(misses) - n_near
+        if n_inferred > 0:
+            cache.record("miss", n_inferred, (lookup_time + near_time)*n_inferred + time.time() - start)
+        return predicted
+    
+    def infer_token_ids(self, token_ids, batch_size=32):
+        """ predicted classes of encoded sentences, inferred in length-bucketed batches """
+        predicted = [0]*len(token_ids)
+        for batch in length_buckets([len(ids) for ids in token_ids], batch_size):
+            for idx, p in zip(batch, self.infer_batch([token_ids[i] for i in batch])):
+                predicted[idx] = p
+        return predicted
+    
+    def infer_sentence(self, sentence):
+        predicted = self.infer_sentences([sentence], batch_size=1)[0]
         print("Predicted class: %d" % predicted)
         return predicted
     
     def infer_from_input(self):
-        self.net.eval()
         while True:
             user_input = input("Type input sentence (Type \'exit' or \'quit' to quit):\n")
             if user_input in ["exit", "quit"]:
@@ -83,10 +270,23 @@ class infer_from_trained(object):
             predicted = self.infer_sentence(user_input)
         return predicted
     
-    def infer_from_file(self, in_file="./data/input.txt", out_file="./data/output.txt"):
-        df = pd.read_csv(in_file, header=None, names=["sents"])
-        df['labels'] = df.progress_apply(lambda x: self.infer_sentence(x['sents']), axis=1)
-        df.to_csv(out_file, index=False)
+    def infer_from_file(self, in_file="./data/input.txt", out_file="./data/output.txt", batch_size=None, \
+                        chunk_size=10000):
+        """ classifies each line of in_file, chunk_size lines at a time; labels of each chunk are appended to out_file
+        as soon as it is done, so that memory use does not grow with the size of in_file """
+        if batch_size is None:
+            batch_size = getattr(self.args, "infer_batch_size", 32)
+        if os.path.isfile(out_file):
+            os.remove(out_file)
+        header = True
+        with tqdm(desc="prog-bar", unit=" sents") as pbar:
+            for df in pd.read_csv(in_file, header=None, names=["sents"], chunksize=chunk_size):
+                # text graph models classify each chunk of documents together, in a single local graph
+                df['labels'] = self.infer_sentences(list(df['sents']), batch_size=batch_size)
+                df.to_csv(out_file, mode='a', header=header, index=False)
+                header = False
+                pbar.update(len(df))
+        if self.result_cache is not None:
+            self.result_cache.log_info()
         logger.info("Done and saved as %s!" % out_file)
         return
-            
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Dynamic int8 quantization of BERT/XLNet classifiers for CPU inference: the weights of nn.Linear layers are stored as
+int8 and activations are quantized on the fly. The quantized model is cached next to its checkpoint, so that the
+conversion only runs once per trained checkpoint.
+"""
+import os
+import torch
+import torch.nn as nn
+import logging
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
+                    datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+logger = logging.getLogger(__file__)
+
+
+def quantize_model(net):
+    """ copy of net with int8 dynamically quantized nn.Linear layers (CPU only) """
+    return torch.quantization.quantize_dynamic(net.cpu(), {nn.Linear}, dtype=torch.qint8)
+
+
+def quantized_path(checkpoint_path):
+    """ ./data/test_checkpoint_1.pth.tar ---> ./data/test_checkpoint_1_int8.pth.tar """
+    return checkpoint_path.replace(".pth.tar", "_int8.pth.tar")
+
+
+def checkpoint_stamp(checkpoint_path):
+    """ identifies the version of the checkpoint the quantized model was converted from """
+    if not os.path.isfile(checkpoint_path):
+        return None
+    stat = os.stat(checkpoint_path)
+    return (int(stat.st_mtime), stat.st_size)
+
+
+def load_quantized(net, checkpoint_path, load_fp32):
+    """ int8 dynamically quantized net, loaded from its cache next to checkpoint_path if it was converted from the
+    current checkpoint, else converted from net after load_fp32(net) loads its fp32 weights, and cached """
+    cache_path = quantized_path(checkpoint_path)
+    stamp = checkpoint_stamp(checkpoint_path)
+    if os.path.isfile(cache_path):
+        cached = torch.load(cache_path)
+        if cached["checkpoint_stamp"] == stamp:
+            q_net = quantize_model(net) # same structure, weights are then loaded from the cache
+            q_net.load_state_dict(cached["state_dict"])
+            logger.info("Loaded int8 quantized model from %s." % cache_path)
+            return q_net
+        logger.info("Checkpoint has changed since it was quantized.")
+    load_fp32(net)
+    logger.info("Quantizing model to int8...")
+    q_net = quantize_model(net)
+    if stamp is not None:
+        torch.save({"checkpoint_stamp": stamp, "state_dict": q_net.state_dict()}, cache_path)
+        logger.info("Saved int8 quantized model as %s." % cache_path)
+    return q_net
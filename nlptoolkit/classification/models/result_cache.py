@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of predicted classes for repeated classification inputs: an exact-match LRU keyed on normalized text and,
+optionally, a near-duplicate index of pooled embeddings of the cached texts, whose label is reused for a new text
+whose embedding is similar enough (cosine similarity) to a cached one. Hit counts and latencies of each path are
+kept as metrics.
+"""
+import re
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+import logging
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
+                    datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+logger = logging.getLogger(__file__)
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_text(text, lower_case=False):
+    """ cache key of text: NFKC unicode form, collapsed whitespace (and lower case for uncased models) """
+    text = _whitespace.sub(" ", unicodedata.normalize("NFKC", str(text))).strip()
+    return text.lower() if lower_case else text
+
+
+class EmbeddingIndex(object):
+    """ in-memory index of up to max_size L2-normalized embeddings and their labels, the oldest are replaced when
+    full. search(queries) ---> (labels, cosine similarities) of the nearest embedding of each query """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.vectors = None
+        self.labels = np.zeros(max_size, dtype=np.int64)
+        self.size = 0
+        self.pos = 0 # next row to write
+
+    def __len__(self):
+        return self.size
+
+    def add(self, embeddings, labels):
+        embeddings = normalize_rows(embeddings)
+        if self.vectors is None:
+            self.vectors = np.zeros((self.max_size, embeddings.shape[1]), dtype=np.float32)
+        for embedding, label in zip(embeddings[-self.max_size:], labels[-self.max_size:]):
+            self.vectors[self.pos] = embedding
+            self.labels[self.pos] = label
+            self.pos = (self.pos + 1) % self.max_size
+            self.size = min(self.size + 1, self.max_size)
+
+    def search(self, queries):
+        if self.size == 0:
+            return np.zeros(len(queries), dtype=np.int64), np.full(len(queries), -1.0, dtype=np.float32)
+        similarities = normalize_rows(queries) @ self.vectors[:self.size].T
+        nearest = similarities.argmax(1)
+        return self.labels[nearest], similarities[np.arange(len(queries)), nearest]
+
+    def clear(self):
+        self.size, self.pos = 0, 0
+
+
+def normalize_rows(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x/np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+class ResultCache(object):
+    """ predicted classes of up to max_size normalized texts (least recently used are evicted), with a near-duplicate
+    EmbeddingIndex if near_duplicate. lookup(texts) returns the cached label or None of each text, nearest(embeddings)
+    the label of a near-duplicate (cosine similarity >= similarity_threshold) or None of each embedding """
+    def __init__(self, max_size=10000, lower_case=False, near_duplicate=False, similarity_threshold=0.98):
+        self.max_size = max_size
+        self.lower_case = lower_case
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()
+        self.index = EmbeddingIndex(max_size) if near_duplicate else None
+        # path ---> [no. of texts, total seconds], see record
+        self.stats = {"exact": [0, 0.0], "near": [0, 0.0], "miss": [0, 0.0]}
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def near_duplicate(self):
+        return self.index is not None
+
+    def key(self, text):
+        return normalize_text(text, self.lower_case)
+
+    def lookup(self, texts):
+        labels = []
+        for text in texts:
+            key = self.key(text)
+            label = self.entries.get(key)
+            if label is not None:
+                self.entries.move_to_end(key)
+            labels.append(label)
+        return labels
+
+    def nearest(self, embeddings):
+        labels, similarities = self.index.search(embeddings)
+        return [int(label) if similarity >= self.similarity_threshold else None \
+                for label, similarity in zip(labels, similarities)]
+
+    def add(self, texts, labels, embeddings=None):
+        for text, label in zip(texts, labels):
+            key = self.key(text)
+            self.entries[key] = int(label)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        if (self.index is not None) and (embeddings is not None) and (len(labels) > 0):
+            self.index.add(embeddings, labels)
+
+    def record(self, path, n, seconds):
+        """ adds n texts answered by path (exact, near or miss) in seconds to the metrics """
+        self.stats[path][0] += n
+        self.stats[path][1] += seconds
+
+    def cache_info(self):
+        """ Returns ---> dict of cache size, hits of each path, hit rate and mean latency (ms per text) of each path """
+        n = sum(count for count, _ in self.stats.values())
+        info = {"size": len(self.entries), "index_size": len(self.index) if self.index is not None else 0, \
+                "exact_hits": self.stats["exact"][0], "near_hits": self.stats["near"][0], \
+                "misses": self.stats["miss"][0], \
+                "hit_rate": (self.stats["exact"][0] + self.stats["near"][0])/n if n > 0 else 0.0}
+        for path, (count, seconds) in self.stats.items():
+            info["%s_ms" % path] = 1000*seconds/count if count > 0 else 0.0
+        return info
+
+    def log_info(self):
+        info = self.cache_info()
+        logger.info("Result cache: %d texts, %d exact hits (%.3f ms), %d near-duplicate hits (%.3f ms), %d misses "
+                    "(%.3f ms), hit rate %.3f" % (info["size"], info["exact_hits"], info["exact_ms"], \
+                                                  info["near_hits"], info["near_ms"], info["misses"], \
+                                                  info["miss_ms"], info["hit_rate"]))
+
+    def clear(self):
+        self.entries.clear()
+        if self.index is not None:
+            self.index.clear()
+        self.stats = {path: [0, 0.0] for path in self.stats}
@@ -0,0 +1,6 @@
+from . import graph_builder
+from . import cooccurrence
+from . import sampler
+from . import inductive
+from . import parallel
+from . import optimizer
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Sliding-window word co-occurrence counts and PPMI for the GCN/GAT text graph
+"""
+import os
+import numpy as np
+import scipy.sparse as sp
+import logging
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
+                    datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+logger = logging.getLogger(__file__)
+
+
+def encode_corpus(docs, vocab):
+    """ encodes tokenized documents into integer ids of vocab (out-of-vocab tokens = -1)
+    Returns --->
+    tokens: flat int32 array of token ids of all documents
+    offsets: int64 array (n_docs + 1) of document boundaries into tokens """
+    word2index = {w: i for i, w in enumerate(vocab)}
+    lengths = np.zeros(len(docs) + 1, dtype=np.int64)
+    encoded = []
+    for idx, doc in enumerate(docs):
+        encoded.append(np.fromiter((word2index.get(w, -1) for w in doc), dtype=np.int32, count=len(doc)))
+        lengths[idx + 1] = len(doc)
+    tokens = np.concatenate(encoded) if len(encoded) > 0 else np.zeros(0, dtype=np.int32)
+    return tokens, np.cumsum(lengths)
+
+
+def window_starts(offsets, window):
+    """ start positions (into flat tokens) of all sliding windows, len(doc) - window windows per document """
+    n_win = np.maximum(np.diff(offsets) - window, 0)
+    total = int(n_win.sum())
+    firsts = np.cumsum(n_win) - n_win
+    return np.repeat(offsets[:-1], n_win) + (np.arange(total, dtype=np.int64) - np.repeat(firsts, n_win))
+
+
+def _unique_window_ids(tokens, starts, window):
+    """ (n_windows X window) ids per window, with duplicates and out-of-vocab tokens masked as -1 """
+    w = np.sort(tokens[starts[:, None] + np.arange(window)], axis=1)
+    dup = np.zeros(w.shape, dtype=bool)
+    dup[:, 1:] = (w[:, 1:] == w[:, :-1])
+    w[dup] = -1
+    return w
+
+
+def count_cooccurrences(tokens, offsets, n_vocab, window=10, chunk_size=100000):
+    """ counts word co-occurrences within sliding windows of encoded corpus
+    Each window contributes once per distinct pair of distinct in-vocab words, and once to each word's window count.
+    Returns --->
+    occurrences: sparse symmetric (n_vocab X n_vocab) int64 co-occurrence counts (zero diagonal)
+    n_i: (n_vocab) number of windows containing each word
+    no_windows: total number of windows """
+    keys, counts, n_i, no_windows = count_pairs(tokens, offsets, n_vocab, window=window, chunk_size=chunk_size)
+    return pairs_to_matrix(keys, counts, n_vocab), n_i, no_windows
+
+
+def count_pairs(tokens, offsets, n_vocab, window=10, chunk_size=100000):
+    """ as count_cooccurrences, with co-occurrences returned as sorted unique (row*n_vocab + col) int64 keys of the
+    upper triangle and their counts. Returns ---> (keys, counts, n_i, no_windows) """
+    starts = window_starts(offsets, window)
+    no_windows = len(starts)
+    n_i = np.zeros(n_vocab, dtype=np.int64)
+    ia, ib = np.triu_indices(window, k=1)
+    keys, counts = [], []
+    for i in range(0, no_windows, chunk_size):
+        w = _unique_window_ids(tokens, starts[i:(i + chunk_size)], window)
+        n_i += np.bincount(w[w >= 0], minlength=n_vocab)
+        rows, cols = w[:, ia].ravel(), w[:, ib].ravel()
+        keep = (rows >= 0) & (cols >= 0)
+        k, c = np.unique(rows[keep].astype(np.int64)*n_vocab + cols[keep], return_counts=True)
+        keys.append(k); counts.append(c)
+    keys, counts = merge_counts(keys, counts) # windows are sorted, so only upper triangle was counted
+    return keys, counts, n_i, no_windows
+
+
+def pairs_to_matrix(keys, counts, n_vocab):
+    """ sparse symmetric (n_vocab X n_vocab) int64 matrix of upper triangle pair keys & counts """
+    rows, cols = keys//n_vocab, keys % n_vocab
+    return sp.csr_matrix((np.concatenate((counts, counts)), (np.concatenate((rows, cols)), \
+                          np.concatenate((cols, rows)))), shape=(n_vocab, n_vocab), dtype=np.int64)
+
+
+def merge_counts(keys, counts):
+    """ merges lists of (sorted unique int64 keys, counts) into one sorted unique keys array with summed counts """
+    keys = np.concatenate(keys) if len(keys) > 0 else np.zeros(0, dtype=np.int64)
+    counts = np.concatenate(counts).astype(np.int64) if len(counts) > 0 else np.zeros(0, dtype=np.int64)
+    if len(keys) == 0:
+        return keys, counts
+    order = np.argsort(keys, kind="mergesort")
+    keys, counts = keys[order], counts[order]
+    firsts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[firsts], np.add.reduceat(counts, firsts)
+
+
+def document_frequencies(tokens, offsets, n_vocab):
+    """ number of encoded documents containing each in-vocab word """
+    doc_ids = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+    keep = tokens >= 0
+    keys = np.unique(doc_ids[keep]*n_vocab + tokens[keep])
+    return np.bincount(keys % n_vocab, minlength=n_vocab).astype(np.int64)
+
+
+# flat on-disk word-word edge record
+EDGE_DTYPE = np.dtype([("src", np.int32), ("dst", np.int32), ("weight", np.float32)])
+
+
+def ppmi_edges(occurrences, n_i, no_windows, threshold=0., min_count=1, top_k=0, row_offset=0):
+    """ pruned positive point-wise mutual information edges, log(p_ij/(p_i*p_j)) > threshold, of co-occurrence rows
+    occurrences: sparse co-occurrence counts of rows row_offset, row_offset + 1, ... (all columns)
+    min_count: min. co-occurrence count of kept edges; top_k: only keep each row word's top_k PMI edges (0: all)
+    Returns ---> (src, dst, weight) arrays of directed edges (src = row word) """
+    occurrences = sp.coo_matrix(occurrences)
+    rows, cols = occurrences.row.astype(np.int64) + row_offset, occurrences.col.astype(np.int64)
+    pmi = np.log(occurrences.data * float(no_windows) / (n_i[rows] * n_i[cols].astype(np.float64)) + 1E-9)
+    keep = (pmi > max(threshold, 0)) & (occurrences.data >= min_count) & (rows != cols)
+    rows, cols, pmi = rows[keep], cols[keep], pmi[keep]
+    if (top_k > 0) and (len(pmi) > 0):
+        order = np.lexsort((-pmi, rows)) # by row, then descending PMI
+        rows, cols, pmi = rows[order], cols[order], pmi[order]
+        firsts = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+        rank = np.arange(len(rows)) - np.repeat(firsts, np.diff(np.append(firsts, len(rows))))
+        keep = rank < top_k
+        rows, cols, pmi = rows[keep], cols[keep], pmi[keep]
+    return rows, cols, pmi.astype(np.float32)
+
+
+def edges_to_matrix(src, dst, weight, n_vocab):
+    """ symmetric sparse (n_vocab X n_vocab) matrix of directed edges, an edge is kept if it was kept in either direction """
+    word_word = sp.csr_matrix((weight, (src, dst)), shape=(n_vocab, n_vocab), dtype=np.float32)
+    return word_word.maximum(word_word.T).tocsr()
+
+
+def ppmi_matrix(occurrences, n_i, no_windows, threshold=0., min_count=1, top_k=0):
+    """ pruned positive point-wise mutual information (see ppmi_edges) as symmetric sparse float32 matrix """
+    src, dst, weight = ppmi_edges(occurrences, n_i, no_windows, threshold, min_count, top_k)
+    return edges_to_matrix(src, dst, weight, occurrences.shape[0])
+
+
+def ppmi_edge_matrix(occurrences, n_i, no_windows, threshold=0., min_count=1, top_k=0, chunk_size=1000, \
+                     filename=None):
+    """ pruned PMI edges (see ppmi_edges) of symmetric co-occurrence counts as symmetric sparse float32 matrix (see
+    edges_to_matrix), assembled from the CSR blocks of chunk_size rows as they are computed, so that only the kept
+    edges are held in memory. filename = also write the edges to ./data/filename as flat EDGE_DTYPE (src, dst, weight)
+    records, an on-disk copy of the edges (see read_edges) which does not reduce memory use
+    Returns ---> (matrix, no. of directed edges kept) """
+    occurrences = sp.csr_matrix(occurrences)
+    n_vocab = occurrences.shape[0]
+    blocks, no_edges = [], 0
+    f = open(os.path.join("./data/", filename), "wb") if filename is not None else None
+    try:
+        for i in range(0, n_vocab, chunk_size):
+            src, dst, weight = ppmi_edges(occurrences[i:(i + chunk_size)], n_i, no_windows, threshold, min_count, \
+                                          top_k, row_offset=i)
+            blocks.append(sp.csr_matrix((weight, (src - i, dst)), shape=(min(chunk_size, n_vocab - i), n_vocab), \
+                                        dtype=np.float32))
+            if f is not None:
+                edges = np.empty(len(src), dtype=EDGE_DTYPE)
+                edges["src"], edges["dst"], edges["weight"] = src, dst, weight
+                f.write(edges.tobytes())
+            no_edges += len(src)
+    finally:
+        if f is not None:
+            f.close()
+    word_word = sp.vstack(blocks, format="csr") if len(blocks) > 0 else sp.csr_matrix((n_vocab, n_vocab), \
+                                                                                      dtype=np.float32)
+    return word_word.maximum(word_word.T).tocsr(), no_edges
+
+
+def read_edges(filename, n_vocab):
+    """ loads edges written by ppmi_edge_matrix as symmetric sparse (n_vocab X n_vocab) matrix """
+    edges = np.fromfile(os.path.join("./data/", filename), dtype=EDGE_DTYPE)
+    return edges_to_matrix(edges["src"], edges["dst"], edges["weight"], n_vocab)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse (CSR) text graph shared by the GCN and GAT classifiers
+"""
+import os
+import numpy as np
+import scipy.sparse as sp
+import torch
+import logging
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
+                    datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+logger = logging.getLogger(__file__)
+
+
+def build_adjacency(doc_word, word_word, n_appended=0):
+    """ builds the (n_docs + n_vocab) x (n_docs + n_vocab) symmetric text graph adjacency in CSR format
+    doc_word: sparse (n_docs x n_vocab) document-word weights (Tf-idf)
+    word_word: sparse symmetric (n_vocab x n_vocab) word-word weights (positive PMI, zero diagonal)
+    Node ordering follows the networkx graph: document nodes first, then word nodes in vocab order, except for the
+    last n_appended documents (appended to the graph, see apply_graph_delta), which come after the word nodes.
+    Only non-zero weights become edges. """
+    doc_word = sp.csr_matrix(doc_word, dtype=np.float32)
+    word_word = sp.csr_matrix(word_word, dtype=np.float32)
+    doc_word.eliminate_zeros(); word_word.eliminate_zeros()
+    word_word.setdiag(0); word_word.eliminate_zeros()
+    n_docs, n_vocab = doc_word.shape
+    assert word_word.shape == (n_vocab, n_vocab)
+    if n_appended == 0:
+        adj = sp.bmat([[sp.csr_matrix((n_docs, n_docs), dtype=np.float32), doc_word], \
+                       [doc_word.T, word_word]], format="csr", dtype=np.float32)
+    else:
+        n_base = n_docs - n_appended
+        base, appended = doc_word[:n_base], doc_word[n_base:]
+        adj = sp.bmat([[sp.csr_matrix((n_base, n_base), dtype=np.float32), base, \
+                        sp.csr_matrix((n_base, n_appended), dtype=np.float32)], \
+                       [base.T, word_word, appended.T], \
+                       [sp.csr_matrix((n_appended, n_base), dtype=np.float32), appended, \
+                        sp.csr_matrix((n_appended, n_appended), dtype=np.float32)]], format="csr", dtype=np.float32)
+    adj.sort_indices()
+    logger.info("Built text graph with %d nodes and %d edges." % (adj.shape[0], adj.nnz//2))
+    return adj
+
+
+def normalize_adjacency(adj, self_loops=True):
+    """ symmetric normalization D^-1/2 (A + I) D^-1/2 of sparse adjacency, D = unweighted node degrees of A
+    (isolated nodes get zero scaling) """
+    adj = sp.csr_matrix(adj, dtype=np.float32)
+    degrees = adj.getnnz(axis=1).astype(np.float32)
+    degrees[degrees > 0] = degrees[degrees > 0]**(-0.5)
+    degrees = sp.diags(degrees)
+    if self_loops:
+        adj = adj + sp.eye(adj.shape[0], dtype=np.float32, format="csr")
+    return (degrees@adj@degrees).tocsr()
+
+
+def to_torch_sparse(adj):
+    """ converts scipy sparse matrix into torch sparse (COO) float tensor """
+    adj = sp.coo_matrix(adj, dtype=np.float32)
+    indices = torch.from_numpy(np.vstack((adj.row, adj.col)).astype(np.int64))
+    values = torch.from_numpy(adj.data)
+    return torch.sparse_coo_tensor(indices, values, torch.Size(adj.shape)).coalesce()
+
+
+def to_edge_index(adj, self_loops=True):
+    """ (2 x E) torch long tensor of (row, col) indices of non-zero entries of sparse adjacency, sorted by row """
+    adj = abs(sp.csr_matrix(adj))
+    if self_loops:
+        adj = adj + sp.eye(adj.shape[0], dtype=adj.dtype, format="csr")
+    adj = adj.tocsr(); adj.sort_indices()
+    rows = np.repeat(np.arange(adj.shape[0], dtype=np.int64), np.diff(adj.indptr))
+    return torch.from_numpy(np.vstack((rows, adj.indices.astype(np.int64))))
+
+
+def save_text_graph(filename, adj, infer_idx_start, vocab, idf=None):
+    """ saves CSR adjacency together with graph metadata into a compressed ./data/ .npz file
+    idf = Tf-idf inverse document frequencies of vocab, needed to connect unseen documents to the graph """
+    completeName = os.path.join("./data/", filename)
+    adj = sp.csr_matrix(adj)
+    extras = {} if idf is None else {"idf": np.asarray(idf, dtype=np.float64)}
+    np.savez_compressed(completeName, data=adj.data, indices=adj.indices, indptr=adj.indptr, \
+                        shape=np.array(adj.shape, dtype=np.int64), \
+                        infer_idx_start=np.array(infer_idx_start, dtype=np.int64), \
+                        vocab=np.array(vocab, dtype=np.str_), **extras)
+
+
+def load_text_graph(filename, merge_deltas=True):
+    """ loads text graph saved by save_text_graph, merged with its delta graphs (appended documents) if merge_deltas
+    Returns ---> dict with adj (CSR adjacency), infer_idx_start, n_docs (no. of document nodes before the word nodes),
+    n_appended (no. of appended document nodes, after the word nodes), vocab, idf (None if not saved), n_deltas """
+    completeName = os.path.join("./data/", filename)
+    with np.load(completeName, allow_pickle=False) as f:
+        adj = sp.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+        vocab = f["vocab"]
+        infer_idx_start = int(f["infer_idx_start"])
+        idf = f["idf"] if "idf" in f.files else None
+    n_docs = adj.shape[0] - len(vocab)
+    n_deltas = 0
+    while merge_deltas and os.path.isfile(os.path.join("./data/", delta_filename(filename, n_deltas))):
+        delta = load_graph_delta(delta_filename(filename, n_deltas))
+        adj = apply_graph_delta(adj, n_docs, len(vocab), delta)
+        idf = delta["idf"]
+        n_deltas += 1
+    return {"adj": adj, "infer_idx_start": infer_idx_start, "n_docs": n_docs, \
+            "n_appended": adj.shape[0] - n_docs - len(vocab), "vocab": vocab, "idf": idf, "n_deltas": n_deltas}
+
+
+def document_nodes(n_docs, n_vocab, n_nodes):
+    """ node ids of the documents of a text graph of n_nodes nodes, in document order (see load_text_graph) """
+    return np.concatenate((np.arange(n_docs), np.arange(n_docs + n_vocab, n_nodes))).astype(np.int64)
+
+
+def delta_filename(filename, idx):
+    """ file name of the idx-th delta graph of text graph filename """
+    return filename.replace(".npz", "_delta_%d.npz" % idx)
+
+
+def save_graph_delta(filename, doc_word, word_word, affected, idf):
+    """ saves the next delta graph of text graph filename (appended documents) into ./data/
+    doc_word: sparse (m X n_vocab) Tf-idf rows of the appended documents
+    word_word: sparse symmetric (n_vocab X n_vocab) PMI edges of affected words, replacing all their previous edges
+    affected: vocab ids of words whose PMI edges were recomputed
+    idf: updated inverse document frequencies
+    Returns ---> index of saved delta """
+    idx = 0
+    while os.path.isfile(os.path.join("./data/", delta_filename(filename, idx))):
+        idx += 1
+    doc_word, word_word = sp.csr_matrix(doc_word, dtype=np.float32), sp.csr_matrix(word_word, dtype=np.float32)
+    np.savez(os.path.join("./data/", delta_filename(filename, idx)), \
+                        dw_data=doc_word.data, dw_indices=doc_word.indices, dw_indptr=doc_word.indptr, \
+                        dw_shape=np.array(doc_word.shape, dtype=np.int64), \
+                        ww_data=word_word.data, ww_indices=word_word.indices, ww_indptr=word_word.indptr, \
+                        ww_shape=np.array(word_word.shape, dtype=np.int64), \
+                        affected=np.asarray(affected, dtype=np.int64), idf=np.asarray(idf, dtype=np.float64))
+    return idx
+
+
+def load_graph_delta(filename):
+    """ loads delta graph saved by save_graph_delta. Returns ---> dict with doc_word, word_word, affected, idf """
+    with np.load(os.path.join("./data/", filename), allow_pickle=False) as f:
+        doc_word = sp.csr_matrix((f["dw_data"], f["dw_indices"], f["dw_indptr"]), shape=tuple(f["dw_shape"]))
+        word_word = sp.csr_matrix((f["ww_data"], f["ww_indices"], f["ww_indptr"]), shape=tuple(f["ww_shape"]))
+        return {"doc_word": doc_word, "word_word": word_word, "affected": f["affected"], "idf": f["idf"]}
+
+
+def apply_graph_delta(adj, n_docs, n_vocab, delta):
+    """ merges delta graph into text graph adjacency, whose word nodes come after its first n_docs document nodes.
+    Appended documents become nodes after all existing nodes, so that the ids of existing nodes (and the node
+    embeddings of models trained on the graph) are kept; PMI edges of affected words are replaced.
+    Returns ---> merged CSR adjacency """
+    words = np.arange(n_docs, n_docs + n_vocab)
+    docs = document_nodes(n_docs, n_vocab, adj.shape[0])
+    doc_word, word_word = adj[docs][:, words], adj[words][:, words]
+    keep = np.ones(n_vocab, dtype=np.float32)
+    keep[delta["affected"]] = 0
+    word_word = sp.diags(keep)@word_word@sp.diags(keep) + delta["word_word"]
+    doc_word = sp.vstack((doc_word, delta["doc_word"]), format="csr")
+    return build_adjacency(doc_word, word_word, n_appended=doc_word.shape[0] - n_docs)
+
+
+def remove_graph_deltas(filename):
+    """ deletes delta graphs of text graph filename (eg. after rebuilding the full graph) """
+    idx = 0
+    while os.path.isfile(os.path.join("./data/", delta_filename(filename, idx))):
+        os.remove(os.path.join("./data/", delta_filename(filename, idx)))
+        idx += 1
+
+
+def save_graph_stats(filename, occurrences, n_i, no_windows, doc_freq, n_docs, window):
+    """ saves raw corpus statistics of the text graph into ./data/ (uncompressed, as rewritten on every update)
+    occurrences: sparse symmetric word co-occurrence counts (only upper triangle is saved), n_i: windows containing
+    each word, no_windows: total windows, doc_freq: documents containing each word, n_docs: total documents """
+    occurrences = sp.triu(occurrences, k=1, format="csr")
+    np.savez(os.path.join("./data/", filename), data=occurrences.data.astype(np.int64), \
+                        indices=occurrences.indices, indptr=occurrences.indptr, \
+                        shape=np.array(occurrences.shape, dtype=np.int64), n_i=np.asarray(n_i, dtype=np.int64), \
+                        no_windows=np.array(no_windows, dtype=np.int64), doc_freq=np.asarray(doc_freq, dtype=np.int64), \
+                        n_docs=np.array(n_docs, dtype=np.int64), window=np.array(window, dtype=np.int64))
+
+
+def load_graph_stats(filename):
+    """ loads corpus statistics saved by save_graph_stats
+    Returns ---> dict with occurrences (symmetric CSR), n_i, no_windows, doc_freq, n_docs, window """
+    with np.load(os.path.join("./data/", filename), allow_pickle=False) as f:
+        occurrences = sp.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+        stats = {"occurrences": (occurrences + occurrences.T).tocsr(), "n_i": f["n_i"], \
+                 "no_windows": int(f["no_windows"]), "doc_freq": f["doc_freq"], "n_docs": int(f["n_docs"]), \
+                 "window": int(f["window"])}
+    return stats
+
+
+def extend_node_rows(checkpoint, net, n_nodes):
+    """ extends the node parameters (rows per graph node, eg. first layer weights of identity features) of checkpoint,
+    saved for a text graph since appended with documents (new nodes come last, see apply_graph_delta), to the n_nodes
+    rows of net: rows of the new nodes are taken from net as initialized, their optimizer moments are zero.
+    Raises ValueError if other parameter shapes differ, ie. checkpoint was trained on another graph or settings.
+    Returns ---> names of extended parameters """
+    state_dict, current = checkpoint["state_dict"], net.state_dict()
+    extended = {}
+    for name, value in state_dict.items():
+        if (name in current) and (current[name].shape != value.shape):
+            if (current[name].shape[0] == n_nodes) and (value.shape[0] < n_nodes) and \
+               (current[name].shape[1:] == value.shape[1:]):
+                extended[name] = value.shape[0]
+                state_dict[name] = torch.cat((value, current[name][value.shape[0]:].to(value.device)), 0)
+            else:
+                raise ValueError("Checkpoint parameter %s has shape %s, the model %s: it was trained on another "
+                                 "text graph or with other settings, delete the checkpoint to train from scratch." % \
+                                 (name, tuple(value.shape), tuple(current[name].shape)))
+    optimizer = checkpoint.get("optimizer")
+    if (len(extended) > 0) and (optimizer is not None):
+        # optimizer state is keyed by position in net.parameters()
+        for idx, (name, param) in enumerate(net.named_parameters()):
+            if (name in extended) and (idx in optimizer["state"]):
+                for key, value in optimizer["state"][idx].items():
+                    if torch.is_tensor(value) and (value.dim() > 0) and (value.shape[0] == extended[name]):
+                        padding = value.new_zeros((n_nodes - value.shape[0],) + tuple(value.shape[1:]))
+                        optimizer["state"][idx][key] = torch.cat((value, padding), 0)
+    return list(extended)
+
+
+SPLIT_ARRAYS = ["selected", "test_idxs", "labels_selected", "labels_not_selected"]
+
+
+def save_node_split(split, key):
+    """ caches train/test node split (dict of SPLIT_ARRAYS) as int64 .npy files in ./data/
+    key: array identifying the graph and split settings the split was made for """
+    for name in SPLIT_ARRAYS:
+        np.save(os.path.join("./data/", "%s.npy" % name), np.asarray(split[name], dtype=np.int64))
+    np.save(os.path.join("./data/", "split_key.npy"), np.asarray(key, dtype=np.float64))
+
+
+def load_node_split(key):
+    """ loads node split cached by save_node_split as (copy-on-write) memory-mapped arrays
+    Returns ---> dict of SPLIT_ARRAYS, None if not cached or cached for another key """
+    paths = [os.path.join("./data/", "%s.npy" % name) for name in SPLIT_ARRAYS + ["split_key"]]
+    if not all(os.path.isfile(path) for path in paths):
+        return None
+    cached_key = np.load(paths[-1])
+    if (cached_key.shape != np.shape(key)) or not np.array_equal(cached_key, np.asarray(key, dtype=np.float64)):
+        return None
+    return {name: np.load(path, mmap_mode="c") for name, path in zip(SPLIT_ARRAYS, paths)}
+
+
+def to_networkx(adj, vocab):
+    """ converts CSR text graph into networkx.Graph with document (int) and word (str) node labels """
+    import networkx as nx
+    n_docs = adj.shape[0] - len(vocab)
+    if hasattr(nx, "from_scipy_sparse_array"):
+        G = nx.from_scipy_sparse_array(adj, edge_attribute="weight")
+    else:
+        G = nx.from_scipy_sparse_matrix(adj, edge_attribute="weight")
+    mapping = {n_docs + i: str(w) for i, w in enumerate(vocab)}
+    return nx.relabel_nodes(G, mapping, copy=False)
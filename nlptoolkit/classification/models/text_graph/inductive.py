@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Inductive inference of unseen documents with a trained GCN/GAT text graph classifier, without rebuilding the graph
+"""
+import numpy as np
+import scipy.sparse as sp
+import torch
+from .cooccurrence import encode_corpus
+import logging
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
+                    datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+logger = logging.getLogger(__file__)
+
+
+FILTERED_TOKENS = frozenset([".", ",", ";", "&", "'s", ":", "?", "!", "(", ")", "@", \
+                             "'", "'m", "'no", "***", "--", "...", "[", "]", "''"])
+
+
+def filter_tokens(tokens):
+    """ removes punctuation tokens, as done when building the text graph """
+    return [token for token in tokens if token not in FILTERED_TOKENS]
+
+
+def tfidf_rows(docs, vocab, idf):
+    """ Tf-idf rows of tokenized documents over stored vocab & idf, as computed by the TfidfVectorizer used to build
+    the text graph (raw counts x idf, l2-normalized, rounded to 3 decimals); out-of-vocab tokens are ignored
+    Returns ---> sparse (n_docs X n_vocab) CSR """
+    tokens, offsets = encode_corpus(docs, vocab)
+    return tfidf_from_tokens(tokens, offsets, idf)
+
+
+def tfidf_from_tokens(tokens, offsets, idf):
+    """ Tf-idf rows (see tfidf_rows) of encoded corpus (tokens, offsets as returned by encode_corpus) """
+    n_docs, n_vocab = len(offsets) - 1, len(idf)
+    rows = np.repeat(np.arange(n_docs), np.diff(offsets))
+    keep = tokens >= 0
+    counts = sp.csr_matrix((np.ones(keep.sum(), dtype=np.float64), (rows[keep], tokens[keep])), \
+                           shape=(n_docs, n_vocab))
+    counts.sum_duplicates()
+    tfidf = (counts@sp.diags(np.asarray(idf, dtype=np.float64))).tocsr()
+    norms = np.sqrt(np.bincount(np.repeat(np.arange(n_docs), np.diff(tfidf.indptr)), weights=tfidf.data**2, \
+                                minlength=n_docs))
+    norms[norms == 0] = 1
+    tfidf.data /= np.repeat(norms, np.diff(tfidf.indptr))
+    tfidf.data = np.round(tfidf.data, 3)
+    tfidf.eliminate_zeros()
+    return tfidf.tocsr()
+
+
+def local_graph(rows, degrees):
+    """ normalized adjacency of nodes connected to the text graph, D^-1/2 (A + I) D^-1/2 with degrees as in the graph
+    rows: sparse (m X N) edge weights from the m (new or existing) nodes to the graph nodes, without self-loops
+    degrees: (N) unweighted node degrees of the text graph adjacency A
+    Returns --->
+    cols: graph node ids of the neighbours of the m nodes
+    A_hat: sparse ((m + len(cols)) X (m + len(cols))) CSR, the m nodes first, then their neighbours. Only rows of the
+           m nodes are filled, as outputs of the neighbours are cached """
+    rows = sp.csr_matrix(rows)
+    m = rows.shape[0]
+    cols, local_cols = np.unique(rows.indices, return_inverse=True)
+    row_degrees = np.diff(rows.indptr).astype(np.float64)
+    row_idxs = np.repeat(np.arange(m), np.diff(rows.indptr))
+    values = rows.data/np.sqrt(row_degrees[row_idxs]*degrees[cols][local_cols])
+    self_loops = np.zeros(m)
+    self_loops[row_degrees > 0] = 1/row_degrees[row_degrees > 0]
+    n = m + len(cols)
+    A_hat = sp.csr_matrix((np.concatenate((values, self_loops)).astype(np.float32), \
+                           (np.concatenate((row_idxs, np.arange(m))), np.concatenate((m + local_cols, np.arange(m))))), \
+                          shape=(n, n))
+    return cols, A_hat
+
+
+class InductiveClassifier(object):
+    """ Classifies unseen documents with a trained 2-layer text graph model (gcn or SpGAT).
+    Each new document is connected to the existing word nodes through its Tf-idf row (stored vocab & idf), the
+    word-word PMI edges of the graph are left as they are. First layer outputs of word nodes are computed once
+    (in chunks of chunk_size words) and cached, so each document only needs message passing over its own word neighbours.
+    net: trained model with hidden(X, A) (first layer) and output(X, A) (second layer & classifier) methods
+    adj: text graph adjacency A (scipy sparse), vocab & idf: as saved with the text graph
+    n_docs: number of documents before the word nodes (default: all nodes but words, ie. no appended documents)
+    to_adj: converts scipy sparse adjacency into the model's input format (to_torch_sparse or to_edge_index)
+    New documents have no trained node embedding, so their own input features are zero. """
+    def __init__(self, net, adj, vocab, idf, to_adj, n_docs=None, chunk_size=1000):
+        if idf is None:
+            raise ValueError("Text graph was saved without idf, rebuild it with generate_text_graph to infer unseen documents.")
+        self.net = net
+        self.vocab = vocab
+        self.idf = idf
+        self.to_adj = to_adj
+        adj = sp.csr_matrix(adj)
+        self.degrees = adj.getnnz(axis=1)
+        self.n_nodes = adj.shape[0]
+        self.n_docs = (self.n_nodes - len(vocab)) if n_docs is None else n_docs
+        n_words_end = self.n_docs + len(vocab)
+        self.device = next(net.parameters()).device
+        logger.info("Caching word node outputs of first graph layer...")
+        self.net.eval()
+        with torch.no_grad():
+            self.H = torch.cat([self.hidden(adj[i:min(i + chunk_size, n_words_end)], np.arange(i, min(i + chunk_size, n_words_end)))[0] \
+                                for i in range(self.n_docs, n_words_end, chunk_size)], dim=0)
+
+    def hidden(self, rows, row_ids=None):
+        """ first layer outputs of nodes with adjacency rows (m X N), row_ids = their graph node ids (None for new nodes)
+        Returns ---> (first layer outputs of the m nodes, neighbour ids, local model input adjacency) """
+        cols, A_hat = local_graph(rows, self.degrees)
+        m, n = rows.shape[0], rows.shape[0] + len(cols)
+        # one-hot (identity) features of graph nodes, zero features for new nodes
+        local_ids = np.arange(m, n) if row_ids is None else np.arange(n)
+        global_ids = cols if row_ids is None else np.concatenate((row_ids, cols))
+        X = torch.sparse_coo_tensor(torch.from_numpy(np.vstack((local_ids, global_ids)).astype(np.int64)), \
+                                    torch.ones(len(local_ids)), torch.Size([n, self.n_nodes]))
+        A_hat = self.to_adj(A_hat).to(self.device)
+        H = self.net.hidden(X.to(self.device), A_hat)[:m]
+        return H, cols, A_hat
+
+    def infer_docs(self, docs):
+        """ docs: list of tokenized documents. Returns ---> (len(docs) X num_classes) model outputs """
+        doc_word = tfidf_rows(docs, self.vocab, self.idf)
+        rows = sp.csr_matrix((doc_word.data, doc_word.indices + self.n_docs, doc_word.indptr), \
+                             shape=(len(docs), self.n_nodes))
+        self.net.eval()
+        with torch.no_grad():
+            H, cols, A_hat = self.hidden(rows)
+            H = torch.cat((H, self.H[torch.from_numpy(cols - self.n_docs).to(self.device)]), dim=0)
+            return self.net.output(H, A_hat)[:len(docs)]
+
+    def predict(self, docs):
+        """ predicted labels of tokenized documents """
+        return list(self.infer_docs(docs).max(1)[1].cpu().numpy())
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Adam for mini-batch GCN/GAT training, which also takes the sparse gradients of the first layer node embeddings
+"""
+import math
+import torch
+import torch.optim as optim
+
+
+class DenseSparseAdam(optim.Optimizer):
+    """ Adam over parameters with dense gradients, and lazy Adam (as optim.SparseAdam) over those with sparse gradients
+    (eg. nn.Embedding(sparse=True) or F.embedding(sparse=True) lookups): only the moments and weights of the rows
+    looked up in a step are updated, so that a mini-batch step costs O(sampled nodes) instead of O(N) """
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8):
+        super(DenseSparseAdam, self).__init__(params, dict(lr=lr, betas=betas, eps=eps))
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+        for group in self.param_groups:
+            beta1, beta2 = group["betas"]
+            for p in group["params"]:
+                if p.grad is None:
+                    continue
+                state = self.state[p]
+                if len(state) == 0:
+                    state["step"] = 0
+                    state["exp_avg"] = torch.zeros_like(p, memory_format=torch.preserve_format)
+                    state["exp_avg_sq"] = torch.zeros_like(p, memory_format=torch.preserve_format)
+                state["step"] += 1
+                exp_avg, exp_avg_sq = state["exp_avg"], state["exp_avg_sq"]
+                step_size = group["lr"]*math.sqrt(1 - beta2**state["step"])/(1 - beta1**state["step"])
+                if p.grad.is_sparse:
+                    grad = p.grad.coalesce() # unique rows
+                    rows, values = grad.indices()[0], grad.values()
+                    m = exp_avg[rows].mul_(beta1).add_(values, alpha=1 - beta1)
+                    v = exp_avg_sq[rows].mul_(beta2).addcmul_(values, values, value=1 - beta2)
+                    exp_avg[rows], exp_avg_sq[rows] = m, v
+                    p.index_add_(0, rows, m.div_(v.sqrt_().add_(group["eps"])), alpha=-step_size)
+                else:
+                    grad = p.grad
+                    exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+                    exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+                    p.addcdiv_(exp_avg, exp_avg_sq.sqrt().add_(group["eps"]), value=-step_size)
+        return loss
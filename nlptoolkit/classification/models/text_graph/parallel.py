@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Multiprocessing text graph preprocessing: the corpus is split into contiguous shards, whose tokens, vocab counts
+and co-occurrence counts are computed by worker processes and merged in shard order. All merged statistics are
+integer counts, so results are identical for any number of workers.
+"""
+from collections import Counter
+from multiprocessing import Pool
+import numpy as np
+from .cooccurrence import encode_corpus, count_pairs, merge_counts, pairs_to_matrix, document_frequencies
+import logging
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
+                    datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+logger = logging.getLogger(__file__)
+
+
+def shard(items, num_workers):
+    """ splits list into num_workers contiguous shards """
+    bounds = np.linspace(0, len(items), max(num_workers, 1) + 1).astype(np.int64)
+    return [items[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def map_shards(func, shards, num_workers):
+    """ func over shards, in worker processes if num_workers > 1; results are returned in shard order """
+    if num_workers > 1:
+        with Pool(num_workers) as pool:
+            return pool.map(func, shards)
+    return [func(s) for s in shards]
+
+
+def _tokenize_shard(args):
+    texts, tokenizer = args
+    docs = [tokenizer(text) for text in texts]
+    term_counts = Counter()
+    for doc in docs:
+        term_counts.update(doc)
+    return docs, term_counts
+
+
+def tokenize_corpus(texts, tokenizer, num_workers=1):
+    """ tokenizes texts with tokenizer (a picklable function), in num_workers processes
+    Returns ---> (list of tokenized documents, Counter of corpus term frequencies) """
+    results = map_shards(_tokenize_shard, [(s, tokenizer) for s in shard(list(texts), num_workers)], num_workers)
+    docs, term_counts = [], Counter()
+    for shard_docs, shard_counts in results:
+        docs.extend(shard_docs)
+        term_counts.update(shard_counts)
+    return docs, term_counts
+
+
+def select_vocab(term_counts, max_features=None):
+    """ vocab of the max_features most frequent terms, sorted, as selected by TfidfVectorizer(max_features) """
+    terms = np.array(sorted(term_counts), dtype=np.str_)
+    if (max_features is not None) and (max_features < len(terms)):
+        tfs = np.array([term_counts[t] for t in terms], dtype=np.int64)
+        terms = terms[np.sort((-tfs).argsort()[:max_features])]
+    return terms
+
+
+def _count_shard(args):
+    docs, vocab, window = args
+    tokens, offsets = encode_corpus(docs, vocab)
+    keys, counts, n_i, no_windows = count_pairs(tokens, offsets, len(vocab), window=window)
+    return tokens, offsets, keys, counts, n_i, no_windows, document_frequencies(tokens, offsets, len(vocab))
+
+
+def count_corpus(docs, vocab, window=10, num_workers=1):
+    """ encodes tokenized documents and counts their co-occurrences & document frequencies, in num_workers processes
+    Returns ---> (tokens, offsets) as encode_corpus, (occurrences, n_i, no_windows) as count_cooccurrences, doc_freq """
+    results = map_shards(_count_shard, [(s, vocab, window) for s in shard(list(docs), num_workers)], num_workers)
+    tokens = np.concatenate([r[0] for r in results])
+    lengths = np.concatenate([np.diff(r[1]) for r in results])
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    keys, counts = merge_counts([r[2] for r in results], [r[3] for r in results])
+    n_i = np.sum([r[4] for r in results], axis=0)
+    no_windows = int(sum(r[5] for r in results))
+    doc_freq = np.sum([r[6] for r in results], axis=0)
+    return tokens, offsets, pairs_to_matrix(keys, counts, len(vocab)), n_i, no_windows, doc_freq
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+GraphSAGE-style k-hop neighbour sampling over the CSR text graph, for mini-batch GCN/GAT training
+"""
+import numpy as np
+import scipy.sparse as sp
+
+
+class NeighborSampler(object):
+    """ Samples k-hop neighbourhoods around batches of seed (labelled) nodes
+    adj: sparse (N x N) adjacency (eg. normalized A_hat), diagonal entries are kept as self-loops of every sampled node
+    fanouts: max no. of neighbours sampled per node at each hop (len(fanouts) = no. of hops = no. of graph layers)
+    seeds: seed nodes to iterate over in batches of batch_size
+    Iterating yields (batch, nodes, sub_adj) --->
+    batch: positions (into seeds) of this batch's seed nodes
+    nodes: global ids of sampled subgraph nodes, the batch seed nodes come first
+    sub_adj: sparse (len(nodes) X len(nodes)) CSR adjacency of sampled edges (rows = destination nodes), weights of
+             nodes whose neighbours were subsampled are rescaled by degree/no. sampled
+    """
+    def __init__(self, adj, fanouts, seeds, batch_size, shuffle=True, seed=None):
+        adj = sp.csr_matrix(adj)
+        self.diag = adj.diagonal()
+        adj = adj - sp.diags(self.diag)
+        adj.eliminate_zeros()
+        self.adj = adj.tocsr()
+        self.degrees = np.diff(self.adj.indptr)
+        self.fanouts = list(fanouts)
+        self.seeds = np.asarray(seeds, dtype=np.int64)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+
+    def __len__(self):
+        return int(np.ceil(len(self.seeds)/float(self.batch_size)))
+
+    def __iter__(self):
+        order = self.rng.permutation(len(self.seeds)) if self.shuffle else np.arange(len(self.seeds))
+        for i in range(0, len(order), self.batch_size):
+            batch = order[i:(i + self.batch_size)]
+            nodes, sub_adj = self.sample(self.seeds[batch])
+            yield batch, nodes, sub_adj
+
+    def sample_neighbors(self, nodes, fanout):
+        """ samples up to fanout neighbours of each node (all of them if degree <= fanout)
+        Returns ---> (dst, src, weight) arrays of sampled edges """
+        indptr, degrees = self.adj.indptr, self.degrees[nodes]
+        full = degrees <= fanout
+        # take all edges of low-degree nodes
+        f_nodes, f_deg = nodes[full], degrees[full]
+        f_pos = np.repeat(indptr[f_nodes] - np.cumsum(f_deg) + f_deg, f_deg) + np.arange(f_deg.sum())
+        f_dst = np.repeat(f_nodes, f_deg)
+        # sample (with replacement, then deduplicated) edges of high-degree nodes
+        s_nodes, s_deg = nodes[~full], degrees[~full]
+        s_pos = (self.rng.rand(len(s_nodes), fanout)*s_deg[:, None]).astype(np.int64) + indptr[s_nodes][:, None]
+        s_owner = np.repeat(np.arange(len(s_nodes)), fanout)
+        s_pos, first = np.unique(s_pos.ravel(), return_index=True) # CSR positions are unique across rows
+        s_owner = s_owner[first]
+        scale = s_deg/np.maximum(np.bincount(s_owner, minlength=len(s_nodes)), 1).astype(np.float64)
+        s_weight = self.adj.data[s_pos]*scale[s_owner]
+        return np.concatenate((f_dst, s_nodes[s_owner])), \
+               np.concatenate((self.adj.indices[f_pos], self.adj.indices[s_pos])), \
+               np.concatenate((self.adj.data[f_pos], s_weight)).astype(self.adj.dtype)
+
+    def sample(self, seeds):
+        """ samples len(fanouts)-hop neighbourhood of seeds, returns (nodes, sub_adj) """
+        seeds = np.asarray(seeds, dtype=np.int64)
+        nodes, frontier = [seeds], np.unique(seeds)
+        visited = frontier
+        rows, cols, vals = [], [], []
+        for fanout in self.fanouts:
+            dst, src, weight = self.sample_neighbors(frontier, fanout)
+            rows.append(dst); cols.append(src); vals.append(weight)
+            frontier = np.setdiff1d(np.unique(src), visited, assume_unique=True)
+            visited = np.union1d(visited, frontier)
+            nodes.append(frontier)
+        nodes = np.concatenate(nodes)
+        order = np.argsort(nodes, kind="mergesort")
+        local = lambda x: order[np.searchsorted(nodes[order], x)]
+        rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+        n = len(nodes)
+        sub_adj = sp.csr_matrix((vals, (local(rows), local(cols))), shape=(n, n)) + sp.diags(self.diag[nodes])
+        return nodes, sub_adj.tocsr()
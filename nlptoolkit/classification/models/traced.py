@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+TorchScript export of trained classifiers (BERT, XLNet, GCN) into a self-contained artifact, ./data/traced_model_<model_no>.pt,
+holding the traced model with its fine-tuned weights and the settings needed to run it. Loading it does not construct
+the model classes, read the pretrained base weights or load checkpoints.
+"""
+import os
+import copy
+import json
+import numpy as np
+import scipy.sparse as sp
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from .text_graph.inductive import tfidf_rows, local_graph
+from .text_graph.graph_builder import to_torch_sparse
+import logging
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
+                    datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+logger = logging.getLogger(__file__)
+
+
+def traced_path(model_no):
+    return os.path.join("./data/", "traced_model_%d.pt" % model_no)
+
+
+class LogitsModule(nn.Module):
+    """ (input_ids, token_type_ids, attention_mask) ---> logits of trained BERT (model_no 1) or XLNet (model_no 2) """
+    def __init__(self, net, model_no):
+        super(LogitsModule, self).__init__()
+        self.net = net
+        self.model_no = model_no
+
+    def forward(self, input_ids, token_type_ids, attention_mask):
+        outputs = self.net(input_ids, token_type_ids=token_type_ids, attention_mask=attention_mask)
+        return outputs if self.model_no == 1 else outputs[0]
+
+
+class GraphModule(nn.Module):
+    """ Inductive inference of new documents with a trained gcn, as text_graph.inductive.InductiveClassifier
+    (A_doc, cols) ---> outputs of the new documents, where
+    A_doc: sparse (m X (m + len(cols))) normalized adjacency rows of the m new documents (local_graph)
+    cols: graph node ids of their word neighbours
+    H: cached first layer outputs of the word nodes. Text graph vocab, idf and degrees are kept as buffers. """
+    def __init__(self, net, H, n_docs, idf, degrees):
+        super(GraphModule, self).__init__()
+        self.weight, self.bias = net.weight, net.bias
+        self.weight2, self.bias2 = net.weight2, net.bias2
+        self.fc1 = net.fc1
+        self.n_docs = n_docs
+        self.register_buffer("H", H)
+        self.register_buffer("idf", torch.as_tensor(idf, dtype=torch.float64))
+        self.register_buffer("degrees", torch.as_tensor(degrees, dtype=torch.int64))
+
+    def forward(self, A_doc, cols):
+        # new documents have zero input features, word nodes have one-hot features (I@W = W)
+        X = torch.cat((torch.zeros(A_doc.shape[1] - cols.shape[0], self.weight.shape[1]), self.weight[cols]), 0)
+        if self.bias is not None:
+            X = X + self.bias
+        H = torch.cat((F.relu(torch.sparse.mm(A_doc, X)), self.H[cols - self.n_docs]), 0)
+        X = torch.mm(H, self.weight2)
+        if self.bias2 is not None:
+            X = X + self.bias2
+        return self.fc1(F.relu(torch.sparse.mm(A_doc, X)))
+
+
+class TracedGraphClassifier(object):
+    """ predict(docs) of InductiveClassifier, with a traced GraphModule """
+    def __init__(self, module, vocab, n_docs=None):
+        self.module = module
+        self.vocab = vocab
+        self.idf = module.idf.numpy()
+        self.degrees = module.degrees.numpy()
+        self.n_nodes = len(self.degrees)
+        self.n_docs = (self.n_nodes - len(vocab)) if n_docs is None else n_docs
+
+    def predict(self, docs):
+        doc_word = tfidf_rows(docs, self.vocab, self.idf)
+        rows = sp.csr_matrix((doc_word.data, doc_word.indices + self.n_docs, doc_word.indptr), \
+                             shape=(len(docs), self.n_nodes))
+        cols, A_hat = local_graph(rows, self.degrees)
+        with torch.no_grad():
+            outputs = self.module(to_torch_sparse(A_hat[:len(docs)]), torch.from_numpy(cols.astype(np.int64)))
+        return list(outputs.max(1)[1].numpy())
+
+
+def export_traced(args, out_file=None):
+    """ traces the trained model of args.model_no (BERT, XLNet or GCN) as loaded by infer_from_trained, on CPU, and
+    saves it with its settings into out_file (default: traced_path(args.model_no)) """
+    from .infer import infer_from_trained
+    if args.model_no not in [0, 1, 2]:
+        raise ValueError("TorchScript export is only supported for GCN, BERT and XLNet (model_no 0, 1, 2).")
+    out_file = traced_path(args.model_no) if out_file is None else out_file
+    args = copy.copy(args)
+    args.traced = 0
+    inferer = infer_from_trained(args)
+    config = {"model_no": args.model_no, "num_classes": args.num_classes, "tokens_length": args.tokens_length}
+    extra_files = {}
+    logger.info("Tracing model...")
+    with torch.no_grad():
+        if args.model_no == 0:
+            graph = inferer.graph
+            module = GraphModule(graph.net.cpu(), graph.H.cpu(), graph.n_docs, graph.idf, graph.degrees).eval()
+            docs = [list(graph.vocab[:5]), list(graph.vocab[5:8])]
+            doc_word = tfidf_rows(docs, graph.vocab, graph.idf)
+            rows = sp.csr_matrix((doc_word.data, doc_word.indices + graph.n_docs, doc_word.indptr), \
+                                 shape=(len(docs), graph.n_nodes))
+            cols, A_hat = local_graph(rows, graph.degrees)
+            # sparse inputs cannot be cloned by the trace checker
+            traced = torch.jit.trace(module, (to_torch_sparse(A_hat[:len(docs)]), \
+                                              torch.from_numpy(cols.astype(np.int64))), check_trace=False)
+            config["n_docs"] = int(graph.n_docs)
+            extra_files["vocab.json"] = json.dumps([str(w) for w in graph.vocab])
+        else:
+            module = LogitsModule(inferer.net.cpu(), args.model_no).eval()
+            config.update({"model_type": inferer.model_type, "lower_case": inferer.lower_case, \
+                           "pad_left": inferer.pad_left})
+            input_ids = torch.randint(5, 100, (2, 16)).long()
+            attention_mask = torch.ones_like(input_ids)
+            if inferer.pad_left:
+                attention_mask[1, :4] = 0
+            else:
+                attention_mask[1, 12:] = 0
+            input_ids[attention_mask == 0] = 0
+            traced = torch.jit.trace(module, (input_ids, torch.zeros_like(input_ids), attention_mask))
+    extra_files["config.json"] = json.dumps(config)
+    torch.jit.save(traced, out_file, _extra_files=extra_files)
+    logger.info("Saved traced model as %s." % out_file)
+    return out_file
+
+
+def load_traced(model_no, in_file=None):
+    """ loads traced model artifact (see export_traced) on CPU
+    Returns ---> (traced module, config dict, text graph vocab (GCN) or None) """
+    in_file = traced_path(model_no) if in_file is None else in_file
+    extra_files = {"config.json": "", "vocab.json": ""}
+    module = torch.jit.load(in_file, map_location="cpu", _extra_files=extra_files)
+    module.eval()
+    config = json.loads(extra_files["config.json"])
+    vocab = json.loads(extra_files["vocab.json"]) if extra_files["vocab.json"] else None
+    logger.info("Loaded traced model from %s." % in_file)
+    return module, config, vocab
@@ -21,7 +21,11 @@ import os
 import json
 import six
 import copy
+import itertools
 from io import open
+from multiprocessing import Pool
+
+import numpy as np
 
 from .file_utils import cached_path
 
@@ -31,6 +35,25 @@ SPECIAL_TOKENS_MAP_FILE = 'special_tokens_map.json'
 ADDED_TOKENS_FILE = 'added_tokens.json'
 TOKENIZER_CONFIG_FILE = 'tokenizer_config.json'
 
+def _text_chunks(texts, chunk_size):
+    """ splits an iterable of texts into lists of chunk_size texts """
+    texts = iter(texts)
+    chunk = list(itertools.islice(texts, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(texts, chunk_size))
+
+_worker_tokenizer = None
+
+def _init_encode_worker(tokenizer):
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+def _encode_worker_chunk(args):
+    texts, max_length, add_special_tokens, kwargs = args
+    return _worker_tokenizer._encode_chunk(texts, max_length, add_special_tokens, **kwargs)
+
+
 class PreTrainedTokenizer(object):
     """ Base class for all tokenizers.
     Handle all the shared methods for tokenization and special tokens as well as methods dowloading/caching/loading pretrained tokenizers as well as adding tokens to the vocabulary.
@@ -690,6 +713,66 @@ class PreTrainedTokenizer(object):
         else:
             return first_sentence_tokens, second_sentence_tokens
 
+    def batch_encode(self, texts, max_length=None, add_special_tokens=False, pad=False, pad_left=False,
+                     num_workers=1, chunk_size=1000, **kwargs):
+        """
+        Converts an iterable of strings in arrays of ids (integer), as ``encode()`` on each string (truncated to
+        ``max_length`` ids if given, special tokens included). The texts are read ``chunk_size`` at a time, and the
+        chunks tokenized in a pool of ``num_workers`` processes (in this process if ``num_workers`` is 1).
+
+        Args:
+            texts: iterable of strings (a list, pandas Series, generator...)
+            max_length: Optional maximum number of ids of each sequence
+            add_special_tokens: if set to ``True``, the sequences will be encoded with the special tokens relative
+                to their model.
+            pad: if set to ``True``, the sequences are padded with the padding token (id 0 if not set) to ``max_length``
+                (or to the longest sequence if ``max_length`` is not set), on the left if ``pad_left``
+            num_workers: number of processes
+            chunk_size: number of texts per chunk
+            **kwargs: passed to the `self.tokenize()` method
+
+        Returns:
+            ``(input_ids, attention_mask)``: if ``pad``, int64 arrays of shape (number of texts, length), the mask
+            being 1 for ids and 0 for padding. Else a list of int64 arrays of ids and the int64 array of their lengths
+            (their attention masks being all ones).
+        """
+        chunks = ((chunk, max_length, add_special_tokens, kwargs) for chunk in _text_chunks(texts, chunk_size))
+        if num_workers > 1:
+            with Pool(num_workers, initializer=_init_encode_worker, initargs=(self,)) as pool:
+                results = list(pool.imap(_encode_worker_chunk, chunks))
+        else:
+            results = [self._encode_chunk(*args[:3], **args[3]) for args in chunks]
+        ids = np.concatenate([r[0] for r in results]) if results else np.zeros(0, dtype=np.int64)
+        lengths = np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=np.int64)
+        if not pad:
+            return np.split(ids, np.cumsum(lengths)[:-1]) if len(lengths) > 0 else [], lengths
+
+        length = max_length if max_length is not None else int(lengths.max(initial=0))
+        attention_mask = np.arange(length)[None, :] < lengths[:, None]
+        if pad_left:
+            attention_mask = attention_mask[:, ::-1]
+        pad_id = self.pad_token_id if self._pad_token is not None else 0
+        input_ids = np.full((len(lengths), length), pad_id, dtype=np.int64)
+        input_ids[attention_mask] = ids # rows are filled in order
+        return input_ids, attention_mask.astype(np.int64)
+
+    def _encode_chunk(self, texts, max_length=None, add_special_tokens=False, **kwargs):
+        """ Encodes list of strings. Returns the concatenated ids and the sequence lengths, as int64 arrays. """
+        n_special = 0
+        if add_special_tokens and (max_length is not None):
+            n_special = len(self.add_special_tokens_single_sentence([]))
+        sequences = []
+        for text in texts:
+            token_ids = self.convert_tokens_to_ids(self.tokenize(text, **kwargs))
+            if max_length is not None:
+                token_ids = token_ids[:(max_length - n_special)]
+            if add_special_tokens:
+                token_ids = self.add_special_tokens_single_sentence(token_ids)
+            sequences.append(token_ids)
+        lengths = np.array([len(token_ids) for token_ids in sequences], dtype=np.int64)
+        ids = np.fromiter(itertools.chain.from_iterable(sequences), dtype=np.int64, count=int(lengths.sum()))
+        return ids, lengths
+
     def add_special_tokens_single_sentence(self, token_ids):
         logger.warning("This tokenizer does not make use of special tokens. The sequence has been returned with no modification.")
         return token_ids
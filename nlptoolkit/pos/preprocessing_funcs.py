@@ -16,6 +16,7 @@ from tqdm import tqdm
 import logging
 from .utils.misc_utils import save_as_pickle, load_pickle
 from .utils.word_char_level_vocab import vocab_mapper
+from ..utils.token_store import save_token_store, token_store_exists, TokenStore
 from .models.BERT.tokenization_bert import BertTokenizer
 
 tqdm.pandas(desc="prog_bar")
@@ -40,7 +41,7 @@ def clean_and_tokenize_text(text, table, tokenizer, clean_only=False):
             text = [w for w in text if not any(char.isdigit() for char in w)]
         return text
     
-def get_POS_conll2003_data(args, load_extracted=True):
+def get_POS_conll2003_data(args):
     """
     Extracts POS dataset, saves then
     returns dataframe containing body (main text) and POS tags columns
@@ -54,18 +55,33 @@ def get_POS_conll2003_data(args, load_extracted=True):
         test_path = None
         df_test = None
         
-    if load_extracted:
-        logger.info("Loading pre-processed saved files...")
-        df_train =  load_pickle("df_train.pkl")
-        if os.path.isfile("./data/df_test.pkl") is not None:
-            df_test = load_pickle("df_test.pkl")
+    logger.info("Extracting data...")
+    with open(train_path, "r", encoding="utf8") as f:
+        text = f.readlines()
+    sents, ners = [], []
+    sent, sent_ner = [], []
+    for line in tqdm(text):
+        line = line.split(" ")
+        if len(line) == 4:
+            word, pos, btag, ner = line
+            if word != '-DOCSTART-':
+                sent.append(word.lower()); sent_ner.append(re.sub("\n", "", pos))
         else:
-            df_test = None
-        logger.info("Loaded!")
-            
-    else:
-        logger.info("Extracting data...")
-        with open(train_path, "r", encoding="utf8") as f:
+            sents.append(sent); ners.append(sent_ner)
+            sent, sent_ner = [], []
+    assert len(sents) == len(ners)
+    df_train = pd.DataFrame(data={"sents":sents, "poss":ners})
+    df_train['length'] = df_train.progress_apply(lambda x: len(x['poss']), axis=1)
+    df_train = df_train[df_train['length'] != 0]
+    ## to find num_classes
+    num_pos = []
+    for p in df_train['poss']:
+        num_pos.extend(p)
+    num_classes = len(list(set(num_pos)))
+    logger.info("Number of unique POS tags found: %d" % num_classes)
+    
+    if test_path is not None:
+        with open(test_path, "r", encoding="utf8") as f:
             text = f.readlines()
         sents, ners = [], []
         sent, sent_ner = [], []
@@ -79,38 +95,13 @@ def get_POS_conll2003_data(args, load_extracted=True):
                 sents.append(sent); ners.append(sent_ner)
                 sent, sent_ner = [], []
         assert len(sents) == len(ners)
-        df_train = pd.DataFrame(data={"sents":sents, "poss":ners})
-        df_train['length'] = df_train.progress_apply(lambda x: len(x['poss']), axis=1)
-        df_train = df_train[df_train['length'] != 0]
-        ## to find num_classes
-        num_pos = []
-        for p in df_train['poss']:
-            num_pos.extend(p)
-        num_classes = len(list(set(num_pos)))
-        logger.info("Number of unique POS tags found: %d" % num_classes)
-        
-        if test_path is not None:
-            with open(test_path, "r", encoding="utf8") as f:
-                text = f.readlines()
-            sents, ners = [], []
-            sent, sent_ner = [], []
-            for line in tqdm(text):
-                line = line.split(" ")
-                if len(line) == 4:
-                    word, pos, btag, ner = line
-                    if word != '-DOCSTART-':
-                        sent.append(word.lower()); sent_ner.append(re.sub("\n", "", pos))
-                else:
-                    sents.append(sent); ners.append(sent_ner)
-                    sent, sent_ner = [], []
-            assert len(sents) == len(ners)
-            df_test = pd.DataFrame(data={"sents":sents, "poss":ners})
-            df_test['length'] = df_test.progress_apply(lambda x: len(x['poss']), axis=1)
-            df_test = df_test[df_test['length'] != 0]
-                
+        df_test = pd.DataFrame(data={"sents":sents, "poss":ners})
+        df_test['length'] = df_test.progress_apply(lambda x: len(x['poss']), axis=1)
+        df_test = df_test[df_test['length'] != 0]
+            
     return df_train, df_test
 
-def get_POS_twitter_data(args, load_extracted=True):
+def get_POS_twitter_data(args):
     """
     Extracts POS twitter dataset, saves then
     returns dataframe containing body (main text) and POS tags columns
@@ -124,18 +115,29 @@ def get_POS_twitter_data(args, load_extracted=True):
         test_path = None
         df_test = None
         
-    if load_extracted:
-        logger.info("Loading pre-processed saved files...")
-        df_train =  load_pickle("df_train.pkl")
-        if os.path.isfile("./data/df_test.pkl") is not None:
-            df_test = load_pickle("df_test.pkl")
+    logger.info("Extracting data...")
+    with open(train_path, "r", encoding="utf8") as f:
+        text = f.readlines()
+        
+    sents, poss = [], []
+    sent, sent_pos = [], []
+    for line in tqdm(text):
+        line = line.split()
+        if len(line) == 2:
+            pos, word = line
+            sent.append(word.lower()); sent_pos.append(re.sub("\n", "", pos))
         else:
-            df_test = None
-        logger.info("Loaded!")
-            
-    else:
-        logger.info("Extracting data...")
-        with open(train_path, "r", encoding="utf8") as f:
+            assert len(sent) == len(sent_pos)
+            sents.append(sent); poss.append(sent_pos)
+            sent, sent_pos = [], []
+    assert len(sents) == len(poss)
+    
+    df_train = pd.DataFrame(data={"sents":sents, "poss":poss})
+    df_train['length'] = df_train.progress_apply(lambda x: len(x['poss']), axis=1)
+    df_train = df_train[df_train['length'] != 0]
+    
+    if test_path is not None:
+        with open(test_path, "r", encoding="utf8") as f:
             text = f.readlines()
             
         sents, poss = [], []
@@ -151,31 +153,10 @@ def get_POS_twitter_data(args, load_extracted=True):
                 sent, sent_pos = [], []
         assert len(sents) == len(poss)
         
-        df_train = pd.DataFrame(data={"sents":sents, "poss":poss})
-        df_train['length'] = df_train.progress_apply(lambda x: len(x['poss']), axis=1)
-        df_train = df_train[df_train['length'] != 0]
+        df_test = pd.DataFrame(data={"sents":sents, "poss":poss})
+        df_test['length'] = df_test.progress_apply(lambda x: len(x['poss']), axis=1)
+        df_test = df_test[df_test['length'] != 0]
         
-        if test_path is not None:
-            with open(test_path, "r", encoding="utf8") as f:
-                text = f.readlines()
-                
-            sents, poss = [], []
-            sent, sent_pos = [], []
-            for line in tqdm(text):
-                line = line.split()
-                if len(line) == 2:
-                    pos, word = line
-                    sent.append(word.lower()); sent_pos.append(re.sub("\n", "", pos))
-                else:
-                    assert len(sent) == len(sent_pos)
-                    sents.append(sent); poss.append(sent_pos)
-                    sent, sent_pos = [], []
-            assert len(sents) == len(poss)
-            
-            df_test = pd.DataFrame(data={"sents":sents, "poss":poss})
-            df_test['length'] = df_test.progress_apply(lambda x: len(x['poss']), axis=1)
-            df_test = df_test[df_test['length'] != 0]
-            
     return df_train, df_test
 
 def convert_poss_to_ids(poss, vocab):
@@ -214,7 +195,7 @@ def pos_preprocess(args, df_train, df_test=None, include_cls=True):
                                                                 axis=1)
             df_train['poss_ids'] = df_train.progress_apply(lambda x: x['sents_ids'][1][:(max_len - 2)], axis=1)
             df_train['sents_ids'] = df_train.progress_apply(lambda x: x['sents_ids'][0][:(max_len - 2)], axis=1)
-        save_as_pickle("df_train.pkl", df_train)
+        save_token_store("pos_train", df_train['sents_ids'], list(df_train['poss_ids']))
         
         if df_test is not None:
             if include_cls:
@@ -228,25 +209,23 @@ def pos_preprocess(args, df_train, df_test=None, include_cls=True):
                                                                     axis=1)
                 df_test['poss_ids'] = df_test.progress_apply(lambda x: x['sents_ids'][1][:(max_len - 2)], axis=1)
                 df_test['sents_ids'] = df_test.progress_apply(lambda x: x['sents_ids'][0][:(max_len - 2)], axis=1)
-            save_as_pickle("df_test.pkl", df_test)
+            save_token_store("pos_test", df_test['sents_ids'], list(df_test['poss_ids']))
     
     logger.info("Done and saved preprocessed data!")
     return vocab, tokenizer, df_train, df_test
 
 def preprocess_data(args):
-    if not os.path.isfile("./data/df_train.pkl"):
-        #df_train, df_test = get_POS_twitter_data(args, load_extracted=False)
-        df_train, df_test = get_POS_conll2003_data(args, load_extracted=False)
+    """ preprocesses data into token stores (sub-word token ids & per-token label ids) if not yet done
+    Returns ---> (train TokenStore, test TokenStore or None) """
+    if not token_store_exists("pos_train"):
+        #df_train, df_test = get_POS_twitter_data(args)
+        df_train, df_test = get_POS_conll2003_data(args)
         vocab, tokenizer, df_train, df_test = pos_preprocess(args, df_train, df_test)
     else:
-        df_train = load_pickle("df_train.pkl")
-        if os.path.isfile("./data/df_test.pkl"):
-            df_test = load_pickle("df_test.pkl")
-        else:
-            df_test = None
         logger.info("Loaded preprocessed data!")
-        
-    return df_train, df_test
+    train_store = TokenStore("pos_train")
+    test_store = TokenStore("pos_test") if token_store_exists("pos_test") else None
+    return train_store, test_store
     
 
 class Pad_Sequence():
@@ -266,30 +245,18 @@ class Pad_Sequence():
         return seqs_padded, labels_padded#, x_lengths, y_lengths
 
 class text_dataset(Dataset):
-    def __init__(self, df, args):
-        
-        def x_padder(x, max_len):
-            if len(x) < max_len:
-                x = np.array(x, dtype=int)
-                x = np.append(x, np.ones((max_len-x.shape[-1]), dtype=int), axis=0)
-                x = list(x)
-            return x
-        
-        if args.model_no == 1:
-            self.X = df["body"].apply(lambda x: x_padder(x, args.max_features_length))
-        else:
-            self.X = df["sents_ids"]
-        self.y = df["poss_ids"]
-        self.max_x_len = int(max(df["sents_ids"].apply(lambda x: len(x))))
-        self.max_y_len = int(max(df["poss_ids"].apply(lambda x: len(x))))
+    """ sentences of a TokenStore: (sub-word token ids, per-token label ids) """
+    def __init__(self, store, args):
+        self.store = store
+        self.max_x_len = int(store.lengths.max()) if len(store) > 0 else 0
+        self.max_y_len = self.max_x_len
         
     def __len__(self):
-        return len(self.y)
+        return len(self.store)
     
     def __getitem__(self, idx):
-        X = torch.tensor(self.X.iloc[idx])
-        y = torch.tensor(self.y.iloc[idx])
-        return X, y
+        X, y = self.store[idx]
+        return torch.from_numpy(X), torch.from_numpy(y)
 
 def load_dataloaders(args, use_other=False):
     """Load processed data if exist, else do preprocessing and loads it.  Feeds preprocessed data into dataloader, 
@@ -297,17 +264,17 @@ def load_dataloaders(args, use_other=False):
     logger.info("Loading dataloaders...")
     
     if not use_other:
-        df_train, df_test = preprocess_data(args)
+        train_store, test_store = preprocess_data(args)
         
-        trainset = text_dataset(df_train, args)
+        trainset = text_dataset(train_store, args)
         #max_features_length = trainset.max_x_len
         #max_seq_len = trainset.max_y_len
         train_length = len(trainset)
         train_loader = DataLoader(trainset, batch_size=args.batch_size, shuffle=True,\
                                   num_workers=0, collate_fn=Pad_Sequence(), pin_memory=False)
         
-        if df_test is not None:
-            testset = text_dataset(df_test, args)
+        if test_store is not None:
+            testset = text_dataset(test_store, args)
             test_length = len(testset)
             test_loader = DataLoader(testset, batch_size=args.batch_size, shuffle=True,\
                                       num_workers=0, collate_fn=Pad_Sequence(), pin_memory=False)
@@ -4,26 +4,15 @@ Created on Tue Jul 30 16:35:16 2019
 
 @author: WT
 """
-import spacy
-import re
+from ...utils.text_normalizer import TextTokenizer
 from string import ascii_lowercase
 from tqdm import tqdm
 
-class tokener(object):
-    def __init__(self, lang):
+class tokener(TextTokenizer):
+    def __init__(self, lang, light=True):
         d = {"en":"en_core_web_lg", "fr":"fr_core_news_sm"} # "en_core_web_lg"
-        self.ob = spacy.load(d[lang])
-    
-    def tokenize(self, sent):
-        sent = re.sub(r"[\*\"\n\\…\+\-\/\=\(\)‘•€\[\]\|♫:;]", " ", str(sent))
-        #sent = re.sub(r"\!+", "!", sent)
-        #sent = re.sub(r"\,+", ",", sent)
-        #sent = re.sub(r"\?+", "?", sent)
-        sent = re.sub(r"[ ]+", " ", sent)
-        sent = sent.lower()
-        sent = [token.text for token in self.ob.tokenizer(sent) if token.text != " "]
-        #sent = " ".join(sent)
-        return sent
+        # light: spaCy's rule-based tokenizer of lang only, else that of the model (same rules, slower to load)
+        super(tokener, self).__init__("punctuation_restoration", lang, model=None if light else d[lang])
 
 class vocab(object):
     def __init__(self, level="word", model="transformer"):
@@ -12,8 +12,8 @@ from torch.autograd import Variable
 from nltk.translate import bleu_score
 from torchnlp.metrics import get_moses_multi_bleu
 from .models.Transformer.Transformer import create_masks
-from .train_funcs import load_model_and_optimizer
-from .preprocessing_funcs import tokener, load_dataloaders
+from .train_funcs import load_model_and_optimizer, load_trained_model
+from .preprocessing_funcs import tokener, load_dataloaders, load_vocabs
 from tqdm import tqdm
 import time
 import logging
@@ -44,8 +44,19 @@ def calculate_bleu(src, trg, corpus_level=False, weights=(0.25, 0.25, 0.25, 0.25
         score = get_moses_multi_bleu(src, trg, lowercase=True)
     return score
 
+def beam_translate(net, src, src_mask, FR, args):
+    """ n-best lists of translations [(translated words, score), ...] of a batch of source sentences src (padded with
+    1), by batched beam search of args.beam_width hypotheses (greedy decoding if 1) """
+    e_out = net.encoder(src, src_mask)
+    trg = torch.full((src.size(0), 1), FR.vocab.stoi["<sos>"], dtype=torch.long, device=src.device)
+    n_best = net.beam_search(e_out, trg, src_mask, FR.vocab.stoi["<eos>"], beam_width=getattr(args, "beam_width", 1), \
+                             n_best=getattr(args, "n_best", 1), length_penalty=getattr(args, "length_penalty", 0.6))
+    return [[([FR.vocab.itos[i] for i in idxs], score) for idxs, score in hyps] for hyps in n_best]
+
 def evaluate_corpus_bleu(args, early_stopping=True, stop_no=1000):
-    args.batch_size = 1
+    """ corpus bleu of the translations of the first stop_no (if early_stopping) sentences of the training data,
+    translated in batches of args.infer_batch_size by beam_translate """
+    args.batch_size = getattr(args, "infer_batch_size", 32)
     train_iter, FR, EN, train_length = load_dataloaders(args)
     src_vocab = len(EN.vocab)
     trg_vocab = len(FR.vocab)
@@ -59,24 +70,21 @@ def evaluate_corpus_bleu(args, early_stopping=True, stop_no=1000):
                                                   trg_vocab, cuda, amp=amp)
     
     net.eval()
-    trg_init = FR.vocab.stoi["<sos>"]
-    trg_init = Variable(torch.LongTensor([trg_init])).unsqueeze(0)
+    eos_idx = FR.vocab.stoi["<eos>"]
     
     logger.info("Evaluating corpus bleu...")
     refs = []; hyps = []
     with torch.no_grad():
         for i, data in tqdm(enumerate(train_iter), total=len(train_iter)):
-            trg_input = trg_init
-            labels = data.FR[:,1:].contiguous().view(-1)
-            src_mask, trg_mask = create_masks(data.EN, trg_input)
+            src_mask, _ = create_masks(data.EN, None)
             if cuda:
-                data.EN = data.EN.cuda(); trg_input = trg_input.cuda(); labels = labels.cuda()
-                src_mask = src_mask.cuda(); trg_mask = trg_mask.cuda()
-            stepwise_translated_words, final_step_words = net(data.EN, trg_input, src_mask, None,\
-                                                              infer=True, trg_vocab_obj=FR)
-            refs.append([stepwise_translated_words]) # need to remove <eos> tokens
-            hyps.append([FR.vocab.itos[i] for i in labels[:-1]])
-            if early_stopping and ((i + 1) % stop_no == 0):
+                data.EN = data.EN.cuda(); src_mask = src_mask.cuda()
+            translated = beam_translate(net, data.EN, src_mask, FR, args)
+            for n_best, labels in zip(translated, data.FR[:,1:].tolist()):
+                labels = labels[:labels.index(eos_idx)] if eos_idx in labels else labels
+                refs.append([n_best[0][0]])
+                hyps.append([FR.vocab.itos[i] for i in labels])
+            if early_stopping and (len(refs) >= stop_no):
                 print(refs); print(hyps)
                 break
     score = calculate_bleu(refs, hyps, corpus_level=True)
@@ -93,28 +101,46 @@ class infer_from_trained(object):
         self.args.batch_size = 1
         
         logger.info("Loading tokenizer and model...")
-        self.tokenizer_en = tokener(args.src_lang)
-        train_iter, FR, EN, train_length = load_dataloaders(self.args)
+        self.tokenizer_en = tokener(self.args.src_lang)
+        # saved vocabs of the trained model, the training data is only read if they were not saved
+        FR, EN = load_vocabs(self.args)
         self.FR = FR
         self.EN = EN
-        self.train_iter = train_iter
-        self.train_length = train_length
         self.src_vocab = len(EN.vocab)
         self.trg_vocab = len(FR.vocab)
         
-        if self.args.fp16:    
-            from apex import amp
-        else:
-            amp = None
-        self.amp = amp
-        net, _, _, _, _, _ = load_model_and_optimizer(self.args, self.src_vocab, \
-                                                      self.trg_vocab, self.cuda, amp=amp)
-        self.net = net
+        self.net = load_trained_model(self.args, self.src_vocab, self.trg_vocab, self.cuda)
         self.net.eval()
         trg_init = FR.vocab.stoi["<sos>"]
         self.trg_init = Variable(torch.LongTensor([trg_init])).unsqueeze(0)
     
+    def translate_sentences(self, sents, batch_size=None):
+        """ n-best lists of translations [(translated sentence, score), ...] of sents, by beam_translate of batches of
+        sentences of similar lengths """
+        if batch_size is None:
+            batch_size = getattr(self.args, "infer_batch_size", 32)
+        token_ids = [[self.EN.vocab.stoi[tok] for tok in self.tokenizer_en.tokenize(sent).split()] for sent in sents]
+        order = sorted(range(len(sents)), key=lambda i: len(token_ids[i]))
+        translated = [None]*len(sents)
+        with torch.no_grad():
+            for b in range(0, len(order), batch_size):
+                batch = order[b:(b + batch_size)]
+                max_len = max(1, max(len(token_ids[i]) for i in batch))
+                src = torch.LongTensor([token_ids[i] + [1]*(max_len - len(token_ids[i])) for i in batch])
+                src_mask, _ = create_masks(src, None)
+                if self.cuda:
+                    src = src.cuda(); src_mask = src_mask.cuda()
+                for i, n_best in zip(batch, beam_translate(self.net, src, src_mask, self.FR, self.args)):
+                    translated[i] = [(" ".join(words), score) for words, score in n_best]
+        return translated
+    
     def infer_sentence(self, sent):
+        if getattr(self.args, "beam_width", 1) > 1:
+            n_best = self.translate_sentences([sent])[0]
+            print("Translated (beam search):")
+            for translated, score in n_best:
+                print("%.4f\t%s" % (score, translated))
+            return n_best[0][0], n_best
         sent = self.tokenizer_en.tokenize(sent).split()
         sent = [self.EN.vocab.stoi[tok] for tok in sent]
         sent = Variable(torch.LongTensor(sent)).unsqueeze(0)
@@ -147,8 +173,9 @@ class infer_from_trained(object):
         return predicted
     
     def infer_from_file(self, in_file="./data/input.txt", out_file="./data/output.txt"):
+        """ best translation of each line of in_file, translated in batches """
         df = pd.read_csv(in_file, header=None, names=["sents"])
-        df['labels'] = df.progress_apply(lambda x: self.infer_sentence(x['sents']), axis=1)
+        df['labels'] = [n_best[0][0] for n_best in self.translate_sentences([str(sent) for sent in df['sents']])]
         df.to_csv(out_file, index=False)
         logger.info("Done and saved as %s!" % out_file)
         return
@@ -156,7 +183,10 @@ class infer_from_trained(object):
 def infer(args, from_data=False):
     args.batch_size = 1
     tokenizer_en = tokener("en")
-    train_iter, FR, EN, train_length = load_dataloaders(args)
+    if from_data:
+        train_iter, FR, EN, train_length = load_dataloaders(args)
+    else:
+        FR, EN = load_vocabs(args)
     src_vocab = len(EN.vocab)
     trg_vocab = len(FR.vocab)
     
@@ -48,9 +48,9 @@ class Pos_Encoder(nn.Module):
         pe = pe.unsqueeze(0)
         self.register_buffer('pe', pe)
     
-    def forward(self, x):
-        # input = batch_size X seq_len X d_model
-        x = x + Variable(self.pe[:, :x.size(1)], requires_grad=False)
+    def forward(self, x, offset=0):
+        # input = batch_size X seq_len X d_model, offset = position of the first input
+        x = x + Variable(self.pe[:, offset:(offset + x.size(1))], requires_grad=False)
         return x
     
 def Attention(q, k, v, dh, mask=None, dropout=None):
@@ -66,11 +66,14 @@ def Attention(q, k, v, dh, mask=None, dropout=None):
     return output
 
 class MHAttention(nn.Module):
-    def __init__(self, d_model, n_heads, droprate=0.1):
+    def __init__(self, d_model, n_heads, droprate=0.1, legacy_heads=False):
         super(MHAttention, self).__init__()
         self.d_model = d_model
         self.n_heads = n_heads
         self.dh = d_model//n_heads
+        # legacy_heads: heads split over the flattened sequence (models trained before the per-position split), where
+        # the output at a position depends on the sequence length, so keys/values cannot be cached while decoding
+        self.legacy_heads = legacy_heads
         # learning layers for q,k,v
         self.q_matrix = nn.Linear(d_model, d_model)
         self.k_matrix = nn.Linear(d_model, d_model)
@@ -78,15 +81,29 @@ class MHAttention(nn.Module):
         self.dropout = nn.Dropout(droprate)
         self.fc1 = nn.Linear(d_model, d_model)
         
+    def split_heads(self, x):
+        # batch_size X seq_len X d_model into batch_size X heads X seq_len X d_model/heads
+        if self.legacy_heads:
+            return x.view(x.size(0), self.n_heads, -1, self.dh)
+        return x.view(x.size(0), -1, self.n_heads, self.dh).transpose(1, 2)
+    
+    def merge_heads(self, x):
+        if self.legacy_heads:
+            return x.reshape(x.size(0), -1, self.d_model)
+        return x.transpose(1, 2).reshape(x.size(0), -1, self.d_model)
+    
+    def project_kv(self, k, v):
+        """ keys and values split into heads, as used by attend """
+        return self.split_heads(self.k_matrix(k)), self.split_heads(self.v_matrix(v))
+    
+    def attend(self, q, k, v, mask=None):
+        """ attention of queries q over projected keys k and values v (see project_kv) """
+        scores = Attention(self.split_heads(self.q_matrix(q)), k, v, self.dh, mask, self.dropout)
+        return self.fc1(self.merge_heads(scores))
+        
     def forward(self, q, k, v, mask=None):
-        # input = batch_size X seq_len X d_model into batch_size X heads X seq_len X d_model/heads
-        q = self.q_matrix(q); q = q.view(q.size(0), self.n_heads, -1, self.dh)
-        k = self.k_matrix(k); k = k.view(k.size(0), self.n_heads, -1, self.dh)
-        v = self.v_matrix(v); v = v.view(v.size(0), self.n_heads, -1, self.dh)
-        scores = Attention(q, k, v, self.dh, mask, self.dropout)
-        scores = scores.reshape(q.size(0), -1, self.d_model)
-        output = self.fc1(scores)
-        return output   
+        k, v = self.project_kv(k, v)
+        return self.attend(q, k, v, mask)
 
 class FeedForward(nn.Module):
     def __init__(self, d_model, hidden_size=2048, droprate=0.1):
@@ -114,10 +131,10 @@ class LayerNorm(nn.Module):
         return norm
 
 class EncoderLayer(nn.Module):
-    def __init__(self, d_model, n_heads, ff_dim, droprate=0.1):
+    def __init__(self, d_model, n_heads, ff_dim, droprate=0.1, legacy_heads=False):
         super(EncoderLayer, self).__init__()
         self.norm1 = LayerNorm(d_model)
-        self.attn = MHAttention(d_model=d_model, n_heads=n_heads)
+        self.attn = MHAttention(d_model=d_model, n_heads=n_heads, legacy_heads=legacy_heads)
         self.dropout1 = nn.Dropout(droprate)
         self.norm2 = LayerNorm(d_model)
         self.fc1 = FeedForward(d_model=d_model, hidden_size=ff_dim)    
@@ -131,7 +148,7 @@ class EncoderLayer(nn.Module):
         return x
     
 class DecoderLayer(nn.Module):
-    def __init__(self, d_model, n_heads, ff_dim, droprate=0.1):
+    def __init__(self, d_model, n_heads, ff_dim, droprate=0.1, legacy_heads=False):
         super(DecoderLayer, self).__init__()
         self.norm1 = LayerNorm(d_model)
         self.norm2 = LayerNorm(d_model)
@@ -139,8 +156,8 @@ class DecoderLayer(nn.Module):
         self.dropout1 = nn.Dropout(droprate)
         self.dropout2 = nn.Dropout(droprate)
         self.dropout3 = nn.Dropout(droprate)
-        self.attn1 = MHAttention(d_model=d_model, n_heads=n_heads)
-        self.attn2 = MHAttention(d_model=d_model, n_heads=n_heads)
+        self.attn1 = MHAttention(d_model=d_model, n_heads=n_heads, legacy_heads=legacy_heads)
+        self.attn2 = MHAttention(d_model=d_model, n_heads=n_heads, legacy_heads=legacy_heads)
         self.fc1 = FeedForward(d_model=d_model, hidden_size=ff_dim)
         
     def forward(self, x, e_out, src_mask, trg_mask):
@@ -151,17 +168,38 @@ class DecoderLayer(nn.Module):
         x1 = self.norm3(x)
         x = x + self.dropout3(self.fc1(x1)); #print("d4", x.shape)
         return x
+    
+    def init_cache(self, e_out, max_len):
+        """ cache of decoding steps: projected encoder keys/values, and buffers for the self-attention keys/values of
+        up to max_len target positions """
+        e_k, e_v = self.attn2.project_kv(e_out, e_out)
+        shape = (e_out.size(0), self.attn1.n_heads, max_len, self.attn1.dh)
+        return {"e_k": e_k, "e_v": e_v, "k": e_out.new_zeros(shape), "v": e_out.new_zeros(shape)}
+    
+    def step(self, x, pos, cache, src_mask, trg_mask):
+        """ forward of the newest target position pos only, x: batch_size X 1 X d_model, trg_mask: batch_size X 1 X
+        (pos + 1) mask of the target positions so far """
+        x1 = self.norm1(x)
+        k, v = self.attn1.project_kv(x1, x1)
+        cache["k"][:, :, pos:(pos + 1)] = k; cache["v"][:, :, pos:(pos + 1)] = v
+        x = x + self.dropout1(self.attn1.attend(x1, cache["k"][:, :, :(pos + 1)], cache["v"][:, :, :(pos + 1)], \
+                                                trg_mask))
+        x1 = self.norm2(x)
+        x = x + self.dropout2(self.attn2.attend(x1, cache["e_k"], cache["e_v"], src_mask))
+        x1 = self.norm3(x)
+        x = x + self.dropout3(self.fc1(x1))
+        return x
 
 def clone_layers(module, num):
     return nn.ModuleList([copy.deepcopy(module) for _ in range(num)])    
     
 class EncoderBlock(nn.Module):
-    def __init__(self, vocab_size, d_model, ff_dim, num, n_heads, max_encoder_len):
+    def __init__(self, vocab_size, d_model, ff_dim, num, n_heads, max_encoder_len, legacy_heads=False):
         super(EncoderBlock, self).__init__()
         self.num = num
         self.embed = nn.Embedding(vocab_size, d_model)
         self.pe = Pos_Encoder(d_model, max_len=max_encoder_len)
-        self.layers = clone_layers(EncoderLayer(d_model, n_heads, ff_dim), num)
+        self.layers = clone_layers(EncoderLayer(d_model, n_heads, ff_dim, legacy_heads=legacy_heads), num)
         self.norm = LayerNorm(d_model)
     
     def forward(self, src, mask):
@@ -173,12 +211,12 @@ class EncoderBlock(nn.Module):
         return x
 
 class DecoderBlock(nn.Module):
-    def __init__(self, vocab_size, d_model, ff_dim, num, n_heads, max_decoder_len):
+    def __init__(self, vocab_size, d_model, ff_dim, num, n_heads, max_decoder_len, legacy_heads=False):
         super(DecoderBlock, self).__init__()
         self.num = num
         self.embed = nn.Embedding(vocab_size, d_model)
         self.pe = Pos_Encoder(d_model, max_len=max_decoder_len)
-        self.layers = clone_layers(DecoderLayer(d_model, n_heads, ff_dim), num)
+        self.layers = clone_layers(DecoderLayer(d_model, n_heads, ff_dim, legacy_heads=legacy_heads), num)
         self.norm = LayerNorm(d_model)
     
     def forward(self, trg, e_out, src_mask, trg_mask):
@@ -188,10 +226,21 @@ class DecoderBlock(nn.Module):
             x = self.layers[i](x, e_out, src_mask, trg_mask)
         x = self.norm(x)
         return x
+    
+    def init_cache(self, e_out, max_len):
+        return [layer.init_cache(e_out, max_len) for layer in self.layers]
+    
+    def step(self, trg, pos, caches, src_mask, trg_mask):
+        """ decoder output of the newest target tokens trg (batch_size X 1) at position pos, see DecoderLayer.step """
+        x = self.pe(self.embed(trg), offset=pos)
+        for i in range(self.num):
+            x = self.layers[i].step(x, pos, caches[i], src_mask, trg_mask)
+        x = self.norm(x)
+        return x
 
 class Transformer(nn.Module):
     def __init__(self, src_vocab, trg_vocab, d_model, ff_dim, num, n_heads,\
-                 max_encoder_len, max_decoder_len):
+                 max_encoder_len, max_decoder_len, legacy_heads=False):
         super(Transformer, self).__init__()
         self.src_vocab = src_vocab
         self.trg_vocab = trg_vocab
@@ -201,10 +250,13 @@ class Transformer(nn.Module):
         self.n_heads = n_heads
         self.max_encoder_len = max_encoder_len
         self.max_decoder_len = max_decoder_len
+        self.legacy_heads = legacy_heads
         self.encoder = EncoderBlock(vocab_size=src_vocab, d_model=d_model, ff_dim=ff_dim,\
-                                    num=num, n_heads=n_heads, max_encoder_len=max_encoder_len)
+                                    num=num, n_heads=n_heads, max_encoder_len=max_encoder_len,\
+                                    legacy_heads=legacy_heads)
         self.decoder = DecoderBlock(vocab_size=trg_vocab, d_model=d_model, ff_dim=ff_dim,\
-                                    num=num, n_heads=n_heads, max_decoder_len=max_decoder_len)
+                                    num=num, n_heads=n_heads, max_decoder_len=max_decoder_len,\
+                                    legacy_heads=legacy_heads)
         self.fc1 = nn.Linear(d_model, trg_vocab)
     
     def forward(self, src, trg, src_mask, trg_mask=None, infer=False, trg_vocab_obj=None):
@@ -215,26 +267,159 @@ class Transformer(nn.Module):
             x = self.fc1(d_out); #print("x", x.shape)
             return x
         else:
-            stepwise_translated_words = []; stepwise_translated_word_idxs = []
-            cuda = src.is_cuda
-            for i in range(2, self.max_decoder_len):
-                trg_mask = create_trg_mask(trg, cuda=cuda)
-                if cuda:
-                    trg = trg.cuda(); trg_mask = trg_mask.cuda()
-                outputs = self.fc1(self.decoder(trg, e_out, src_mask, trg_mask))
-                out_idxs = torch.softmax(outputs, dim=2).max(2)[1]
-                trg = torch.cat((trg, out_idxs[:,-1:]), dim=1)
-                if cuda:
-                    out_idxs = out_idxs.cpu().numpy()
-                else:
-                    out_idxs = out_idxs.numpy()
-                stepwise_translated_word_idxs.append(out_idxs.tolist()[0][-1])
-                if stepwise_translated_word_idxs[-1] == trg_vocab_obj.vocab.stoi["<eos>"]: # trg_vocab_obj = FR
+            eos_idx = trg_vocab_obj.vocab.stoi["<eos>"] # trg_vocab_obj = FR
+            if self.legacy_heads:
+                out_idxs, final_step_idxs = self.decode_full(e_out, trg, src_mask, eos_idx)
+                final_step_idxs = final_step_idxs[0][:-1].tolist()
+            else:
+                out_idxs = self.decode_cached(e_out, trg, src_mask, eos_idx)
+                # the decoder is causal, so predictions of the last step at earlier positions are the earlier outputs
+                final_step_idxs = out_idxs[0][:-1].tolist()
+            stepwise_translated_words = []
+            for idx in out_idxs[0].tolist():
+                if idx == eos_idx:
                     break
-                stepwise_translated_words.append(trg_vocab_obj.vocab.itos[stepwise_translated_word_idxs[-1]])
-            final_step_words = [trg_vocab_obj.vocab.itos[i] for i in out_idxs[0][:-1]]
+                stepwise_translated_words.append(trg_vocab_obj.vocab.itos[idx])
+            final_step_words = [trg_vocab_obj.vocab.itos[i] for i in final_step_idxs]
             return stepwise_translated_words, final_step_words
     
+    def decode_full(self, e_out, trg, src_mask, eos_idx=None, max_steps=None):
+        """ greedy decoding which runs the decoder over the whole target prefix at each step, until every sequence has
+        output eos_idx or after max_steps (default: max_decoder_len - 2) steps
+        Returns ---> (output token ids (batch_size X steps), predictions of the last step at each position) """
+        max_steps = (self.max_decoder_len - 2) if max_steps is None else max_steps
+        cuda = e_out.is_cuda
+        done = torch.zeros(trg.size(0), dtype=torch.bool, device=trg.device)
+        for i in range(max_steps):
+            trg_mask = create_trg_mask(trg, cuda=cuda)
+            if cuda:
+                trg = trg.cuda(); trg_mask = trg_mask.cuda()
+            outputs = self.fc1(self.decoder(trg, e_out, src_mask, trg_mask))
+            out_idxs = torch.softmax(outputs, dim=2).max(2)[1]
+            trg = torch.cat((trg, out_idxs[:,-1:]), dim=1)
+            if eos_idx is not None:
+                done = done | (out_idxs[:, -1] == eos_idx)
+                if done.all():
+                    break
+        return trg[:, 1:], out_idxs
+    
+    def decode_cached(self, e_out, trg, src_mask, eos_idx=None, max_steps=None):
+        """ greedy decoding as decode_full, computing only the newest position at each step from cached self-attention
+        keys/values of the previous positions and projected encoder keys/values of each decoder layer
+        Returns ---> output token ids (batch_size X steps) """
+        if self.legacy_heads:
+            raise ValueError("Keys/values of models with legacy_heads cannot be cached, use decode_full.")
+        max_steps = (self.max_decoder_len - 2) if max_steps is None else max_steps
+        prefix_len = trg.size(1)
+        max_len = prefix_len + max_steps - 1 # no. of target positions run through the decoder
+        caches = self.decoder.init_cache(e_out, max_len)
+        trg_mask = torch.zeros((trg.size(0), 1, max_len), dtype=torch.bool, device=e_out.device)
+        trg_mask[:, 0, :prefix_len] = (trg != 1)
+        trg = trg.to(e_out.device)
+        for pos in range(prefix_len - 1): # given target prefix
+            self.decoder.step(trg[:, pos:(pos + 1)], pos, caches, src_mask, trg_mask[:, :, :(pos + 1)])
+        out_idxs = []
+        done = torch.zeros(trg.size(0), dtype=torch.bool, device=e_out.device)
+        next_idxs = trg[:, -1:]
+        for pos in range(prefix_len - 1, max_len):
+            d_out = self.decoder.step(next_idxs, pos, caches, src_mask, trg_mask[:, :, :(pos + 1)])
+            next_idxs = self.fc1(d_out).argmax(2)
+            out_idxs.append(next_idxs)
+            if pos + 1 < max_len:
+                trg_mask[:, 0, pos + 1] = (next_idxs[:, 0] != 1)
+            if eos_idx is not None:
+                done = done | (next_idxs[:, 0] == eos_idx)
+                if done.all():
+                    break
+        return torch.cat(out_idxs, dim=1)
+    
+    def beam_search(self, e_out, trg, src_mask, eos_idx, beam_width=4, n_best=1, length_penalty=0.6, max_steps=None):
+        """ batched beam search of the outputs of a batch of source sentences (encoder outputs e_out) from target prefix
+        trg. The beam_width hypotheses of all sentences are extended together, with a vectorized top-k over (sentence X
+        beam X vocab) at each step. Hypotheses which output eos_idx are set aside with their log probability normalized
+        by the length penalty ((5 + length)/6)**length_penalty, and a sentence is dropped from the batch once it has
+        beam_width finished hypotheses. Hypotheses still open after max_steps (default: max_decoder_len - 2) are
+        finished at that length.
+        Returns ---> n-best list of each source sentence: [(output token ids without eos, score), ...], best first """
+        max_steps = (self.max_decoder_len - 2) if max_steps is None else max_steps
+        batch_size, K, device = trg.size(0), beam_width, e_out.device
+        cached = not self.legacy_heads
+        prefix_len = trg.size(1)
+        max_len = prefix_len + max_steps - 1
+        # hypotheses of sentence group g are rows g*K to g*K + K - 1
+        rows = torch.arange(batch_size, device=device).repeat_interleave(K)
+        e_out, src_mask, tokens = e_out[rows], src_mask[rows], trg.to(device)[rows]
+        scores = torch.full((batch_size, K), float("-inf"), device=device)
+        scores[:, 0] = 0 # a single hypothesis to start with
+        sentences = list(range(batch_size)) # source sentence of each group
+        finished = [[] for _ in range(batch_size)]
+        if cached:
+            caches = self.decoder.init_cache(e_out, max_len)
+            trg_mask = torch.zeros((tokens.size(0), 1, max_len), dtype=torch.bool, device=device)
+            trg_mask[:, 0, :prefix_len] = (tokens != 1)
+            for pos in range(prefix_len - 1):
+                self.decoder.step(tokens[:, pos:(pos + 1)], pos, caches, src_mask, trg_mask[:, :, :(pos + 1)])
+        
+        for step in range(max_steps):
+            pos = prefix_len - 1 + step
+            if cached:
+                d_out = self.decoder.step(tokens[:, -1:], pos, caches, src_mask, trg_mask[:, :, :(pos + 1)])
+            else:
+                d_out = self.decoder(tokens, e_out, src_mask, create_trg_mask(tokens, cuda=tokens.is_cuda))
+            log_probs = torch.log_softmax(self.fc1(d_out[:, -1]).float(), dim=-1)
+            n_groups, vocab_size = scores.size(0), log_probs.size(1)
+            candidates = (scores.view(-1, 1) + log_probs).view(n_groups, K*vocab_size)
+            # 2K candidates, so that K remain open even if K of them end with eos
+            top_scores, top_idxs = candidates.topk(2*K, dim=1)
+            top_beams, top_tokens = top_idxs // vocab_size, top_idxs % vocab_size
+            is_eos = (top_tokens == eos_idx)
+            
+            # eos among the K best candidates finishes the hypothesis
+            eos_idxs = (is_eos[:, :K] & (top_scores[:, :K] > float("-inf"))).nonzero().tolist()
+            if len(eos_idxs) > 0:
+                penalty = ((5.0 + step + 1)/6.0)**length_penalty
+                outputs = tokens[:, prefix_len:].tolist()
+                for g, j in eos_idxs:
+                    finished[sentences[g]].append((outputs[g*K + top_beams[g, j].item()], \
+                                                   top_scores[g, j].item()/penalty))
+            
+            # the K best candidates which do not end with eos stay open
+            scores, keep = top_scores.masked_fill(is_eos, float("-inf")).topk(K, dim=1)
+            beam_rows = ((torch.arange(n_groups, device=device)*K).unsqueeze(1) + top_beams.gather(1, keep)).view(-1)
+            next_tokens = top_tokens.gather(1, keep).view(-1, 1)
+            tokens = torch.cat((tokens[beam_rows], next_tokens), dim=1)
+            if cached:
+                for cache in caches:
+                    cache["k"][:, :, :(pos + 1)] = cache["k"][beam_rows, :, :(pos + 1)]
+                    cache["v"][:, :, :(pos + 1)] = cache["v"][beam_rows, :, :(pos + 1)]
+                trg_mask = trg_mask[beam_rows]
+                if pos + 1 < max_len:
+                    trg_mask[:, 0, pos + 1] = (next_tokens[:, 0] != 1)
+            
+            # sentences with beam_width finished hypotheses are dropped from the batch
+            done = [len(finished[s]) >= K for s in sentences]
+            if all(done):
+                sentences = []
+                break
+            if any(done):
+                groups = torch.tensor([g for g, d in enumerate(done) if not d], device=device)
+                group_rows = (groups.unsqueeze(1)*K + torch.arange(K, device=device)).view(-1)
+                sentences = [s for s, d in zip(sentences, done) if not d]
+                scores, tokens = scores[groups], tokens[group_rows]
+                e_out, src_mask = e_out[group_rows], src_mask[group_rows]
+                if cached:
+                    caches = [{key: value[group_rows] for key, value in cache.items()} for cache in caches]
+                    trg_mask = trg_mask[group_rows]
+        
+        # open hypotheses of sentences which reached max_steps
+        penalty = ((5.0 + max_steps)/6.0)**length_penalty
+        outputs, scores = tokens[:, prefix_len:].tolist(), scores.tolist()
+        for g, s in enumerate(sentences):
+            for j in range(K):
+                if scores[g][j] > float("-inf"):
+                    finished[s].append((outputs[g*K + j], scores[g][j]/penalty))
+        return [sorted(hyps, key=lambda h: -h[1])[:n_best] for hyps in finished]
+    
     @classmethod
     def load_model(cls, path, args, cuda=True, amp=None):
         checkpoint = torch.load(path)
@@ -246,6 +431,7 @@ class Transformer(nn.Module):
                     n_heads=checkpoint["n_heads"], \
                     max_encoder_len=checkpoint["max_encoder_len"], \
                     max_decoder_len=checkpoint["max_decoder_len"], \
+                    legacy_heads=checkpoint.get("legacy_heads", True), \
                     )
         
         if cuda:
@@ -278,6 +464,7 @@ class Transformer(nn.Module):
                     'n_heads': self.n_heads,\
                     'max_encoder_len': self.max_encoder_len,\
                     'max_decoder_len': self.max_decoder_len,\
+                    'legacy_heads': self.legacy_heads,\
                     'amp': amp.state_dict()
                 }
         torch.save(state, path)
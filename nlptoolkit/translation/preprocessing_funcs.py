@@ -8,11 +8,14 @@ import sys
 import csv
 import pandas as pd
 import os
-import re
+import pickle
+import itertools
+from collections import defaultdict, deque
+from multiprocessing import Pool
 import torchtext
 from torchtext.data import BucketIterator
-import spacy
 from spacy.lang.zh import Chinese
+from ..utils.text_normalizer import TextNormalizer, load_spacy_tokenizer
 from tqdm import tqdm
 import logging
 
@@ -34,29 +37,38 @@ logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
 logger = logging.getLogger(__file__)
 
 class tokener(object):
-    def __init__(self, lang):
+    def __init__(self, lang, light=True):
         d = {"en":"en_core_web_lg", "fr":"fr_core_news_sm"}
         self.lang = lang
+        self.normalizer = TextNormalizer("translation", lower=lang in ['en', 'fr'])
         if lang in ['fr', 'en']:
-            self.ob = spacy.load(d[lang])
+            # light: spaCy's rule-based tokenizer of lang only, else that of the model (same rules, slower to load)
+            self.ob = load_spacy_tokenizer(lang, None if light else d[lang])
         elif lang == 'zh':
             self.ob = ch_tokener() 
     
+    def normalize(self, sent):
+        return self.normalizer.normalize(sent)
+    
     def tokenize(self, sent):
-        sent = re.sub(r"[\*\"“”\n\\…\+\-\/\=\(\)‘•:\[\]\|’\!;]", " ", str(sent))
-        sent = re.sub(r"\!+", "!", sent)
-        sent = re.sub(r"\,+", ",", sent)
-        sent = re.sub(r"\?+", "?", sent)
-        sent = re.sub(r"[ ]+", " ", sent)
-        
+        sent = self.normalize(sent)
         if self.lang in ['en', 'fr']:
-            sent = sent.lower()
-            sent = [token.text for token in self.ob.tokenizer(sent) if token.text != " "]
+            sent = [token.text for token in self.ob(sent) if token.text != " "]
             sent = " ".join(sent)
         elif self.lang == 'zh':
             sent = self.ob.tokenize(sent)
         return sent
     
+    def tokenize_batch(self, sents, batch_size=1000):
+        """ tokenize of each of sents, with spaCy's batched tokenizer pipe """
+        sents = [self.normalize(sent) for sent in sents]
+        if self.lang in ['en', 'fr']:
+            return [" ".join(token.text for token in doc if token.text != " ") \
+                    for doc in self.ob.pipe(sents, batch_size=batch_size)]
+        elif self.lang == 'zh':
+            return self.ob.tokenize_batch(sents, batch_size=batch_size)
+        return sents
+    
 class ch_tokener(object):
     def __init__(self):
         self.nlp = Chinese()
@@ -65,40 +77,89 @@ class ch_tokener(object):
         doc = self.nlp(sent)
         sent = " ".join(str(token) for token in doc)
         return sent
+    
+    def tokenize_batch(self, sents, batch_size=1000):
+        return [" ".join(str(token) for token in doc) for doc in self.nlp.pipe(sents, batch_size=batch_size)]
 
 def dum_tokenizer(sent):
     return sent.split()
 
+def read_aligned_lines(src_path, trg_path):
+    """ yields the (src, trg) line pairs of the aligned corpora one at a time, skipping pairs with an empty line """
+    with open(src_path, "r", encoding="utf8") as src_f, open(trg_path, "r", encoding="utf8") as trg_f:
+        for e, c in itertools.zip_longest(src_f, trg_f):
+            if (e is None) or (c is None):
+                raise ValueError("%s and %s have different numbers of lines" % (src_path, trg_path))
+            e, c = e.rstrip("\n"), c.rstrip("\n")
+            if (len(e) != 0) and (len(c) != 0):
+                yield e, c
+
+def _pair_chunks(pairs, chunk_size):
+    """ splits an iterable of pairs into lists of chunk_size pairs """
+    pairs = iter(pairs)
+    chunk = list(itertools.islice(pairs, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(pairs, chunk_size))
+
+_worker_tokeners = None
+
+def _init_tokenize_worker(tokenizer_en, tokenizer_fr):
+    global _worker_tokeners
+    _worker_tokeners = (tokenizer_en, tokenizer_fr)
+
+def _tokenize_chunk(args):
+    """ tokenized rows (English, French, eng_len, fr_len) of a chunk of pairs, those longer than max_len dropped """
+    pairs, max_len = args
+    tokenizer_en, tokenizer_fr = _worker_tokeners
+    eng = tokenizer_en.tokenize_batch([e for e, _ in pairs])
+    fr = tokenizer_fr.tokenize_batch([c for _, c in pairs])
+    return [(e, c, len(e), len(c)) for e, c in zip(eng, fr) if (len(e) <= max_len) and (len(c) <= max_len)]
+
 def tokenize_data(args):
+    """ tokenizes the aligned src & trg corpora into ./data/df.csv (English, French, eng_len, fr_len), streaming:
+    the lines are read lazily in chunks of args.chunk_size pairs, which are tokenized in a pool of args.num_workers
+    processes (in this process if 1) and written in order as they are done, so memory does not grow with the corpus """
     logger.info("Loading raw data and tokenizing...")
-    with open(args.src_path, "r", encoding="utf8") as f:
-        eng_text = f.read()
-    with open(args.trg_path, "r", encoding="utf8") as f:
-        ch_text = f.read()
-    eng = re.split("[\n]+", eng_text)
-    ch = re.split("[\n]+", ch_text)
-    eng_list, ch_list = [], []
-    
-    assert len(eng) == len(ch)
-    for e, c in tqdm(zip(eng, ch), total=len(eng)):
-        if (len(e) != 0) and (len(c) != 0):
-            eng_list.append(e); ch_list.append(c)
-    df = pd.DataFrame(data={"English":eng_list, "French":ch_list})
-    '''
-    df = pd.read_csv(args.src_path, names=["English"])
-    df["French"] = pd.read_csv(args.trg_path, names=["French"])["French"]
-    '''
+    num_workers = getattr(args, "num_workers", 1)
+    chunk_size = getattr(args, "chunk_size", 10000)
+    max_len = max(args.max_encoder_len, args.max_decoder_len)
     tokenizer_fr = tokener(args.trg_lang)
     tokenizer_en = tokener(args.src_lang)
-    df["English"] = df.progress_apply(lambda x: tokenizer_en.tokenize(x["English"]), axis=1)
-    df["French"] = df.progress_apply(lambda x: tokenizer_fr.tokenize(x["French"]), axis=1)
-    df['eng_len'] = df.progress_apply(lambda x: len(x['English']), axis=1)
-    df['fr_len'] = df.progress_apply(lambda x: len(x['French']), axis=1)
-    max_len = max(args.max_encoder_len, args.max_decoder_len)
-    df = df[(df['fr_len'] <= max_len) & (df['eng_len'] <= max_len)] # limiting to max length
     
-    df.to_csv(os.path.join("./data/", "df.csv"), index=False)
-    logger.info("Done loading raw data and tokenizing!")
+    chunks = ((chunk, max_len) for chunk in _pair_chunks(read_aligned_lines(args.src_path, args.trg_path), \
+                                                          chunk_size))
+    out_path = os.path.join("./data/", "df.csv")
+    tmp_path = out_path + ".tmp" # complete df.csv only, as tokenization is skipped if it exists
+    n_pairs, n_kept = 0, 0
+    with open(tmp_path, "w", encoding="utf8", newline="") as f, tqdm(unit=" pairs") as pbar:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["English", "French", "eng_len", "fr_len"])
+        def write(chunk, rows):
+            nonlocal n_pairs, n_kept
+            writer.writerows(rows)
+            n_pairs += len(chunk[0]); n_kept += len(rows)
+            pbar.update(len(chunk[0]))
+        
+        if num_workers > 1:
+            with Pool(num_workers, initializer=_init_tokenize_worker, \
+                      initargs=(tokenizer_en, tokenizer_fr)) as pool:
+                pending = deque() # chunks being tokenized, at most 2 per worker are read ahead
+                for chunk in chunks:
+                    pending.append((chunk, pool.apply_async(_tokenize_chunk, (chunk,))))
+                    if len(pending) >= 2*num_workers:
+                        chunk, result = pending.popleft()
+                        write(chunk, result.get())
+                while pending:
+                    chunk, result = pending.popleft()
+                    write(chunk, result.get())
+        else:
+            _init_tokenize_worker(tokenizer_en, tokenizer_fr)
+            for chunk in chunks:
+                write(chunk, _tokenize_chunk(chunk))
+    os.replace(tmp_path, out_path)
+    logger.info("Done loading raw data and tokenizing! %d of %d sentence pairs kept (max length %d)." % \
+                (n_kept, n_pairs, max_len))
     
 def load_dataloaders(args):
     logger.info("Preparing dataloaders...")
@@ -117,4 +178,42 @@ def load_dataloaders(args):
                                 shuffle=True, train=True)
     train_length = len(train)
     logger.info("Loaded dataloaders.")
-    return train_iter, FR, EN, train_length
\ No newline at end of file
+    return train_iter, FR, EN, train_length
+
+def _default_unk_index():
+    return 0 # <unk>, as in torchtext
+
+class Vocab(object):
+    """ compact vocab of a trained model: itos list and stoi dict (unknown tokens ---> <unk> index 0) """
+    def __init__(self, itos):
+        self.itos = list(itos)
+        self.stoi = defaultdict(_default_unk_index, {tok: i for i, tok in enumerate(self.itos)})
+    
+    def __len__(self):
+        return len(self.itos)
+
+class VocabField(object):
+    """ stands in for a torchtext Field built on the training data at inference: .vocab.itos, .vocab.stoi """
+    def __init__(self, itos):
+        self.vocab = Vocab(itos)
+
+def save_vocabs(args, FR, EN):
+    """ saves the src (EN) & trg (FR) vocabs of model_no alongside its checkpoint, see load_vocabs """
+    path = os.path.join("./data/", "vocab_%d.pkl" % args.model_no)
+    with open(path, 'wb') as output:
+        pickle.dump({"src_itos": list(EN.vocab.itos), "trg_itos": list(FR.vocab.itos)}, output)
+    logger.info("Saved vocabs to %s" % path)
+
+def load_vocabs(args):
+    """ Loads the saved src & trg vocabs of model_no (without reading the training data) ---> FR, EN VocabFields.
+    If not saved yet, the vocabs are built from the training data by load_dataloaders and saved """
+    path = os.path.join("./data/", "vocab_%d.pkl" % args.model_no)
+    if os.path.isfile(path):
+        with open(path, 'rb') as pkl_file:
+            vocabs = pickle.load(pkl_file)
+        logger.info("Loaded saved vocabs.")
+        return VocabField(vocabs["trg_itos"]), VocabField(vocabs["src_itos"])
+    logger.info("Saved vocabs not found, building vocabs from the training data...")
+    _, FR, EN, _ = load_dataloaders(args)
+    save_vocabs(args, FR, EN)
+    return VocabField(FR.vocab.itos), VocabField(EN.vocab.itos)
@@ -57,6 +57,26 @@ def load_model_and_optimizer(args, src_vocab, trg_vocab, cuda, amp=None, pytrans
    
     return net, criterion, optimizer, scheduler, start_epoch, acc
 
+def load_trained_model(args, src_vocab, trg_vocab, cuda):
+    """ Loads the trained model (checkpoint weights only, no optimizer) for inference """
+    from .models.Transformer.Transformer import Transformer
+    checkpoint_path = os.path.join("./data/", "test_checkpoint_%d.pth.tar" % args.model_no)
+    if not os.path.isfile(checkpoint_path):
+        logger.info("No trained model found, initializing model...")
+        net, _, _, _, _, _ = load_model_and_optimizer(args, src_vocab, trg_vocab, cuda)
+        return net
+    checkpoint = torch.load(checkpoint_path, map_location="cpu")
+    net = Transformer(src_vocab=checkpoint["src_vocab"], trg_vocab=checkpoint["trg_vocab"], \
+                      d_model=checkpoint["d_model"], ff_dim=checkpoint["ff_dim"], num=checkpoint["num"], \
+                      n_heads=checkpoint["n_heads"], max_encoder_len=checkpoint["max_encoder_len"], \
+                      max_decoder_len=checkpoint["max_decoder_len"], \
+                      legacy_heads=checkpoint.get("legacy_heads", True))
+    net.load_state_dict({k: v.float() for k, v in checkpoint['state_dict'].items()})
+    if cuda:
+        net.cuda()
+    logger.info("Loaded trained model.")
+    return net
+
 def load_state(net, cuda, args, load_best=False, amp=None):
     """ Loads saved model and optimizer states if exists """
     loaded_opt = False
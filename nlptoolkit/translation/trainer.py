@@ -8,7 +8,7 @@ import os
 import torch
 from torch.nn.utils import clip_grad_norm_
 from .train_funcs import load_model_and_optimizer, load_results, evaluate_results, decode_outputs
-from .preprocessing_funcs import load_dataloaders
+from .preprocessing_funcs import load_dataloaders, save_vocabs
 from .utils import save_as_pickle
 import matplotlib.pyplot as plt
 import logging
@@ -30,6 +30,7 @@ def train_and_fit(args, pytransformer=False):
         amp = None
     
     train_iter, FR, EN, train_length = load_dataloaders(args)
+    save_vocabs(args, FR, EN) # for inference without the training data
     src_vocab = len(EN.vocab)
     trg_vocab = len(FR.vocab)
     
@@ -1 +1,3 @@
 from . import misc
+from . import token_store
+from . import token_cache
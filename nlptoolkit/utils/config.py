@@ -12,13 +12,23 @@ class Config(object):
             self.train_data = "./data/train.csv"
             self.infer_data = "./data/infer.csv"
             self.max_vocab_len = 7000
+            self.pmi_threshold = 0.0
+            self.pmi_top_k = 0
+            self.min_cooccurrence = 1
+            self.num_workers = 1
             self.hidden_size_1 = 330
             self.hidden_size_2 =130
+            self.gat_sparse = 1
+            self.graph_batch = 0
+            self.fanout = 10
+            self.append_data = ""
             self.tokens_length = 200
+            self.token_cache = 1
             self.num_classes = 5
             self.train_test_split = 0
             self.test_ratio = 0.1
             self.batch_size = 32
+            self.pack_sequences = 0
             self.gradient_acc_steps = 1
             self.max_norm = 1.0
             self.num_epochs = 40
@@ -26,6 +36,17 @@ class Config(object):
             self.model_no = 2
             self.train = 1
             self.infer = 0
+            self.infer_batch_size = 32
+            self.quantize = 0
+            self.result_cache = 0
+            self.near_duplicate = 0
+            self.similarity_threshold = 0.98
+            self.early_exit = 0
+            self.exit_threshold = 0.9
+            self.distill = 0
+            self.distill_temperature = 2.0
+            self.export_traced = 0
+            self.traced = 0
             
         elif task == 'translation':
             self.src_path = "./data/translation//eng_zh/news-commentary-v13.zh-en.en"
@@ -39,6 +60,8 @@ class Config(object):
             self.n_heads = 8
             self.max_encoder_len = 200
             self.max_decoder_len = 200
+            self.num_workers = 1
+            self.chunk_size = 10000
             self.fp16 = 1
             self.num_epochs = 500
             self.lr = 0.0001
@@ -46,6 +69,10 @@ class Config(object):
             self.max_norm = 1.0
             self.T_max = 5000
             self.model_no = 0
+            self.infer_batch_size = 32
+            self.beam_width = 1
+            self.n_best = 1
+            self.length_penalty = 0.6
             self.train = 1
             self.evaluate = 0
             self.infer = 0
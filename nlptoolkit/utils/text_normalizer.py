@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Text normalization and tokenization shared by the tokeners of the translation, ASR, punctuation restoration and
+summarization tasks: each task has a rule set of characters replaced by spaces and of repeated characters collapsed
+to one, applied with patterns compiled once, and the spaCy rule-based tokenizer of a language can be loaded without
+loading a pipeline model (eg. en_core_web_lg, with its vectors).
+"""
+import re
+import spacy
+
+# replace: characters replaced by a space, collapse: characters whose repeats are collapsed to one (as are spaces)
+_DEFAULT_RULES = {"replace": "*\"“”\n\\…+-/=()‘•:[]|’!;", "collapse": ",?"}
+RULES = {
+    "translation": _DEFAULT_RULES,
+    "ASR": _DEFAULT_RULES,
+    "summarization": _DEFAULT_RULES,
+    "punctuation_restoration": {"replace": "*\"\n\\…+-/=()‘•€[]|♫:;", "collapse": ""},
+}
+
+
+class TextNormalizer(object):
+    """ normalize(sent) of the rule set of task: the replace characters ---> spaces, repeats of spaces and of the
+    collapse characters ---> one, then lower case if lower """
+    def __init__(self, task="translation", lower=True):
+        rules = RULES[task]
+        self.task = task
+        self.lower = lower
+        self.replace = re.compile("[%s]" % re.escape(rules["replace"]))
+        self.spaces = re.compile(" {2,}")
+        # repeats of collapse characters are rare, so their patterns only run if found
+        self.collapse = [(char*2, re.compile("%s{2,}" % re.escape(char)), char) for char in rules["collapse"]]
+
+    def normalize(self, sent):
+        sent = self.spaces.sub(" ", self.replace.sub(" ", str(sent)))
+        for repeat, pattern, char in self.collapse:
+            if repeat in sent:
+                sent = pattern.sub(char, sent)
+        return sent.lower() if self.lower else sent
+
+    __call__ = normalize
+
+
+def load_spacy_tokenizer(lang="en", model=None):
+    """ spaCy rule-based tokenizer of lang: that of the blank lang pipeline (no model is loaded) if model is None, else
+    that of the model (eg. "en_core_web_lg") """
+    if model is None:
+        return spacy.blank(lang).tokenizer
+    return spacy.load(model).tokenizer
+
+
+class TextTokenizer(object):
+    """ tokenize(sent) ---> tokens of sent normalized by the TextNormalizer of task, by the spaCy tokenizer of lang
+    (see load_spacy_tokenizer) """
+    def __init__(self, task="translation", lang="en", model=None, lower=True):
+        self.normalizer = TextNormalizer(task, lower=lower)
+        self.tokenizer = load_spacy_tokenizer(lang, model)
+
+    def normalize(self, sent):
+        return self.normalizer.normalize(sent)
+
+    def tokenize(self, sent):
+        return [token.text for token in self.tokenizer(self.normalizer.normalize(sent)) if token.text != " "]
+
+    def tokenize_batch(self, sents, batch_size=1000):
+        """ tokenize of each of sents, with the batched tokenizer pipe """
+        docs = self.tokenizer.pipe([self.normalizer.normalize(sent) for sent in sents], batch_size=batch_size)
+        return [[token.text for token in doc if token.text != " "] for doc in docs]
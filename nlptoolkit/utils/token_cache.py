@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent tokenization cache: token ids of already tokenized texts, keyed by (tokenizer identity, max length, text
+hash), kept on disk as a token store with the 64-bit hash of each text, so that reruns of preprocessing only tokenize
+new or changed texts.
+"""
+import os
+import re
+import hashlib
+import numpy as np
+from .token_store import TokenStore, TokenStoreWriter, token_store_exists, check_token_store
+import logging
+
+logging.basicConfig(format='%(asctime)s [%(levelname)s]: %(message)s', \
+                    datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+logger = logging.getLogger(__file__)
+
+KEY_DTYPE = np.uint64
+
+
+def text_key(text):
+    """ 64-bit blake2b hash of text """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class TokenizationCache(object):
+    """ Cache of token ids of texts tokenized by tokenizer tokenizer_id (eg. "bert-base-uncased-v30522", which should
+    change with the vocab or tokenization settings) truncated to max_len, stored as token store <tokenizer_id>_<max_len>
+    in data_dir with the text hashes in <tokenizer_id>_<max_len>_keys.bin, in the same order.
+    New entries are appended to the cache every chunk_size texts; hits/misses are logged on close.
+    Usage: with TokenizationCache(tokenizer_id, max_len) as cache: token_ids = cache.encode(text, encode_fn), or
+    token_ids_list = cache.encode_batch(texts, encode_batch_fn) """
+    def __init__(self, tokenizer_id, max_len, data_dir="./data/token_cache/", chunk_size=10000):
+        self.name = re.sub(r"[^\w.-]+", "_", "%s_%d" % (tokenizer_id, max_len))
+        self.data_dir = data_dir
+        self.chunk_size = chunk_size
+        self.keys_file = os.path.join(data_dir, "%s_keys.bin" % self.name)
+        self.hits, self.misses = 0, 0
+        self.writer, self.keys_handle = None, None
+        self.new_keys, self.pending = set(), []
+        self.load()
+
+    def load(self):
+        self.store, keys = None, np.zeros(0, dtype=KEY_DTYPE)
+        if token_store_exists(self.name, self.data_dir) and os.path.isfile(self.keys_file):
+            # keys, offsets and tokens must agree, else an interrupted write would misalign hashes and entries
+            store = None
+            if check_token_store(self.name, self.data_dir) and \
+               (os.path.getsize(self.keys_file) % np.dtype(KEY_DTYPE).itemsize == 0):
+                store = TokenStore(self.name, self.data_dir)
+                keys = np.fromfile(self.keys_file, dtype=KEY_DTYPE)
+            if (store is not None) and (len(keys) == len(store)):
+                self.store = store
+            else: # interrupted write
+                logger.warning("Tokenization cache %s is inconsistent with its keys, rebuilding it." % self.name)
+                keys = np.zeros(0, dtype=KEY_DTYPE)
+        self.order = np.argsort(keys, kind="mergesort")
+        self.keys = keys[self.order]
+        logger.info("Loaded tokenization cache %s (%d entries)." % (self.name, len(self.keys)))
+
+    def __len__(self):
+        return len(self.keys) + len(self.new_keys)
+
+    def lookup(self, key):
+        """ cache position of key, or None """
+        i = np.searchsorted(self.keys, key)
+        if (i < len(self.keys)) and (self.keys[i] == key):
+            return self.order[i]
+        return None
+
+    def encode(self, text, encode_fn):
+        """ token ids of text from the cache, else encode_fn(text) (added to the cache) """
+        key = text_key(text)
+        idx = self.lookup(key)
+        if idx is not None:
+            self.hits += 1
+            return self.store[idx][0]
+        self.misses += 1
+        token_ids = encode_fn(text)
+        if key not in self.new_keys:
+            self.add(key, token_ids)
+        return token_ids
+
+    def encode_batch(self, texts, encode_batch_fn):
+        """ token ids of list of texts from the cache, else encode_batch_fn(list of texts not in the cache) """
+        keys = [text_key(text) for text in texts]
+        token_ids, missed = [None]*len(texts), []
+        for i, key in enumerate(keys):
+            idx = self.lookup(key)
+            if idx is None:
+                missed.append(i)
+            else:
+                token_ids[i] = self.store[idx][0]
+        self.hits += len(texts) - len(missed)
+        self.misses += len(missed)
+        if len(missed) > 0:
+            for i, ids in zip(missed, encode_batch_fn([texts[i] for i in missed])):
+                token_ids[i] = ids
+                if keys[i] not in self.new_keys:
+                    self.add(keys[i], ids)
+        return token_ids
+
+    def add(self, key, token_ids):
+        if self.writer is None:
+            append = self.store is not None
+            self.writer = TokenStoreWriter(self.name, data_dir=self.data_dir, chunk_size=self.chunk_size, \
+                                           append=append)
+            self.keys_handle = open(self.keys_file, "ab" if append else "wb")
+        self.writer.add(token_ids)
+        self.new_keys.add(key)
+        self.pending.append(key)
+        if len(self.pending) >= self.chunk_size: # flushed together with the writer
+            self.flush_keys()
+
+    def flush_keys(self):
+        np.asarray(self.pending, dtype=KEY_DTYPE).tofile(self.keys_handle)
+        self.keys_handle.flush()
+        self.pending = []
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.flush_keys()
+            self.keys_handle.close()
+            self.writer, self.keys_handle = None, None
+        total = self.hits + self.misses
+        logger.info("Tokenization cache %s: %d hits, %d misses (%.1f%% hit rate), %d entries." % \
+                    (self.name, self.hits, self.misses, 100.0*self.hits/max(total, 1), len(self)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
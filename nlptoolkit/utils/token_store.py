@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Compact on-disk store of token id sequences: a flat int32 token array, an int64 offsets array and a labels array
+(one label per sequence, or one per token for token-level tasks), written as raw binary files in ./data/ and
+memory-mapped when read, so that datasets do not need to be loaded into memory.
+"""
+import os
+import numpy as np
+from torch.utils.data import Dataset
+
+TOKEN_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+LABEL_DTYPE = np.int64
+
+
+def store_files(name, data_dir="./data/"):
+    """ paths of the (tokens, offsets, sequence labels, token labels) files of token store name """
+    return tuple(os.path.join(data_dir, "%s_%s.bin" % (name, f)) for f in ["tokens", "offsets", "labels", \
+                                                                           "token_labels"])
+
+
+def token_store_exists(name, data_dir="./data/"):
+    """ True if token store name was completely written (TokenStoreWriter only moves its files into place on close) """
+    tokens_file, offsets_file, _, _ = store_files(name, data_dir)
+    return os.path.isfile(tokens_file) and os.path.isfile(offsets_file)
+
+
+def n_items(filename, dtype):
+    return os.path.getsize(filename)//np.dtype(dtype).itemsize if os.path.isfile(filename) else 0
+
+
+def check_token_store(name, data_dir="./data/"):
+    """ True if token store name exists and its files agree: offsets starting at 0 and non-decreasing, the last
+    being the no. of tokens (and of token labels, if any), and one label per sequence if it has sequence labels """
+    tokens_file, offsets_file, labels_file, token_labels_file = store_files(name, data_dir)
+    if (not token_store_exists(name, data_dir)) or (os.path.getsize(offsets_file) % np.dtype(OFFSET_DTYPE).itemsize):
+        return False
+    offsets = np.fromfile(offsets_file, dtype=OFFSET_DTYPE)
+    if (len(offsets) == 0) or (offsets[0] != 0) or np.any(np.diff(offsets) < 0):
+        return False
+    if (os.path.getsize(tokens_file) % np.dtype(TOKEN_DTYPE).itemsize) or \
+       (offsets[-1] != n_items(tokens_file, TOKEN_DTYPE)):
+        return False
+    if os.path.isfile(token_labels_file) and (n_items(token_labels_file, TOKEN_DTYPE) != offsets[-1]):
+        return False
+    if os.path.isfile(labels_file) and (n_items(labels_file, LABEL_DTYPE) != len(offsets) - 1):
+        return False
+    return True
+
+
+def truncate_token_store(files):
+    """ drops the data of an interrupted flush past the last complete offset of the store files (offsets are written
+    last), returns ---> (no. of sequences, no. of tokens) """
+    tokens_file, offsets_file, labels_file, token_labels_file = files
+    n_offsets = n_items(offsets_file, OFFSET_DTYPE)
+    if n_offsets == 0:
+        raise ValueError("Token store %s has no offsets" % offsets_file)
+    os.truncate(offsets_file, n_offsets*np.dtype(OFFSET_DTYPE).itemsize)
+    n_tokens = int(np.fromfile(offsets_file, dtype=OFFSET_DTYPE, count=1, \
+                               offset=(n_offsets - 1)*np.dtype(OFFSET_DTYPE).itemsize)[0])
+    if n_items(tokens_file, TOKEN_DTYPE) < n_tokens:
+        raise ValueError("Token store %s has fewer tokens than its offsets" % tokens_file)
+    for filename, n, dtype in [(tokens_file, n_tokens, TOKEN_DTYPE), (token_labels_file, n_tokens, TOKEN_DTYPE), \
+                               (labels_file, n_offsets - 1, LABEL_DTYPE)]:
+        if n_items(filename, dtype) > n:
+            os.truncate(filename, n*np.dtype(dtype).itemsize)
+    return n_offsets - 1, n_tokens
+
+
+class TokenStoreWriter(object):
+    """ Streams sequences of token ids, with an optional label (int, or sequence of per-token ints), into token store
+    name. Sequences are buffered and appended to the store files every chunk_size sequences.
+    append: if True, sequences are added to the end of an existing store (after dropping any data of an interrupted
+    flush), else the store is written anew to .tmp files, which are only moved into place by close, so that an
+    interrupted write never leaves a partial store.
+    Usage: with TokenStoreWriter("train") as writer: writer.add(token_ids, label) """
+    def __init__(self, name, data_dir="./data/", chunk_size=10000, append=False):
+        self.files = store_files(name, data_dir)
+        self.chunk_size = chunk_size
+        self.append = append and token_store_exists(name, data_dir)
+        os.makedirs(data_dir, exist_ok=True)
+        if self.append:
+            self.paths = self.files
+            _, self.n_tokens = truncate_token_store(self.files)
+        else:
+            self.paths = tuple(f + ".tmp" for f in self.files)
+            for f in self.paths:
+                if os.path.isfile(f):
+                    os.remove(f)
+            self.n_tokens = 0
+        self.mode = "ab" if self.append else "wb"
+        self.tokens, self.lengths, self.labels = [], [], []
+        self.handles = [open(f, self.mode) for f in self.paths[:2]]
+        if not self.append:
+            np.zeros(1, dtype=OFFSET_DTYPE).tofile(self.handles[1])
+        self.label_handle, self.token_labels = None, None
+
+    def add(self, token_ids, label=None):
+        self.tokens.append(np.asarray(token_ids, dtype=TOKEN_DTYPE))
+        self.lengths.append(len(token_ids))
+        if label is not None:
+            if self.label_handle is None:
+                self.token_labels = not np.isscalar(label)
+                self.label_handle = open(self.paths[3 if self.token_labels else 2], self.mode)
+            self.labels.append(np.asarray(label, dtype=TOKEN_DTYPE) if self.token_labels else label)
+        if len(self.lengths) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.lengths) == 0:
+            return
+        np.concatenate(self.tokens).astype(TOKEN_DTYPE).tofile(self.handles[0])
+        self.handles[0].flush()
+        if self.label_handle is not None:
+            if self.token_labels:
+                np.concatenate(self.labels).astype(TOKEN_DTYPE).tofile(self.label_handle)
+            else:
+                np.asarray(self.labels, dtype=LABEL_DTYPE).tofile(self.label_handle)
+            self.label_handle.flush()
+        # offsets last: the sequences of a flush only count once their offsets are written
+        (self.n_tokens + np.cumsum(self.lengths, dtype=OFFSET_DTYPE)).tofile(self.handles[1])
+        self.handles[1].flush()
+        self.n_tokens += int(np.sum(self.lengths))
+        self.tokens, self.lengths, self.labels = [], [], []
+
+    def close_handles(self):
+        for handle in self.handles + ([self.label_handle] if self.label_handle is not None else []):
+            handle.close()
+
+    def close(self):
+        self.flush()
+        self.close_handles()
+        if self.append:
+            return
+        # the previous store is removed (offsets first, so it stops existing), then the new offsets are moved last
+        tokens_file, offsets_file, labels_file, token_labels_file = self.files
+        for f in [offsets_file, tokens_file, labels_file, token_labels_file]:
+            if os.path.isfile(f):
+                os.remove(f)
+        for tmp, f in zip(self.paths[2:] + self.paths[:2], self.files[2:] + self.files[:2]):
+            if os.path.isfile(tmp):
+                os.replace(tmp, f)
+
+    def abort(self):
+        """ closes the writer without completing it: a new store is discarded, an appended one keeps its flushed
+        sequences """
+        self.close_handles()
+        if not self.append:
+            for f in self.paths:
+                if os.path.isfile(f):
+                    os.remove(f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def save_token_store(name, sequences, labels=None, data_dir="./data/"):
+    """ writes sequences of token ids (& labels, see TokenStoreWriter) as token store name """
+    with TokenStoreWriter(name, data_dir=data_dir) as writer:
+        for i, token_ids in enumerate(sequences):
+            writer.add(token_ids, None if labels is None else labels[i])
+
+
+def open_memmap(filename, dtype):
+    if (not os.path.isfile(filename)) or (os.path.getsize(filename) == 0):
+        return None
+    return np.memmap(filename, dtype=dtype, mode="r")
+
+
+class TokenStore(Dataset):
+    """ Memory-mapped token store, as written by TokenStoreWriter.
+    Item idx ---> (int64 array of its token ids, its label: int, int64 array of per-token labels, or None if the store
+    has no labels). Sequences are truncated to their first max_len tokens, if given.
+    Files are mapped on first access (and not pickled), so the store can be passed to DataLoader worker processes. """
+    def __init__(self, name, data_dir="./data/", max_len=None):
+        self.files = store_files(name, data_dir)
+        if not token_store_exists(name, data_dir):
+            raise FileNotFoundError("No token store %s in %s" % (name, data_dir))
+        self.max_len = max_len
+        self.maps = None
+        self.offsets = np.fromfile(self.files[1], dtype=OFFSET_DTYPE) # small, kept in memory
+        self.lengths = np.diff(self.offsets)
+        if max_len is not None:
+            self.lengths = np.minimum(self.lengths, max_len)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["maps"] = None
+        return state
+
+    def mapped(self):
+        """ (tokens, sequence labels, token labels) memmaps """
+        if self.maps is None:
+            self.maps = (open_memmap(self.files[0], TOKEN_DTYPE), open_memmap(self.files[2], LABEL_DTYPE), \
+                         open_memmap(self.files[3], TOKEN_DTYPE))
+        return self.maps
+
+    @property
+    def has_labels(self):
+        return any(m is not None for m in self.mapped()[1:])
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, idx):
+        tokens, labels, token_labels = self.mapped()
+        start = self.offsets[idx]
+        end = start + self.lengths[idx]
+        if token_labels is not None:
+            label = np.asarray(token_labels[start:end], dtype=np.int64)
+        elif labels is not None:
+            label = int(labels[idx])
+        else:
+            label = None
+        return np.asarray(tokens[start:end], dtype=np.int64), label
@@ -27,6 +27,8 @@ if __name__=="__main__":
     parser.add_argument("--n_heads", type=int, default=8, help="Number of attention heads")
     parser.add_argument("--max_encoder_len", type=int, default=200, help="Max src length")
     parser.add_argument("--max_decoder_len", type=int, default=200, help="Max trg length")
+    parser.add_argument("--num_workers", type=int, default=1, help="No. of processes for tokenizing the corpora")
+    parser.add_argument("--chunk_size", type=int, default=10000, help="No. of sentence pairs tokenized together by a process")
     parser.add_argument("--fp16", type=int, default=0, help="1: use mixed precision ; 0: use floating point 32")
     parser.add_argument("--num_epochs", type=int, default=280, help="No of epochs")
     parser.add_argument("--lr", type=float, default=0.00007, help="learning rate")
@@ -34,6 +36,10 @@ if __name__=="__main__":
     parser.add_argument("--max_norm", type=float, default=1.0, help="Clipped gradient norm")
     parser.add_argument("--T_max", type=int, default=7000, help="number of iterations before LR restart")
     parser.add_argument("--model_no", type=int, default=0, help="Model ID (0: Transformer)")
+    parser.add_argument("--infer_batch_size", type=int, default=32, help="No. of sentences translated together in evaluation/inference")
+    parser.add_argument("--beam_width", type=int, default=1, help="Beam search width (1: greedy decoding)")
+    parser.add_argument("--n_best", type=int, default=1, help="No. of best translations of each sentence returned by beam search")
+    parser.add_argument("--length_penalty", type=float, default=0.6, help="Beam search length penalty exponent, scores are divided by ((5 + length)/6)**length_penalty")
     
     parser.add_argument("--train", type=int, default=1, help="Train model on dataset")
     parser.add_argument("--evaluate", type=int, default=1, help="Evaluate the trained model on dataset")